@@ -1,26 +1,121 @@
-from smolagents import CodeAgent, LiteLLMModel, DuckDuckGoSearchTool, VisitWebpageTool
-from typing import Optional, List, Dict, Any
+from opentelemetry.propagate import inject
+from typing import TYPE_CHECKING, Optional, List, Dict, Any
 import logging
-import os
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from tenant_tool import TenantInfoTool
+import os
+import time
+from execution_control import CANCELLED, TIMED_OUT, CancelSignals, ExecutionBudget, ExecutionCancelled, current_budget, effective_limits
+from memory_compaction import MemoryCompactor
+from metrics import AGENT_RUN_SECONDS, EXECUTIONS, IN_FLIGHT, LLM_TOKENS, MODEL_SETUP_SECONDS, STEP_SECONDS
+from worker_pool import AgentWorkerPool
+from model_registry import ModelRegistry, resolve_model
+from process_pool import AgentProcessPool
+from recording import recorder
+from step_events import StepEventBroker, step_record
+from tool_registry import tool_registry
+from trace_store import TraceStore
+from tracing import StepSpans, current_step_spans, span
+
+if TYPE_CHECKING:
+    from smolagents import ActionStep
 
 logger = logging.getLogger(__name__)
 
 class AgentExecutor:
     """Wrapper for executing smolagents with multi-tenant isolation"""
     
-    def __init__(self, tenant_id: str):
+    def __init__(
+        self,
+        tenant_id: str,
+        pool: AgentWorkerPool,
+        models: ModelRegistry,
+        events: Optional[StepEventBroker] = None,
+        traces: Optional[TraceStore] = None,
+        signals: Optional[CancelSignals] = None,
+        processes: Optional[AgentProcessPool] = None
+    ):
         self.tenant_id = tenant_id
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.pool = pool
+        self.models = models
+        self.events = events
+        self.traces = traces
+        self.signals = signals
+        # Set in AGENT_EXECUTION_MODE=process: runs go to worker processes
+        self.processes = processes
+    
+    def submit(
+        self,
+        task: str,
+        tools: Optional[List[str]] = None,
+        model: Optional[str] = None,
+        max_steps: int = 10,
+        execution_id: Optional[str] = None,
+        max_execution_time: Optional[int] = None,
+        max_tokens: Optional[int] = None
+    ) -> "asyncio.Future[Dict[str, Any]]":
+        """
+        Queue an agent task on the shared worker pool
+        
+        Admission happens immediately, so callers can reject the request
+        before doing any other work. The run's wall-clock budget starts now;
+        limits default to MAX_EXECUTION_TIME and MAX_EXECUTION_TOKENS.
+        
+        Raises:
+            PoolSaturatedError: If the pool queue is full
+        """
+        max_seconds, max_tokens = effective_limits(max_execution_time, max_tokens)
+        budget = ExecutionBudget(
+            execution_id,
+            max_seconds=max_seconds,
+            max_tokens=max_tokens,
+            signals=self.signals
+        )
+        logger.info(f"[Tenant: {self.tenant_id}] Queueing task: {task[:100]}")
+        recorder.record_run({
+            "task": task,
+            "tools": tools,
+            "model": model or os.getenv("DEFAULT_MODEL"),
+            "max_steps": max_steps,
+        })
+        future = self.pool.submit(
+            self.tenant_id, self._execute_sync, task, tools, model, max_steps, execution_id, budget
+        )
+        if self.signals and execution_id:
+            self.signals.register(budget)
+            future.add_done_callback(lambda _: self.signals.unregister(budget))
+        return asyncio.ensure_future(self._await_run(asyncio.wrap_future(future), budget))
+    
+    async def _await_run(self, pending: "asyncio.Future[Dict[str, Any]]", budget: ExecutionBudget) -> Dict[str, Any]:
+        """
+        Wait for a run, giving up shortly after its wall-clock budget
+        
+        The agent stops itself at its next budget check; this deadline only
+        frees the caller when a single LLM or tool call hangs past it.
+        """
+        deadline = None
+        if budget.max_seconds:
+            deadline = budget.max_seconds + float(os.getenv("EXECUTION_TIMEOUT_GRACE_SECONDS", "30"))
+        try:
+            return await asyncio.wait_for(asyncio.shield(pending), timeout=deadline)
+        except asyncio.TimeoutError:
+            budget.stop(TIMED_OUT, f"Execution exceeded MAX_EXECUTION_TIME of {budget.max_seconds}s")
+            pending.cancel()
+            raise ExecutionCancelled(budget.status, budget.reason)
+        except asyncio.CancelledError:
+            # Drop the run if it is still queued, or stop it at its next check
+            pending.cancel()
+            budget.stop(CANCELLED, "Execution request was cancelled")
+            raise
     
     async def execute(
         self,
         task: str,
         tools: Optional[List[str]] = None,
         model: Optional[str] = None,
-        max_steps: int = 10
+        max_steps: int = 10,
+        execution_id: Optional[str] = None,
+        max_execution_time: Optional[int] = None,
+        max_tokens: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Execute an agent task using smolagents
@@ -30,23 +125,21 @@ class AgentExecutor:
             tools: List of tool names to enable
             model: LLM model to use
             max_steps: Maximum execution steps
+            execution_id: Execution record id; enables live step events and cancellation
+            max_execution_time: Wall-clock limit in seconds (default: MAX_EXECUTION_TIME)
+            max_tokens: LLM token limit (default: MAX_EXECUTION_TOKENS)
             
         Returns:
             Dict with output and execution steps
+            
+        Raises:
+            ExecutionCancelled: If the run was cancelled or ran out of budget
         """
-        logger.info(f"[Tenant: {self.tenant_id}] Executing task: {task[:100]}")
-        
         try:
-            # Run agent execution in thread pool to avoid blocking
-            result = await asyncio.get_event_loop().run_in_executor(
-                self.executor,
-                self._execute_sync,
-                task,
-                tools,
-                model,
-                max_steps
-            )
-            return result
+            # Run agent execution on the shared worker pool to avoid blocking
+            return await self.submit(task, tools, model, max_steps, execution_id, max_execution_time, max_tokens)
+        except ExecutionCancelled:
+            raise
         except Exception as e:
             logger.error(f"[Tenant: {self.tenant_id}] Execution failed: {e}", exc_info=True)
             raise
@@ -56,109 +149,211 @@ class AgentExecutor:
         task: str,
         tools: Optional[List[str]],
         model: Optional[str],
-        max_steps: int
+        max_steps: int,
+        execution_id: Optional[str],
+        budget: ExecutionBudget
     ) -> Dict[str, Any]:
         """Synchronous agent execution"""
+        # Cancelled or out of time while waiting for a worker
+        budget.check()
+        if self.processes:
+            return self._execute_in_process(task, tools, model, max_steps, execution_id, budget)
+        setup_started = time.perf_counter()
+        # Deferred so the API starts without loading smolagents
+        from smolagents import ActionStep, CodeAgent
         
-        # Initialize model
-        model_id = model or os.getenv("DEFAULT_MODEL", "claude-3-5-sonnet-20241022")
-        
-        # Determine which model provider to use
-        if "claude" in model_id.lower() or "anthropic" in model_id.lower():
-            # Use Anthropic Claude via LiteLLM
-            anthropic_key = os.getenv("ANTHROPIC_API_KEY")
-            if not anthropic_key:
-                raise ValueError("ANTHROPIC_API_KEY not set for Claude models")
-            
-            # LiteLLM expects the model name with provider prefix
-            if not model_id.startswith("anthropic/"):
-                model_id = f"anthropic/{model_id}"
-            
-            llm_model = LiteLLMModel(model_id=model_id, api_key=anthropic_key)
-            logger.info(f"Using Claude model: {model_id}")
-            
-        elif "gpt" in model_id.lower() or "openai" in model_id.lower():
-            # Use OpenAI via LiteLLM
-            openai_key = os.getenv("OPENAI_API_KEY")
-            if not openai_key:
-                raise ValueError("OPENAI_API_KEY not set for OpenAI models")
-            
-            llm_model = LiteLLMModel(model_id=model_id, api_key=openai_key)
-            logger.info(f"Using OpenAI model: {model_id}")
-            
-        else:
-            # Default to Claude if no model specified
-            anthropic_key = os.getenv("ANTHROPIC_API_KEY")
-            if not anthropic_key:
-                raise ValueError("ANTHROPIC_API_KEY not set")
-            
-            model_id = "claude-3-5-sonnet-20241022"
-            llm_model = LiteLLMModel(model_id=model_id, api_key=anthropic_key)
-            logger.info(f"Using default Claude model: {model_id}")
+        # Route to the shared models (and connection pools) this run may use
+        llm_model = self.models.routed(model, task, self.tenant_id)
+        route = llm_model.route
+        model_id = llm_model.model_id
+        logger.info(f"Using model {model_id} ({route.reason}; candidates: {', '.join(route.candidates)})")
         
         # Initialize tools
         available_tools = self._get_tools(tools)
         
+        # Record, trace, publish and store each step as soon as it finishes
+        step_spans = StepSpans()
+        compactor = MemoryCompactor.from_env(model_id)
+        # Steps are attributed to the model serving the run at the time, which changes on failover
+        step_callbacks = [lambda step: self._on_step(execution_id, llm_model.model_id, step, step_spans, budget, compactor)]
+        
         # Create agent
-        agent = CodeAgent(
+        agent_kwargs = dict(
             tools=available_tools,
             model=llm_model,
             max_steps=max_steps,
-            verbosity_level=1
+            verbosity_level=int(os.getenv("AGENT_VERBOSITY_LEVEL", "1")),
+            step_callbacks=step_callbacks
         )
+        if os.getenv("AGENT_TYPE", "code").lower() == "tool_calling":
+            from tool_calling import ParallelToolCallingAgent
+            
+            agent = ParallelToolCallingAgent(
+                max_tool_threads=int(os.getenv("AGENT_MAX_TOOL_THREADS", "8")),
+                **agent_kwargs
+            )
+        else:
+            agent = CodeAgent(**agent_kwargs)
+        budget.attach(agent)
+        if compactor:
+            compactor.attach(agent)
+        MODEL_SETUP_SECONDS.observe(time.perf_counter() - setup_started)
         
         # Execute task
+        IN_FLIGHT.inc()
+        run_started = time.perf_counter()
+        spans_token = current_step_spans.set(step_spans)
+        budget_token = current_budget.set(budget)
         try:
-            output = agent.run(task)
+            with span("agent.run", **{"llm.model": model_id, "agent.max_steps": max_steps}):
+                try:
+                    output = agent.run(task)
+                finally:
+                    step_spans.finish()
+                    llm_model.settle()
             
-            # Extract execution steps
-            steps = []
-            if hasattr(agent, 'logs') and agent.logs:
-                for i, log in enumerate(agent.logs):
-                    steps.append({
-                        "step": i + 1,
-                        "action": log.get("action", "unknown"),
-                        "observation": log.get("observation", ""),
-                    })
+            # Extract execution steps from agent memory
+            steps = [
+                step_record(step)
+                for step in agent.memory.steps
+                if isinstance(step, ActionStep)
+            ]
+            EXECUTIONS.labels("completed").inc()
             
             return {
                 "output": str(output),
                 "steps": steps,
-                "model": model_id
+                "model": llm_model.model_id,
+                "routing": route.to_dict()
             }
             
         except Exception as e:
+            if budget.status:
+                logger.warning(f"Agent run stopped: {budget.reason}")
+                EXECUTIONS.labels(budget.status).inc()
+                cancelled = ExecutionCancelled(budget.status, budget.reason)
+                cancelled.routing = route.to_dict()
+                raise cancelled from e
             logger.error(f"Agent run failed: {e}", exc_info=True)
+            EXECUTIONS.labels("failed").inc()
+            # Recorded on the execution row with the failure
+            e.routing = route.to_dict()
             raise
+        finally:
+            current_budget.reset(budget_token)
+            current_step_spans.reset(spans_token)
+            IN_FLIGHT.dec()
+            AGENT_RUN_SECONDS.labels(model_id).observe(time.perf_counter() - run_started)
     
-    def _get_tools(self, tool_names: Optional[List[str]]) -> List[Any]:
-        """Get tool instances based on tool names"""
-        
-        # If empty list explicitly passed, return no tools
-        if tool_names is not None and len(tool_names) == 0:
-            return []
-        
-        # Map of available tools (tenant_info is always available)
-        tool_map = {
-            "web_search": DuckDuckGoSearchTool(),
-            "visit_webpage": VisitWebpageTool(),
-            "tenant_info": TenantInfoTool(tenant_id=self.tenant_id),
+    def _execute_in_process(
+        self,
+        task: str,
+        tools: Optional[List[str]],
+        model: Optional[str],
+        max_steps: int,
+        execution_id: Optional[str],
+        budget: ExecutionBudget
+    ) -> Dict[str, Any]:
+        """Run the agent in a worker process; this thread relays steps and cancellation"""
+        # The worker process routes the run itself; this only labels metrics
+        model_id = resolve_model(self.models.router.route(model, task, self.tenant_id).candidates[0])[1]
+        # The worker's spans continue this execution's trace
+        trace_context: Dict[str, str] = {}
+        inject(trace_context)
+        remaining = budget.remaining_seconds()
+        payload = {
+            "tenant_id": self.tenant_id,
+            "task": task,
+            "tools": tools,
+            "model": model,
+            "max_steps": max_steps,
+            "execution_id": execution_id,
+            "max_seconds": max(remaining, 0.001) if remaining is not None else 0,
+            "max_tokens": budget.max_tokens,
+            "trace_context": trace_context,
         }
         
-        # If no tools specified (None), return default set including tenant_info
-        if tool_names is None:
-            return [
-                tool_map["tenant_info"],
-                tool_map["web_search"],
-                tool_map["visit_webpage"]
-            ]
+        IN_FLIGHT.inc()
+        run_started = time.perf_counter()
+        try:
+            result = self.processes.run(
+                payload, budget, lambda record: self._record_step(execution_id, model_id, record, budget)
+            )
+            EXECUTIONS.labels("completed").inc()
+            return result
+        except ExecutionCancelled as e:
+            logger.warning(f"Agent run stopped: {e}")
+            EXECUTIONS.labels(e.status).inc()
+            raise
+        except Exception as e:
+            logger.error(f"Agent run failed in worker process: {e}")
+            EXECUTIONS.labels("failed").inc()
+            raise
+        finally:
+            IN_FLIGHT.dec()
+            AGENT_RUN_SECONDS.labels(model_id).observe(time.perf_counter() - run_started)
+    
+    def _on_step(
+        self,
+        execution_id: Optional[str],
+        model_id: str,
+        step: "ActionStep",
+        step_spans: StepSpans,
+        budget: ExecutionBudget,
+        compactor: Optional[MemoryCompactor] = None
+    ):
+        record = step_record(step)
+        # input_tokens is the prompt as sent; this is what compaction left out of it
+        record["compacted_tokens"] = compactor.saved_tokens if compactor else 0
+        step_spans.close(record)
+        self._record_step(execution_id, model_id, record, budget)
+    
+    def _record_step(
+        self,
+        execution_id: Optional[str],
+        model_id: str,
+        record: Dict[str, Any],
+        budget: ExecutionBudget
+    ):
+        # Interrupts the agent before its next step when out of budget
+        budget.exceeded()
+        if record["duration"] is not None:
+            STEP_SECONDS.labels(model_id).observe(record["duration"])
+        if record["input_tokens"]:
+            LLM_TOKENS.labels(model_id, "input").inc(record["input_tokens"])
+        if record["output_tokens"]:
+            LLM_TOKENS.labels(model_id, "output").inc(record["output_tokens"])
+        if record["cached_input_tokens"]:
+            LLM_TOKENS.labels(model_id, "cached_input").inc(record["cached_input_tokens"])
+        if record["cache_creation_input_tokens"]:
+            LLM_TOKENS.labels(model_id, "cache_write").inc(record["cache_creation_input_tokens"])
         
-        # Return requested tools
-        tools = []
-        for name in tool_names:
-            if name in tool_map:
-                tools.append(tool_map[name])
-            else:
-                logger.warning(f"Unknown tool: {name}")
+        if not execution_id:
+            return
+        if self.traces:
+            self.traces.record(execution_id, self.tenant_id, record)
+        if self.events:
+            self.events.publish(execution_id, {"type": "step", **record})
+    
+    def publish_outcome(
+        self,
+        execution_id: str,
+        output: Optional[str] = None,
+        error: Optional[str] = None
+    ):
+        """
+        Publish the terminal stream event for an execution
         
-        return tools
+        Called once the final state is stored, so clients that stop streaming
+        on this event and then fetch the execution see the finished record.
+        """
+        if not self.events:
+            return
+        if error is not None:
+            self.events.publish(execution_id, {"type": "error", "error": error})
+        else:
+            self.events.publish(execution_id, {"type": "final", "output": output})
+    
+    def _get_tools(self, tool_names: Optional[List[str]]) -> List[Any]:
+        """Get tool instances based on tool names"""
+        return tool_registry.get_tools(tool_names, tenant_id=self.tenant_id)
@@ -0,0 +1,209 @@
+"""
+Offline Benchmark
+
+Runs the API in-process against SQLite and the mock LLM provider (see
+mock_llm.py) and measures the platform's own overhead, with no network
+access or API keys. For each concurrency level it reports throughput,
+p50/p95/p99 latency and process memory for the execute, status and list
+endpoints.
+
+Usage (from agent-api/):
+    python benchmark.py --levels 1,8,32 --requests 200 --latency-ms 50
+    python benchmark.py --json results.json
+
+Pass --database-url to benchmark against a real Postgres instead.
+
+To benchmark real workloads, record executions with AGENT_RECORD_MODE=record
+(see recording.py) and replay them here; the recorded tasks are re-submitted
+in turn and every LLM and tool call is served from the recording:
+    python benchmark.py --replay ./recordings --replay-latency zero
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def rss_mb() -> float:
+    """Current resident set size, falling back to the peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+async def measure(
+    name: str,
+    concurrency: int,
+    count: int,
+    call: Callable[[int], Awaitable[Any]]
+) -> Dict[str, Any]:
+    """Run `call(i)` for i in range(count), at most `concurrency` at once"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await call(i)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    elapsed = time.perf_counter() - started
+    return {
+        "endpoint": name,
+        "concurrency": concurrency,
+        "requests": count,
+        "errors": errors,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    # The app reads its configuration at import time
+    import httpx
+    from main import app
+
+    results: List[Dict[str, Any]] = []
+    if args.replay:
+        from recording import recorder
+
+        bodies = recorder.runs()
+        if not bodies:
+            raise SystemExit(f"No recorded executions in {args.replay}")
+    else:
+        bodies = [{"task": "Benchmark task", "model": args.model, "max_steps": args.max_steps}]
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            while (await client.get("/health/ready")).status_code != 200:
+                await asyncio.sleep(0.1)
+            # One untimed run so lazy imports and the model build are not measured
+            await client.post("/api/v1/agent/execute", json=bodies[0])
+
+            for level in args.levels:
+                execution_ids: List[str] = []
+                first = len(results)
+
+                async def execute(i: int):
+                    response = await client.post("/api/v1/agent/execute", json=bodies[i % len(bodies)])
+                    if response.status_code == 200:
+                        execution_ids.append(response.json()["execution_id"])
+                    return response
+
+                async def status(i: int):
+                    return await client.get(f"/api/v1/agent/execution/{execution_ids[i % len(execution_ids)]}")
+
+                async def list_executions(i: int):
+                    return await client.get("/api/v1/agent/executions", params={"limit": args.list_limit})
+
+                results.append(await measure("execute", level, args.requests, execute))
+                if execution_ids:
+                    results.append(await measure("status", level, args.requests, status))
+                results.append(await measure("list", level, args.requests, list_executions))
+                for result in results[first:]:
+                    print(format_row(result), flush=True)
+    return results
+
+
+def format_row(result: Dict[str, Any]) -> str:
+    return (
+        f"{result['endpoint']:<8} {result['concurrency']:>5} {result['requests']:>6} {result['errors']:>6} "
+        f"{result['throughput_rps']:>10} {result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9} "
+        f"{result['rss_mb']:>8}"
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the Agent Platform API offline")
+    parser.add_argument("--levels", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint and level")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mock LLM latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Extra random mock LLM latency")
+    parser.add_argument("--script", help="MOCK_LLM_SCRIPT: JSON list of replies, inline or a file path")
+    parser.add_argument("--model", default="mock/benchmark", help="Model to run; must use the mock/ prefix to stay offline")
+    parser.add_argument("--max-steps", type=int, default=5)
+    parser.add_argument("--list-limit", type=int, default=50, help="Page size for the list endpoint")
+    parser.add_argument("--replay", metavar="DIR", help="Re-submit the executions recorded in DIR, replaying their LLM and tool calls")
+    parser.add_argument("--replay-latency", choices=["recorded", "zero"], default="recorded", help="Replay calls with their recorded latency or none")
+    parser.add_argument("--database-url", help="Database to use (default: a temporary SQLite file)")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+    args.levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    return args
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="agent-benchmark-")
+
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{workdir}/benchmark.db"
+    os.environ["DEFAULT_MODEL"] = args.model
+    os.environ["MOCK_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["MOCK_LLM_LATENCY_JITTER_MS"] = str(args.jitter_ms)
+    if args.script:
+        os.environ["MOCK_LLM_SCRIPT"] = args.script
+    if args.replay:
+        os.environ["AGENT_RECORD_MODE"] = "replay"
+        os.environ["AGENT_RECORDING_DIR"] = args.replay
+        os.environ["AGENT_REPLAY_LATENCY"] = args.replay_latency
+    os.environ.setdefault("DB_MIGRATE_ON_STARTUP", "true")
+    os.environ.setdefault("TENANT_ID", "benchmark-tenant")
+    os.environ.setdefault("JOB_QUEUE_BACKEND", "memory")
+    os.environ.setdefault("TRACE_EXPORTER", "none")
+    # smolagents' console rendering of every step would drown the report
+    os.environ.setdefault("AGENT_VERBOSITY_LEVEL", "0")
+    # Keep the pool from rejecting the highest level
+    os.environ.setdefault("AGENT_POOL_MAX_WORKERS", str(max(args.levels)))
+    os.environ.setdefault("AGENT_POOL_MAX_QUEUE", str(max(args.levels)))
+    os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+    os.environ.pop("REDIS_URL", None)
+
+    # Set before main.py configures INFO logging, which would then be a no-op
+    logging.basicConfig(level=logging.WARNING)
+
+    source = f"Replaying {args.replay}" if args.replay else f"Mock latency {args.latency_ms}ms"
+    print(f"{source}, {args.requests} requests per endpoint and level")
+    print(f"{'endpoint':<8} {'conc':>5} {'reqs':>6} {'errors':>6} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rss MB':>8}")
+    results = asyncio.run(run(args))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "json_path"}, "results": results}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Execution Budgets and Cancellation
+
+Every agent run gets an ExecutionBudget: a wall-clock limit counted from
+admission (MAX_EXECUTION_TIME) and an optional LLM token limit
+(MAX_EXECUTION_TOKENS). Budgets are checked cooperatively between steps and
+before every LLM and tool call; LLM calls are also given the remaining time
+as their request timeout.
+
+Cancel requests go through CancelSignals, which stops runs in this process
+immediately and, with REDIS_URL, flags them for the replica that runs them.
+"""
+
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+BUDGET_EXCEEDED = "budget_exceeded"
+
+
+class ExecutionCancelled(Exception):
+    """Raised when a run was cancelled or ran out of budget"""
+
+    def __init__(self, status: str, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def default_limits() -> Tuple[int, int]:
+    """(max seconds, max tokens) per execution; 0 means unlimited"""
+    return (
+        int(os.getenv("MAX_EXECUTION_TIME", "300")),
+        int(os.getenv("MAX_EXECUTION_TOKENS", "0")),
+    )
+
+
+def effective_limits(max_seconds: Optional[int] = None, max_tokens: Optional[int] = None) -> Tuple[int, int]:
+    """A request's (max seconds, max tokens): it may tighten the configured limits, never loosen them"""
+    default_seconds, default_tokens = default_limits()
+    return (
+        min(filter(None, (max_seconds, default_seconds)), default=0),
+        min(filter(None, (max_tokens, default_tokens)), default=0),
+    )
+
+
+class ExecutionBudget:
+    """Wall-clock and token budget of one execution"""
+
+    def __init__(
+        self,
+        execution_id: Optional[str],
+        max_seconds: int = 0,
+        max_tokens: int = 0,
+        signals: Optional["CancelSignals"] = None
+    ):
+        self.execution_id = execution_id
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.signals = signals
+        self.started = time.monotonic()
+        self.tokens = 0
+        self.status: Optional[str] = None
+        self.reason: Optional[str] = None
+        self._agent: Any = None
+        self._lock = threading.Lock()
+
+    def attach(self, agent: Any):
+        """Interrupt this agent when the budget stops"""
+        self._agent = agent
+        if self.status:
+            agent.interrupt()
+
+    def add_tokens(self, count: int):
+        with self._lock:
+            self.tokens += count or 0
+
+    def remaining_seconds(self) -> Optional[float]:
+        if not self.max_seconds:
+            return None
+        return max(0.0, self.max_seconds - (time.monotonic() - self.started))
+
+    def stop(self, status: str, reason: str):
+        with self._lock:
+            if self.status:
+                return
+            self.status = status
+            self.reason = reason
+        logger.info(f"Stopping execution {self.execution_id}: {reason}")
+        if self._agent is not None:
+            self._agent.interrupt()
+
+    def exceeded(self) -> bool:
+        """Whether the run must stop; stops the budget the first time it is"""
+        if self.status:
+            return True
+        if self.signals and self.execution_id:
+            requested = self.signals.requested(self.execution_id)
+            if requested:
+                self.stop(requested, "Execution was cancelled")
+                return True
+        if self.max_seconds and time.monotonic() - self.started > self.max_seconds:
+            self.stop(TIMED_OUT, f"Execution exceeded MAX_EXECUTION_TIME of {self.max_seconds}s")
+        elif self.max_tokens and self.tokens > self.max_tokens:
+            self.stop(
+                BUDGET_EXCEEDED,
+                f"Execution used {self.tokens} LLM tokens, over its budget of {self.max_tokens} tokens"
+            )
+        return self.status is not None
+
+    def check(self):
+        """
+        Raises:
+            ExecutionCancelled: If the run was cancelled or is out of budget
+        """
+        if self.exceeded():
+            raise ExecutionCancelled(self.status, self.reason)
+
+
+# Budget of the run executing in the current thread, read by model and tool wrappers
+current_budget: ContextVar[Optional[ExecutionBudget]] = ContextVar("current_budget", default=None)
+
+
+class CancelSignals:
+    """Delivers cancel requests to running executions, across replicas with Redis"""
+
+    def __init__(self, redis_url: Optional[str] = None, poll_interval: float = 1.0, ttl_seconds: int = 3600):
+        self.poll_interval = poll_interval
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._budgets: Dict[str, ExecutionBudget] = {}
+        self._last_poll: Dict[str, float] = {}
+        self._redis = None
+        if redis_url:
+            import redis
+
+            self._redis = redis.Redis.from_url(redis_url, decode_responses=True)
+
+    @classmethod
+    def from_env(cls) -> "CancelSignals":
+        return cls(redis_url=os.getenv("REDIS_URL"))
+
+    def register(self, budget: ExecutionBudget):
+        with self._lock:
+            self._budgets[budget.execution_id] = budget
+
+    def unregister(self, budget: ExecutionBudget):
+        with self._lock:
+            if self._budgets.get(budget.execution_id) is budget:
+                del self._budgets[budget.execution_id]
+            self._last_poll.pop(budget.execution_id, None)
+
+    def cancel(self, execution_id: str, status: str = CANCELLED, reason: str = "Execution was cancelled"):
+        """Stop an execution here if it runs in this process, and flag it for other replicas"""
+        with self._lock:
+            budget = self._budgets.get(execution_id)
+        if budget is not None:
+            budget.stop(status, reason)
+        if self._redis is not None:
+            try:
+                self._redis.set(f"agent:cancel:{execution_id}", status, ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"Failed to publish cancel of {execution_id}: {e}")
+
+    def requested(self, execution_id: str) -> Optional[str]:
+        """Cancel status flagged by another replica, polled at most every poll_interval"""
+        if self._redis is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_poll.get(execution_id, 0.0) < self.poll_interval:
+                return None
+            self._last_poll[execution_id] = now
+        try:
+            return self._redis.get(f"agent:cancel:{execution_id}")
+        except Exception as e:
+            logger.warning(f"Failed to read cancel flag of {execution_id}: {e}")
+            return None
+
+    def close(self):
+        if self._redis is not None:
+            self._redis.close()
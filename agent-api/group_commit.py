@@ -0,0 +1,190 @@
+"""
+Group-Commit Writer
+
+Collects execution and step inserts from concurrent requests and agent
+threads and writes each batch in one transaction with one multi-row INSERT
+per table, instead of a session, connection checkout and commit per row.
+Under load this turns many small commits into a few larger ones and keeps
+the writers from exhausting the engine's connection pool.
+
+There is no artificial delay by default: a batch is whatever queued up
+while the previous commit was in flight, so an idle service writes each row
+immediately. GROUP_COMMIT_WINDOW_MS trades a little latency for larger
+batches.
+
+- GROUP_COMMIT_MAX_BATCH: most rows per transaction (default 200)
+- GROUP_COMMIT_WINDOW_MS: extra time to gather a batch (default 0)
+- GROUP_COMMIT_WRITERS: transactions in flight at once (default 2)
+
+If a batch fails, its rows are retried one per transaction so a single bad
+row (e.g. a duplicate Idempotency-Key) fails only its own write.
+"""
+
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import threading
+
+from sqlalchemy import insert
+
+from database import AsyncSessionLocal
+from metrics import DB_BATCH_ROWS
+from tracing import db_write
+
+logger = logging.getLogger(__name__)
+
+# (model class, row values, asyncio or thread future resolved once the row is committed)
+_Write = Tuple[Any, Dict[str, Any], Any]
+
+
+class GroupCommitWriter:
+    """Batches row inserts into shared transactions; bind it to the event loop it runs on"""
+
+    def __init__(self, max_batch: int = 200, window_ms: float = 0.0, writers: int = 2):
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.writers = writers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional["asyncio.Queue[_Write]"] = None
+        self._tasks: List[asyncio.Task] = []
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List["asyncio.Future[None]"]] = {}
+
+    @classmethod
+    def from_env(cls) -> "GroupCommitWriter":
+        return cls(
+            max_batch=int(os.getenv("GROUP_COMMIT_MAX_BATCH", "200")),
+            window_ms=float(os.getenv("GROUP_COMMIT_WINDOW_MS", "0")),
+            writers=int(os.getenv("GROUP_COMMIT_WRITERS", "2")),
+        )
+
+    def start(self):
+        """Bind the writer to the running event loop and start its writer tasks"""
+        if self._queue is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._tasks = [self._loop.create_task(self._run()) for _ in range(self.writers)]
+
+    def add(self, model: Any, row: Dict[str, Any], key: Optional[str] = None) -> "asyncio.Future[None]":
+        """
+        Queue a row insert from the event loop
+
+        The returned future resolves once the row is committed, or raises the
+        insert's error (e.g. IntegrityError). Writes queued under `key` can be
+        awaited together with `flush(key)`.
+        """
+        self.start()
+        future = self._loop.create_future()
+        self._track(key, future)
+        self._queue.put_nowait((model, row, future))
+        return future
+
+    def add_threadsafe(self, model: Any, row: Dict[str, Any], key: Optional[str] = None) -> Future:
+        """Queue a row insert from another thread, e.g. an agent worker thread"""
+        if self._loop is None:
+            raise RuntimeError("GroupCommitWriter.start() must be called on the event loop first")
+        future: Future = Future()
+        # Tracked before this returns, so a later flush(key) always waits for it
+        self._track(key, future)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (model, row, future))
+        return future
+
+    def _track(self, key: Optional[str], future):
+        if key is not None:
+            with self._lock:
+                self._pending.setdefault(key, []).append(future)
+            # Finished writes stop being tracked even if nobody flushes their key
+            future.add_done_callback(lambda f: self._untrack(key, f))
+
+    def _untrack(self, key: str, future):
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                return
+            try:
+                pending.remove(future)
+            except ValueError:
+                return
+            if not pending:
+                del self._pending[key]
+
+    async def flush(self, key: str):
+        """Wait until every write queued under `key` is committed or has failed"""
+        with self._lock:
+            pending = self._pending.pop(key, [])
+        if pending:
+            await asyncio.gather(
+                *(asyncio.wrap_future(f) if isinstance(f, Future) else f for f in pending),
+                return_exceptions=True,
+            )
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self.window:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._commit(batch)
+            except Exception as e:  # pragma: no cover - _commit resolves every future
+                logger.error(f"Group commit failed: {e}", exc_info=True)
+
+    async def _commit(self, batch: List[_Write]):
+        DB_BATCH_ROWS.observe(len(batch))
+        try:
+            await self._insert(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                self._resolve(batch, e)
+                return
+            logger.warning(f"Group commit of {len(batch)} rows failed, retrying row by row: {e}")
+            for write in batch:
+                try:
+                    await self._insert([write])
+                except Exception as row_error:
+                    self._resolve([write], row_error)
+                else:
+                    self._resolve([write])
+            return
+        self._resolve(batch)
+
+    async def _insert(self, batch: List[_Write]):
+        # One INSERT per table and column set, in first-queued order, so
+        # executions are inserted before their steps
+        statements: Dict[Tuple[Any, frozenset], List[Dict[str, Any]]] = {}
+        for model, row, _ in batch:
+            statements.setdefault((model, frozenset(row)), []).append(row)
+        with db_write("group_commit"):
+            async with AsyncSessionLocal() as session:
+                for (model, _), rows in statements.items():
+                    await session.execute(insert(model), rows)
+                await session.commit()
+
+    def _resolve(self, batch: List[_Write], error: Optional[BaseException] = None):
+        for _, _, future in batch:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+                # Nobody may await a write-behind row; keep its failure from being reported as unretrieved
+                future.add_done_callback(lambda f: f.exception())
+
+    async def close(self):
+        """Commit everything queued, then stop the writers"""
+        if self._queue is None:
+            return
+        while not self._queue.empty():
+            await asyncio.sleep(0.01)
+        with self._lock:
+            keys = list(self._pending)
+        for key in keys:
+            await self.flush(key)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,192 @@
+"""
+Background Health Prober
+
+Checks the service's dependencies on an interval instead of on every health
+request, so probes from Kubernetes and Omnistrate cost nothing and never
+compete with real traffic for database connections:
+
+- database: `SELECT 1` through a dedicated one-connection engine
+- redis: PING, when REDIS_URL is set
+- llm:<provider>: an HTTP request to the provider's API host, for the
+  default model's provider and every provider a model was built for
+
+`/health`, `/health/ready` and `/health/deps` answer from the latest
+snapshot, which also carries each dependency's probe latency and the
+utilization of the main engine's connection pool (read live).
+
+- HEALTH_PROBE_INTERVAL_SECONDS: time between probes (default 10)
+- HEALTH_PROBE_TIMEOUT_SECONDS: limit for a single dependency check (default 2)
+- HEALTH_PROBE_LLM: set to false to skip provider reachability checks
+"""
+
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from metrics import DB_POOL_CONNECTIONS, DEPENDENCY_LATENCY_SECONDS, DEPENDENCY_UP
+from model_registry import PROVIDER_BASE_URLS, ModelRegistry, resolve_model
+from recording import REPLAY, recorder
+
+logger = logging.getLogger(__name__)
+
+HEALTHY = "healthy"
+UNHEALTHY = "unhealthy"
+UNKNOWN = "unknown"
+
+
+def pool_stats(engine: AsyncEngine) -> Dict[str, Any]:
+    """Connection pool utilization of an engine (not every pool class reports all of it)"""
+    pool = engine.pool
+    size = getattr(pool, "size", lambda: 0)()
+    checked_out = getattr(pool, "checkedout", lambda: 0)()
+    overflow = max(0, getattr(pool, "overflow", lambda: 0)())
+    max_overflow = getattr(pool, "_max_overflow", 0)
+    capacity = size + max(0, max_overflow)
+    return {
+        "size": size,
+        "checked_out": checked_out,
+        "idle": getattr(pool, "checkedin", lambda: 0)(),
+        "overflow": overflow,
+        "max_overflow": max_overflow,
+        "utilization": round(checked_out / capacity, 3) if capacity else 0.0,
+    }
+
+
+class HealthProber:
+    """Probes dependencies in the background and keeps the latest results"""
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        models: ModelRegistry,
+        redis_url: Optional[str] = None,
+        interval: float = 10.0,
+        timeout: float = 2.0,
+        probe_llm: bool = True,
+    ):
+        self.engine = engine
+        self.models = models
+        self.redis_url = redis_url
+        self.interval = interval
+        self.timeout = timeout
+        self.probe_llm = probe_llm
+        self.checked_at: Optional[datetime] = None
+        self.dependencies: Dict[str, Dict[str, Any]] = {"database": {"status": UNKNOWN}}
+        if redis_url:
+            self.dependencies["redis"] = {"status": UNKNOWN}
+
+        # Probes use their own connections, never a slot in the request pools
+        self._probe_engine = create_async_engine(
+            engine.url, pool_size=1, max_overflow=0, pool_pre_ping=False
+        )
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as aredis
+
+            self._redis = aredis.from_url(redis_url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._http = httpx.AsyncClient(timeout=timeout)
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, engine: AsyncEngine, models: ModelRegistry) -> "HealthProber":
+        return cls(
+            engine,
+            models,
+            redis_url=os.getenv("REDIS_URL"),
+            interval=float(os.getenv("HEALTH_PROBE_INTERVAL_SECONDS", "10")),
+            timeout=float(os.getenv("HEALTH_PROBE_TIMEOUT_SECONDS", "2")),
+            probe_llm=os.getenv("HEALTH_PROBE_LLM", "true").lower() == "true",
+        )
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self._http.aclose()
+        if self._redis is not None:
+            await self._redis.aclose()
+        await self._probe_engine.dispose()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                logger.error(f"Health probe failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    def _llm_providers(self) -> Dict[str, str]:
+        """Base URLs of the providers worth probing"""
+        if not self.probe_llm or recorder.mode == REPLAY:
+            return {}
+        providers = {model["provider"] for model in self.models.stats()["models"]}
+        try:
+            providers.add(resolve_model(None)[0])
+        except ValueError:
+            pass  # No key for the default provider; executions would fail before calling it
+        return {p: PROVIDER_BASE_URLS[p] for p in providers if p in PROVIDER_BASE_URLS}
+
+    async def probe(self):
+        """Check every dependency concurrently and replace the snapshot"""
+        checks: Dict[str, Callable[[], Awaitable[Any]]] = {"database": self._check_database}
+        if self._redis is not None:
+            checks["redis"] = self._redis.ping
+        for provider, base_url in self._llm_providers().items():
+            # Any HTTP response means the API host is reachable
+            checks[f"llm:{provider}"] = lambda url=base_url: self._http.head(url)
+
+        names = list(checks)
+        results = await asyncio.gather(*(self._check(name, checks[name]) for name in names))
+        self.dependencies = dict(zip(names, results))
+        self.checked_at = datetime.utcnow()
+
+        for state, value in pool_stats(self.engine).items():
+            if state in ("checked_out", "idle", "overflow"):
+                DB_POOL_CONNECTIONS.labels(state).set(value)
+
+    async def _check(self, name: str, check: Callable[[], Awaitable[Any]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), timeout=self.timeout)
+            result = {"status": HEALTHY}
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if self.dependencies.get(name, {}).get("status") != UNHEALTHY:
+                logger.warning(f"Health probe of {name} failed: {error}")
+            result = {"status": UNHEALTHY, "error": error[:500]}
+        latency = time.perf_counter() - started
+        result["latency_ms"] = round(latency * 1000, 1)
+        DEPENDENCY_UP.labels(name).set(1 if result["status"] == HEALTHY else 0)
+        DEPENDENCY_LATENCY_SECONDS.labels(name).set(latency)
+        return result
+
+    async def _check_database(self):
+        async with self._probe_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    def status(self, name: str) -> str:
+        """Cached status of one dependency; "disabled" when it is not configured"""
+        return self.dependencies.get(name, {}).get("status", "disabled")
+
+    @property
+    def healthy(self) -> bool:
+        return all(dep["status"] == HEALTHY for dep in self.dependencies.values())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "status": HEALTHY if self.healthy else "degraded",
+            "checked_at": self.checked_at.isoformat() + "Z" if self.checked_at else None,
+            "interval_seconds": self.interval,
+            "dependencies": self.dependencies,
+            "database_pool": pool_stats(self.engine),
+        }
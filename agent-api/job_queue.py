@@ -0,0 +1,163 @@
+"""
+Agent Job Queue
+
+Hands asynchronous agent executions from the API tier to worker processes.
+Production uses a Redis list (REDIS_URL); tests and single-process setups use
+an in-process stand-in with the same interface.
+
+A Redis worker moves each job it takes into its own processing list and
+acknowledges it once the execution row is claimed, so a job whose worker
+dies in between is not lost: workers refresh a heartbeat key while they
+run, and the processing lists of workers whose heartbeat expired are put
+back on the queue.
+
+- JOB_QUEUE_WORKER_TTL_SECONDS: heartbeat lifetime, after which a silent
+  worker's unacknowledged jobs are requeued (default 30)
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue(ABC):
+    """Interface shared by the job queue backends"""
+
+    backend = "base"
+
+    @abstractmethod
+    async def enqueue(self, job: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    async def dequeue(self, timeout: float = 5.0) -> Optional[Dict[str, Any]]:
+        """Wait up to `timeout` seconds for the next job, or return None"""
+
+    async def ack(self, job: Dict[str, Any]):
+        """Mark a dequeued job as handled, once its execution row is claimed"""
+
+    async def heartbeat(self):
+        """Tell other workers this one is alive; called every few seconds while it runs"""
+
+    async def recover(self) -> int:
+        """Requeue jobs taken by workers that died before acknowledging them; returns how many"""
+        return 0
+
+    @abstractmethod
+    async def depth(self) -> int:
+        ...
+
+    async def close(self):
+        pass
+
+
+class InMemoryJobQueue(JobQueue):
+    """In-process queue, drained by a worker running inside the API process"""
+
+    backend = "memory"
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def enqueue(self, job: Dict[str, Any]):
+        await self._queue.put({**job, "enqueued_at": time.time()})
+
+    async def dequeue(self, timeout: float = 5.0) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def depth(self) -> int:
+        return self._queue.qsize()
+
+
+class RedisJobQueue(JobQueue):
+    """Redis list used as a FIFO queue shared by every API and worker replica"""
+
+    backend = "redis"
+
+    def __init__(self, redis_url: str, key: str = "agent:jobs", worker_ttl: float = 30.0):
+        import redis.asyncio as redis
+
+        self.key = key
+        self.worker_ttl = worker_ttl
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.processing_key = f"{key}:processing:{self.worker_id}"
+        self._redis = redis.from_url(redis_url, decode_responses=True)
+
+    def _alive_key(self, worker_id: str) -> str:
+        return f"{self.key}:alive:{worker_id}"
+
+    async def enqueue(self, job: Dict[str, Any]):
+        await self._redis.lpush(self.key, json.dumps({**job, "enqueued_at": time.time()}))
+
+    async def heartbeat(self):
+        await self._redis.set(self._alive_key(self.worker_id), 1, ex=max(1, int(self.worker_ttl)))
+
+    async def dequeue(self, timeout: float = 5.0) -> Optional[Dict[str, Any]]:
+        item = await self._redis.blmove(self.key, self.processing_key, timeout, "RIGHT", "LEFT")
+        if item is None:
+            return None
+        # The exact payload is needed to remove it from the processing list
+        return {**json.loads(item), "_receipt": item}
+
+    async def ack(self, job: Dict[str, Any]):
+        receipt = job.get("_receipt")
+        if receipt is not None:
+            await self._redis.lrem(self.processing_key, 1, receipt)
+
+    async def recover(self) -> int:
+        recovered = 0
+        prefix = f"{self.key}:processing:"
+        async for processing_key in self._redis.scan_iter(match=f"{prefix}*"):
+            worker_id = processing_key[len(prefix):]
+            if worker_id == self.worker_id or await self._redis.exists(self._alive_key(worker_id)):
+                continue
+            # Back on the consuming end of the queue, oldest first
+            while await self._redis.lmove(processing_key, self.key, "LEFT", "RIGHT") is not None:
+                recovered += 1
+        if recovered:
+            logger.warning(f"Requeued {recovered} jobs left unacknowledged by stopped workers")
+        return recovered
+
+    async def depth(self) -> int:
+        return await self._redis.llen(self.key)
+
+    async def close(self):
+        await self._redis.delete(self._alive_key(self.worker_id))
+        await self._redis.aclose()
+
+
+def create_job_queue() -> JobQueue:
+    """
+    Build the job queue selected by JOB_QUEUE_BACKEND ("redis" or "memory").
+
+    Defaults to Redis when REDIS_URL is set, otherwise to the in-process queue.
+    """
+    redis_url = os.getenv("REDIS_URL")
+    backend = os.getenv("JOB_QUEUE_BACKEND", "redis" if redis_url else "memory").lower()
+
+    if backend == "redis":
+        if not redis_url:
+            raise ValueError("REDIS_URL not set for the redis job queue backend")
+        logger.info("Using Redis job queue")
+        return RedisJobQueue(
+            redis_url,
+            key=os.getenv("JOB_QUEUE_KEY", "agent:jobs"),
+            worker_ttl=float(os.getenv("JOB_QUEUE_WORKER_TTL_SECONDS", "30")),
+        )
+
+    if backend == "memory":
+        logger.info("Using in-process job queue")
+        return InMemoryJobQueue()
+
+    raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {backend}")
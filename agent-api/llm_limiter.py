@@ -0,0 +1,403 @@
+"""
+Adaptive LLM Rate Limiting and Retries
+
+One LLMLimiter per model in the ModelRegistry, shared by every execution in
+the process, sits in front of each completion call:
+
+- Concurrency adapts AIMD-style: every successful call raises the limit by
+  1/limit (about one per round trip at full load), and a throttled call
+  (429, 503 or 529) halves it, at most once per round of calls in flight.
+  A burst of executions then queues here instead of turning provider
+  throttling into a retry storm.
+- Token buckets cap requests and tokens per minute. A call reserves its
+  estimated prompt tokens up front and is charged the actual usage after.
+  With REDIS_URL the per-minute limits are counted in Redis, so they hold
+  across replicas.
+- Throttled and transient failures (408, 429, 5xx, connection errors) are
+  retried up to MAX_RETRIES times with full-jitter exponential backoff.
+  When the provider sends `retry-after`, every call to the model waits it
+  out. Retries never wait past the execution's wall-clock budget.
+
+Configuration (LLM_RATE_LIMITS overrides any of the per-model settings, as
+JSON keyed by model id or provider, e.g. {"openai": {"requests_per_minute": 500}}):
+- LLM_MAX_CONCURRENCY: upper bound on concurrent calls per model (default 32)
+- LLM_MIN_CONCURRENCY: lower bound after throttling (default 1)
+- LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE: 0 = unlimited (default)
+- MAX_RETRIES: retries per call (default 3)
+- LLM_RETRY_BASE_SECONDS / LLM_RETRY_MAX_SECONDS: backoff range (default 0.5 / 30)
+"""
+
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterator, Optional
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+
+from execution_control import current_budget
+from metrics import LLM_CONCURRENCY_LIMIT, LLM_LIMITER_WAIT_SECONDS, LLM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Provider is overloaded or rate limiting: back off concurrency
+THROTTLE_STATUSES = {429, 503, 529}
+# Worth another attempt
+RETRY_STATUSES = THROTTLE_STATUSES | {408, 409, 500, 502, 504}
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """HTTP status of a provider error (litellm, OpenAI SDK or mock), if it has one"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait, from `retry-after-ms` or `retry-after`"""
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None)
+    headers = headers or getattr(error, "litellm_response_headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retryable(error: BaseException) -> bool:
+    status = error_status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+class TokenBucket:
+    """Per-minute allowance refilled continuously; reservations may run into debt and wait it off"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` now; returns the seconds to wait before using it"""
+        # A single request larger than a minute's allowance still gets through, alone
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            return max(0.0, -self._tokens * 60 / self.per_minute)
+
+    def adjust(self, amount: float):
+        """Charge (or refund, if negative) the difference between estimated and actual use"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class RedisWindow:
+    """Fixed one-minute windows counted in Redis, shared by every replica"""
+
+    # Reservations look no further ahead than this many windows
+    MAX_WINDOWS_AHEAD = 5
+
+    def __init__(self, client: Any, key: str, per_minute: float, fallback: TokenBucket):
+        self.client = client
+        self.key = key
+        self.per_minute = per_minute
+        self.fallback = fallback
+
+    def reserve(self, amount: float) -> float:
+        amount = int(math.ceil(min(amount, self.per_minute)))
+        now = time.time()
+        window = int(now // 60)
+        try:
+            for ahead in range(self.MAX_WINDOWS_AHEAD):
+                key = f"{self.key}:{window + ahead}"
+                pipe = self.client.pipeline()
+                pipe.incrby(key, amount)
+                pipe.expire(key, 60 * (self.MAX_WINDOWS_AHEAD + 1))
+                total = pipe.execute()[0]
+                if total <= self.per_minute:
+                    return max(0.0, (window + ahead) * 60 - now)
+                self.client.decrby(key, amount)
+            return (window + self.MAX_WINDOWS_AHEAD) * 60 - now
+        except Exception as e:
+            logger.warning(f"Shared rate limit {self.key} unavailable, limiting locally: {e}")
+            return self.fallback.reserve(amount)
+
+    def adjust(self, amount: float):
+        if not amount:
+            return
+        try:
+            key = f"{self.key}:{int(time.time() // 60)}"
+            self.client.incrby(key, int(amount))
+        except Exception:
+            self.fallback.adjust(amount)
+
+
+class AdaptiveConcurrency:
+    """AIMD concurrency limit: additive increase on success, multiplicative decrease on throttling"""
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = max(1, min(min_limit, max_limit))
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, deadline: Optional[float] = None) -> float:
+        """Wait for a slot; returns when the call started, or raises TimeoutError past `deadline`"""
+        budget = current_budget.get()
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                timeout = 1.0 if deadline is None else min(1.0, deadline - time.monotonic())
+                if timeout <= 0:
+                    raise TimeoutError("No LLM call slot became free in time")
+                self._cond.wait(timeout)
+                if budget:
+                    budget.check()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                # Calls already in flight when we backed off would throttle too; count them once
+                if started >= self._last_decrease:
+                    self.limit = max(float(self.min_limit), self.limit / 2)
+                    self._last_decrease = time.monotonic()
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class LLMLimiter:
+    """Admission control, rate limits and retries for the calls to one model"""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_retries: int = 3,
+        retry_base: float = 0.5,
+        retry_max: float = 30.0,
+        redis_client: Any = None,
+    ):
+        self.name = name
+        self.concurrency = AdaptiveConcurrency(max_concurrency, min_concurrency)
+        self.requests = self._bucket("requests", requests_per_minute, redis_client)
+        self.tokens = self._bucket("tokens", tokens_per_minute, redis_client)
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        # Monotonic time before which nobody calls the model, set from retry-after
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0, "wait_seconds": 0.0}
+        LLM_CONCURRENCY_LIMIT.labels(name).set(self.concurrency.limit)
+
+    def _bucket(self, kind: str, per_minute: float, redis_client: Any) -> Any:
+        if not per_minute:
+            return None
+        bucket = TokenBucket(per_minute)
+        if redis_client is not None:
+            return RedisWindow(redis_client, f"agent:llm:{self.name}:{kind}", per_minute, bucket)
+        return bucket
+
+    @classmethod
+    def from_env(cls, provider: str, model_id: str) -> "LLMLimiter":
+        settings = {
+            "max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", "32")),
+            "min_concurrency": int(os.getenv("LLM_MIN_CONCURRENCY", "1")),
+            "requests_per_minute": float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+            "tokens_per_minute": float(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+        }
+        overrides = json.loads(os.getenv("LLM_RATE_LIMITS") or "{}")
+        settings.update(overrides.get(provider, {}))
+        settings.update(overrides.get(model_id, {}))
+
+        redis_client = None
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url and (settings["requests_per_minute"] or settings["tokens_per_minute"]):
+            import redis
+
+            redis_client = redis.Redis.from_url(redis_url, socket_timeout=1.0)
+        return cls(
+            model_id,
+            max_retries=int(os.getenv("MAX_RETRIES", "3")),
+            retry_base=float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5")),
+            retry_max=float(os.getenv("LLM_RETRY_MAX_SECONDS", "30")),
+            redis_client=redis_client,
+            **settings,
+        )
+
+    def _count(self, counter: str, amount: float = 1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def _sleep(self, seconds: float, error: Optional[BaseException] = None):
+        """Wait, unless that outlasts the execution's budget; then re-raise `error`"""
+        if seconds <= 0:
+            return
+        budget = current_budget.get()
+        remaining = budget.remaining_seconds() if budget else None
+        if remaining is not None and seconds >= remaining:
+            if error is not None:
+                raise error
+            seconds = remaining
+        self._count("wait_seconds", seconds)
+        LLM_LIMITER_WAIT_SECONDS.labels(self.name).observe(seconds)
+        end = time.monotonic() + seconds
+        while True:
+            left = end - time.monotonic()
+            if left <= 0:
+                break
+            time.sleep(min(left, 1.0))
+            if budget:
+                budget.check()
+
+    def _admit(self, estimated_tokens: int) -> float:
+        """Wait out cooldowns and rate limits, then take a concurrency slot"""
+        with self._lock:
+            cooldown = self._cooldown_until - time.monotonic()
+        self._sleep(cooldown)
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.reserve(1)
+        if self.tokens is not None and estimated_tokens:
+            wait = max(wait, self.tokens.reserve(estimated_tokens))
+        self._sleep(wait)
+        self._count("calls")
+        return self.concurrency.acquire()
+
+    def _failed(self, started: float, error: BaseException, attempt: int) -> float:
+        """Release the slot after a failure; returns the backoff, or re-raises if not retryable"""
+        status = error_status(error)
+        throttled = status in THROTTLE_STATUSES
+        self.concurrency.release(started, throttled)
+        LLM_CONCURRENCY_LIMIT.labels(self.name).set(self.concurrency.limit)
+        if throttled:
+            self._count("throttled")
+        if attempt >= self.max_retries or not _retryable(error):
+            self._count("failed")
+            raise error
+
+        delay = retry_after(error)
+        if delay is not None:
+            with self._lock:
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+        else:
+            # Full jitter: spreads retries of a burst evenly instead of in waves
+            delay = random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+        self._count("retries")
+        LLM_RETRIES.labels(self.name, str(status or type(error).__name__)).inc()
+        logger.warning(
+            f"LLM call to {self.name} failed ({status or type(error).__name__}), "
+            f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+        )
+        return delay
+
+    def _succeeded(self, started: float):
+        self.concurrency.release(started)
+        LLM_CONCURRENCY_LIMIT.labels(self.name).set(self.concurrency.limit)
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int = 0) -> Any:
+        """Run one completion call under the limits, retrying transient failures"""
+        attempt = 0
+        while True:
+            started = self._admit(estimated_tokens)
+            released = False
+            try:
+                result = fn()
+            except Exception as e:
+                # _failed releases the slot, then may re-raise
+                released = True
+                error, delay = e, self._failed(started, e, attempt)
+            else:
+                released = True
+                self._succeeded(started)
+                return result
+            finally:
+                # KeyboardInterrupt, or a cancellation raised as a BaseException
+                if not released:
+                    self.concurrency.release(started)
+            self._sleep(delay, error)
+            attempt += 1
+
+    def stream(self, fn: Callable[[], Iterator[Any]], estimated_tokens: int = 0) -> Iterator[Any]:
+        """Like call() for a streamed completion; retried only until the first chunk arrives"""
+        attempt = 0
+        while True:
+            started = self._admit(estimated_tokens)
+            received = False
+            try:
+                for chunk in fn():
+                    received = True
+                    yield chunk
+            except Exception as e:
+                if received:
+                    self.concurrency.release(started, error_status(e) in THROTTLE_STATUSES)
+                    self._count("failed")
+                    raise
+                self._sleep(self._failed(started, e, attempt), e)
+                attempt += 1
+                continue
+            except BaseException:
+                # Consumer stopped early or the run was cancelled
+                self.concurrency.release(started)
+                raise
+            self._succeeded(started)
+            return
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """Charge the token bucket for the difference between estimated and actual usage"""
+        if self.tokens is not None and actual_tokens:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            cooldown = max(0.0, self._cooldown_until - time.monotonic())
+        counters["wait_seconds"] = round(counters["wait_seconds"], 3)
+        return {
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "max_concurrency": self.concurrency.max_limit,
+            "in_flight": self.concurrency.in_flight,
+            "requests_per_minute": self.requests.per_minute if self.requests is not None else None,
+            "tokens_per_minute": self.tokens.per_minute if self.tokens is not None else None,
+            "cooldown_seconds": round(cooldown, 3),
+            **counters,
+        }
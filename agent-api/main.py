@@ -1,33 +1,137 @@
-from fastapi import FastAPI, HTTPException, Depends
+import time
+
+# Compared with IMPORT_TIME_BUDGET_MS at startup
+_imports_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field
 from typing import Dict, Any, List, Optional
 from datetime import datetime
+import asyncio
+import json
 import logging
 import os
+import uuid
 
-from database import engine, get_db, Base
+from database import engine, get_db
 from models import AgentExecution
 from agent_executor import AgentExecutor
+from execution_control import BUDGET_EXCEEDED, CANCELLED, TIMED_OUT, CancelSignals, ExecutionCancelled
+from worker_pool import AgentWorkerPool, PoolSaturatedError
+from process_pool import create_process_pool
+from job_queue import create_job_queue
+from metrics import CACHE_LOOKUPS, register_runtime_collector, render, unregister_runtime_collector
+from step_events import TERMINAL_EVENTS, create_step_event_broker
+from model_registry import ModelRegistry
+from recording import recorder
+from tool_registry import load_plugins, tool_registry
+from pagination import next_page, page_query
+from group_commit import GroupCommitWriter
+from health import HealthProber
+from trace_store import TraceStore, load_steps
+from tracing import db_write, execution_span, read_trace, record_failure, setup_tracing, shutdown_tracing
+from task_memo import InflightRuns, find_by_idempotency_key, find_recent_execution, request_hash
+from worker import JobWorker, finish_execution, reap_periodically, update_execution
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import insert, select
+from startup import StartupState, check_schema, run_migrations
+
+IMPORT_SECONDS = time.perf_counter() - _imports_started
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def warm_up(app: FastAPI):
+    """
+    Build model clients and tools and start worker processes after the port
+    is open; /health/ready reports ready once this is done
+    """
+    state = app.state.startup
+    started = time.perf_counter()
+    try:
+        await check_schema(engine, state)
+        await asyncio.to_thread(app.state.models.warm_up)
+        await asyncio.to_thread(tool_registry.warm_up)
+        if app.state.processes:
+            await asyncio.to_thread(app.state.processes.start)
+        state.warmed_up = True
+    except Exception as e:
+        state.errors.append(f"warm-up failed: {e}")
+        logger.error(f"Warm-up failed: {e}", exc_info=True)
+    state.record("warm_up", time.perf_counter() - started)
+    logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
+
 # Lifespan context manager for startup/shutdown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Agent Platform API...")
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    logger.info("Database initialized")
+    app.state.startup = StartupState()
+    app.state.startup.check_import_budget(IMPORT_SECONDS)
+    # The schema is managed by Alembic (`alembic upgrade head`), not create_all
+    if os.getenv("DB_MIGRATE_ON_STARTUP", "false").lower() == "true":
+        await asyncio.to_thread(run_migrations)
+    setup_tracing()
+    app.state.worker_pool = AgentWorkerPool.from_env()
+    app.state.worker_pool.start()
+    app.state.processes = create_process_pool(app.state.worker_pool.max_workers)
+    app.state.step_events = create_step_event_broker()
+    app.state.inflight = InflightRuns()
+    # Execution and step inserts share one group-commit writer
+    app.state.writer = GroupCommitWriter.from_env()
+    app.state.traces = TraceStore(app.state.writer)
+    app.state.batch_tasks = set()
+    app.state.cancel_signals = CancelSignals.from_env()
+    app.state.models = ModelRegistry.from_env()
+    app.state.health = HealthProber.from_env(engine, app.state.models)
+    app.state.health.start()
+    load_plugins()
+    metrics_collector = register_runtime_collector(app.state.worker_pool, tool_registry)
+    
+    # Async job mode: with the in-process queue nobody else drains it, so the
+    # API runs the job worker itself; with Redis, worker processes do the work
+    app.state.job_queue = create_job_queue()
+    embedded_worker = None
+    if app.state.job_queue.backend == "memory" or os.getenv("EMBEDDED_JOB_WORKER", "false").lower() == "true":
+        embedded_worker = asyncio.create_task(
+            JobWorker(
+                app.state.job_queue,
+                app.state.worker_pool,
+                app.state.models,
+                app.state.step_events,
+                app.state.traces,
+                app.state.cancel_signals,
+                app.state.processes
+            ).run()
+        )
+    reaper = asyncio.create_task(
+        reap_periodically(float(os.getenv("EXECUTION_REAPER_INTERVAL_SECONDS", "60")))
+    )
+    warm_up_task = asyncio.create_task(warm_up(app))
+    app.state.startup.record("startup", time.perf_counter() - app.state.startup.started)
     yield
     # Shutdown
     logger.info("Shutting down Agent Platform API...")
+    warm_up_task.cancel()
+    reaper.cancel()
+    await app.state.health.close()
+    if embedded_worker:
+        embedded_worker.cancel()
+    await app.state.job_queue.close()
+    await app.state.step_events.close()
+    await app.state.writer.close()
+    app.state.cancel_signals.close()
+    unregister_runtime_collector(metrics_collector)
+    app.state.worker_pool.shutdown()
+    if app.state.processes:
+        await asyncio.to_thread(app.state.processes.shutdown)
+    app.state.models.close()
+    shutdown_tracing()
     await engine.dispose()
 
 app = FastAPI(
@@ -50,9 +154,14 @@ app.add_middleware(
 class AgentExecutionRequest(BaseModel):
     task: str = Field(..., description="The task for the agent to execute")
     tools: Optional[List[str]] = Field(default=None, description="List of tool names to enable")
-    model: Optional[str] = Field(default=None, description="LLM model to use")
+    model: Optional[str] = Field(default=None, description="LLM model, or routing tier, to use")
     max_steps: Optional[int] = Field(default=10, description="Maximum execution steps")
     metadata: Optional[Dict[str, Any]] = Field(default=None, description="Additional metadata")
+    async_mode: bool = Field(default=False, description="Queue the task and return 202 immediately instead of waiting for the result")
+    max_execution_time: Optional[int] = Field(default=None, ge=1, description="Wall-clock limit in seconds (capped by MAX_EXECUTION_TIME)")
+    max_tokens: Optional[int] = Field(default=None, ge=1, description="LLM token limit (capped by MAX_EXECUTION_TOKENS when set)")
+    memoize: bool = Field(default=False, description="Reuse a recent identical execution, or attach to one in flight, instead of running again")
+    memo_max_age_seconds: int = Field(default=int(os.getenv("MEMO_DEFAULT_MAX_AGE_SECONDS", "300")), ge=0, description="How old a reused completed execution may be when memoize is set")
 
 class AgentExecutionResponse(BaseModel):
     execution_id: str
@@ -60,14 +169,22 @@ class AgentExecutionResponse(BaseModel):
     result: Optional[str] = None
     error: Optional[str] = None
     steps: Optional[List[Dict[str, Any]]] = None
+    model: Optional[str] = None
+    routing: Optional[Dict[str, Any]] = None
     created_at: datetime
     completed_at: Optional[datetime] = None
 
+class AgentBatchRequest(BaseModel):
+    items: List[AgentExecutionRequest] = Field(..., min_length=1, description="Independent tasks to execute")
+    max_concurrency: Optional[int] = Field(default=None, ge=1, description="How many items may run at once (default: BATCH_MAX_CONCURRENCY)")
+    async_mode: bool = Field(default=False, description="Queue every item and return 202 with their execution ids instead of streaming results")
+
 class HealthResponse(BaseModel):
     status: str
     version: str
     database: str
     redis: str
+    ready: bool
 
 # Dependency for tenant isolation
 async def get_tenant_id() -> str:
@@ -93,26 +210,96 @@ async def get_tenant_id() -> str:
 # Health check endpoint
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint"""
-    try:
-        # Check database
-        async with engine.connect() as conn:
-            await conn.execute(select(1))
-        db_status = "healthy"
-    except Exception as e:
-        logger.error(f"Database health check failed: {e}")
-        db_status = "unhealthy"
-    
-    # TODO: Add Redis health check
-    redis_status = "healthy"
+    """
+    Health check endpoint
     
+    Answers from the background prober's latest snapshot; it never opens a
+    connection itself.
+    """
+    health = app.state.health
     return HealthResponse(
-        status="healthy" if db_status == "healthy" else "degraded",
+        status="healthy" if health.healthy else "degraded",
         version="1.0.0",
-        database=db_status,
-        redis=redis_status
+        database=health.status("database"),
+        redis=health.status("redis"),
+        ready=app.state.startup.warmed_up and app.state.startup.schema_current
     )
 
+# Dependency health details
+@app.get("/health/deps")
+async def health_dependencies():
+    """
+    Latest probe result and latency of each dependency (database, Redis,
+    LLM providers) and the utilization of the database connection pool
+    """
+    return app.state.health.snapshot()
+
+# Liveness probe
+@app.get("/health/live")
+async def liveness():
+    """The process is up and serving; never touches dependencies"""
+    return {"status": "alive"}
+
+# Readiness probe
+@app.get("/health/ready")
+async def readiness():
+    """
+    Ready to take traffic: warm-up is done, the last database probe passed
+    and the schema is at the latest migration. Returns 503 until then.
+    """
+    state = app.state.startup
+    db_status = app.state.health.status("database")
+    
+    # A migration may have been applied since the last check
+    if db_status == "healthy" and not state.schema_current:
+        await check_schema(engine, state)
+    
+    ready = state.warmed_up and state.schema_current and db_status == "healthy"
+    body = {"status": "ready" if ready else "not_ready", "database": db_status, **state.snapshot()}
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+# Prometheus metrics endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    content, content_type = render()
+    return Response(content=content, media_type=content_type)
+
+# Worker pool stats endpoint
+@app.get("/api/v1/pool/stats")
+async def get_pool_stats():
+    """
+    Get queue depth, active workers and queue wait times of the shared
+    agent worker pool. Useful for sizing pods and spotting overload.
+    In process mode, also reports the worker processes and their memory.
+    """
+    stats = app.state.worker_pool.stats()
+    if app.state.processes:
+        stats["processes"] = app.state.processes.stats()
+    return stats
+
+# Model registry stats endpoint
+@app.get("/api/v1/models/stats")
+async def get_model_stats():
+    """
+    Get the cached LLM models with their call counts and HTTP connection
+    pool usage (open and idle keep-alive connections). When recording or
+    replaying interactions, also reports the recorded, replayed and missed calls.
+    """
+    stats = app.state.models.stats()
+    if recorder.enabled:
+        stats["recording"] = recorder.stats()
+    return stats
+
+# Tool registry endpoint
+@app.get("/api/v1/tools")
+async def list_tools():
+    """
+    List the registered agent tools with their declared cost and sharing
+    mode, and whether the shared instance has been built yet.
+    """
+    return tool_registry.stats()
+
 # Omnistrate tenant info endpoint
 @app.get("/api/v1/tenant/info")
 async def get_tenant_info(tenant_id: str = Depends(get_tenant_id)):
@@ -139,8 +326,10 @@ async def get_tenant_info(tenant_id: str = Depends(get_tenant_id)):
 @app.post("/api/v1/agent/execute", response_model=AgentExecutionResponse)
 async def execute_agent(
     request: AgentExecutionRequest,
+    response: Response,
     tenant_id: str = Depends(get_tenant_id),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    idempotency_key: Optional[str] = Header(default=None)
 ):
     """
     Execute an agent task
@@ -153,63 +342,420 @@ async def execute_agent(
     - **model**: Optional LLM model override
     - **max_steps**: Maximum execution steps (default: 10)
     - **metadata**: Additional metadata to store
+    - **async_mode**: Return 202 with the execution_id right away and run the
+      task on a background worker; poll `/api/v1/agent/execution/{id}` for progress
+    - **memoize**: Return a completed identical execution from the last
+      `memo_max_age_seconds`, or attach to an identical one in flight
+    
+    Send an `Idempotency-Key` header to make client retries safe: a repeated
+    key returns the original execution instead of running the task again.
     """
     logger.info(f"Executing agent task for tenant {tenant_id}: {request.task[:100]}")
     
-    try:
-        # Create execution record
-        execution = AgentExecution(
-            tenant_id=tenant_id,
-            task=request.task,
-            status="running",
-            model=request.model or os.getenv("DEFAULT_MODEL"),
-            exec_metadata=request.metadata or {}
+    req_hash = request_hash(
+        tenant_id,
+        request.task,
+        request.tools,
+        request.model,
+        request.max_steps,
+        request.max_execution_time,
+        request.max_tokens
+    )
+    
+    if idempotency_key:
+        existing = await find_by_idempotency_key(db, tenant_id, idempotency_key)
+        if existing:
+            return await replay_execution(db, existing, req_hash, f"idempotency:{idempotency_key}", response)
+    
+    if request.memoize:
+        statuses = ("completed", "queued", "running") if request.async_mode else ("completed",)
+        recent = await find_recent_execution(db, tenant_id, req_hash, request.memo_max_age_seconds, statuses)
+        CACHE_LOOKUPS.labels("memo", "hit" if recent else "miss").inc()
+        if recent:
+            logger.info(f"Reusing execution {recent.id} for identical task")
+            response.headers["X-Memoized-Execution"] = "true"
+            if recent.status != "completed":
+                response.status_code = 202
+            return await execution_response(db, recent)
+    
+    if request.async_mode:
+        return await enqueue_execution(request, response, tenant_id, db, req_hash, idempotency_key)
+    
+    if not (request.memoize or idempotency_key):
+        return await run_execution(request, tenant_id, db, req_hash)
+    
+    # Concurrent identical requests in this process share one run
+    key = f"idempotency:{idempotency_key}" if idempotency_key else f"memo:{req_hash}"
+    return await app.state.inflight.run(
+        key, lambda: run_execution(request, tenant_id, db, req_hash, idempotency_key)
+    )
+
+async def replay_execution(
+    db: AsyncSession,
+    execution: AgentExecution,
+    req_hash: str,
+    inflight_key: str,
+    response: Response
+) -> AgentExecutionResponse:
+    """Answer a retried Idempotency-Key with the execution it created"""
+    if execution.request_hash and execution.request_hash != req_hash:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request"
         )
-        db.add(execution)
-        await db.commit()
-        await db.refresh(execution)
+    
+    response.headers["Idempotent-Replayed"] = "true"
+    if app.state.inflight.is_running(inflight_key):
+        return await app.state.inflight.run(inflight_key, None)
+    if execution.status in ("queued", "running"):
+        response.status_code = 202
+    return await execution_response(db, execution)
+
+async def execution_response(db: AsyncSession, execution: AgentExecution) -> AgentExecutionResponse:
+    return AgentExecutionResponse(
+        execution_id=execution.id,
+        status=execution.status,
+        result=execution.result,
+        error=execution.error,
+        steps=await execution_steps(db, execution),
+        created_at=execution.created_at,
+        completed_at=execution.completed_at
+    )
+
+async def execution_steps(
+    db: AsyncSession,
+    execution: AgentExecution,
+    steps_from: int = 0,
+    limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Stored steps of an execution, falling back to the legacy inline trace"""
+    steps = (await load_steps(db, execution.tenant_id, [execution.id], steps_from, limit))[execution.id]
+    if not steps and execution.steps:
+        steps = [step for step in execution.steps if (step.get("step") or 0) >= steps_from][:limit]
+    return steps
+
+async def run_execution(
+    request: AgentExecutionRequest,
+    tenant_id: str,
+    db: AsyncSession,
+    req_hash: str,
+    idempotency_key: Optional[str] = None
+) -> AgentExecutionResponse:
+    """Run an agent task synchronously and record its outcome"""
+    # Admit the run onto the shared worker pool before touching the database,
+    # so an overloaded pod rejects quickly instead of queueing unbounded work
+    execution_id = str(uuid.uuid4())
+    executor = AgentExecutor(
+        tenant_id=tenant_id,
+        pool=app.state.worker_pool,
+        models=app.state.models,
+        events=app.state.step_events,
+        traces=app.state.traces,
+        signals=app.state.cancel_signals,
+        processes=app.state.processes
+    )
+    with execution_span(execution_id, tenant_id, **{"execution.mode": "sync"}):
+        try:
+            pending = executor.submit(
+                task=request.task,
+                tools=request.tools,
+                model=request.model,
+                max_steps=request.max_steps,
+                execution_id=execution_id,
+                max_execution_time=request.max_execution_time,
+                max_tokens=request.max_tokens
+            )
+        except PoolSaturatedError as e:
+            logger.warning(f"Rejecting agent task for tenant {tenant_id}: {e}")
+            raise HTTPException(
+                status_code=e.status_code,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)}
+            )
         
-        # Execute agent
-        executor = AgentExecutor(tenant_id=tenant_id)
-        result = await executor.execute(
-            task=request.task,
-            tools=request.tools,
-            model=request.model,
-            max_steps=request.max_steps
+        # Batched with other inserts by the group-commit writer; the id and
+        # timestamps are set here, so nothing needs to be read back
+        created_at = datetime.utcnow()
+        inserted = app.state.writer.add(
+            AgentExecution,
+            {
+                "id": execution_id,
+                "tenant_id": tenant_id,
+                "task": request.task,
+                "status": "running",
+                "model": request.model or os.getenv("DEFAULT_MODEL"),
+                "exec_metadata": request.metadata or {},
+                "request_hash": req_hash,
+                "idempotency_key": idempotency_key,
+                "created_at": created_at,
+                "started_at": created_at
+            },
+            key=execution_id
         )
+        # Lookups above may hold a pooled connection; release it for the run
+        await db.close()
+        try:
+            await inserted
+        except IntegrityError:
+            pending.cancel()
+            # Steps the run stored before it stopped
+            await app.state.traces.flush(execution_id)
+            if not idempotency_key:
+                raise
+            # Another replica recorded the same Idempotency-Key first
+            return await execution_response(db, await find_by_idempotency_key(db, tenant_id, idempotency_key))
+        except Exception:
+            pending.cancel()
+            await app.state.traces.flush(execution_id)
+            raise
         
-        # Update execution record
-        execution.status = "completed"
-        execution.result = result["output"]
-        execution.steps = result.get("steps", [])
-        execution.completed_at = datetime.utcnow()
-        await db.commit()
+        try:
+            # Wait for the agent run
+            result = await pending
+        except ExecutionCancelled as e:
+            logger.warning(f"Agent execution {execution_id} stopped: {e}")
+            await finish_execution(executor, app.state.traces, execution_id, error=e)
+            if e.status == TIMED_OUT:
+                raise HTTPException(status_code=504, detail=f"Agent execution timed out: {str(e)}")
+            if e.status == BUDGET_EXCEEDED:
+                # A quota stop, not a latency problem; retrying as is stops again
+                raise HTTPException(status_code=409, detail=f"Agent execution exceeded its token budget: {str(e)}")
+            raise HTTPException(status_code=409, detail=f"Agent execution was cancelled: {str(e)}")
+        except Exception as e:
+            logger.error(f"Agent execution failed: {e}", exc_info=True)
+            record_failure(e)
+            await finish_execution(executor, app.state.traces, execution_id, error=e)
+            raise HTTPException(status_code=500, detail=f"Agent execution failed: {str(e)}")
         
-        return AgentExecutionResponse(
-            execution_id=execution.id,
-            status=execution.status,
-            result=execution.result,
-            steps=execution.steps,
-            created_at=execution.created_at,
-            completed_at=execution.completed_at
+        await finish_execution(
+            executor, app.state.traces, execution_id, output=result["output"], routing=result.get("routing")
         )
         
+        return AgentExecutionResponse(
+            execution_id=execution_id,
+            status="completed",
+            result=result["output"],
+            steps=result.get("steps", []),
+            model=result.get("model"),
+            routing=result.get("routing"),
+            created_at=created_at,
+            completed_at=datetime.utcnow()
+        )
+
+async def enqueue_execution(
+    request: AgentExecutionRequest,
+    response: Response,
+    tenant_id: str,
+    db: AsyncSession,
+    req_hash: str,
+    idempotency_key: Optional[str] = None
+) -> AgentExecutionResponse:
+    """Record a queued execution and hand it to the background workers"""
+    execution_id = str(uuid.uuid4())
+    created_at = datetime.utcnow()
+    inserted = app.state.writer.add(
+        AgentExecution,
+        {
+            "id": execution_id,
+            "tenant_id": tenant_id,
+            "task": request.task,
+            "status": "queued",
+            "model": request.model or os.getenv("DEFAULT_MODEL"),
+            "exec_metadata": request.metadata or {},
+            "request_hash": req_hash,
+            "idempotency_key": idempotency_key,
+            "created_at": created_at,
+            "started_at": None
+        }
+    )
+    try:
+        await inserted
+    except IntegrityError:
+        if not idempotency_key:
+            raise
+        # Another replica recorded the same Idempotency-Key first
+        existing = await find_by_idempotency_key(db, tenant_id, idempotency_key)
+        return await replay_execution(db, existing, req_hash, f"idempotency:{idempotency_key}", response)
+    
+    try:
+        await app.state.job_queue.enqueue({
+            "execution_id": execution_id,
+            "tenant_id": tenant_id,
+            "task": request.task,
+            "tools": request.tools,
+            "model": request.model,
+            "max_steps": request.max_steps,
+            "max_execution_time": request.max_execution_time,
+            "max_tokens": request.max_tokens
+        })
     except Exception as e:
-        logger.error(f"Agent execution failed: {e}", exc_info=True)
-        
-        # Update execution record with error
-        execution.status = "failed"
-        execution.error = str(e)
-        execution.completed_at = datetime.utcnow()
+        logger.error(f"Failed to enqueue execution {execution_id}: {e}", exc_info=True)
+        await update_execution(
+            execution_id,
+            tenant_id,
+            status="failed",
+            error=f"Failed to enqueue execution: {str(e)}",
+            completed_at=datetime.utcnow()
+        )
+        raise HTTPException(status_code=503, detail="Agent job queue unavailable")
+    
+    response.status_code = 202
+    return AgentExecutionResponse(
+        execution_id=execution_id,
+        status="queued",
+        created_at=created_at
+    )
+
+# Execute a batch of agent tasks
+@app.post("/api/v1/agent/execute/batch")
+async def execute_agent_batch(
+    batch: AgentBatchRequest,
+    tenant_id: str = Depends(get_tenant_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Execute many independent agent tasks in one request
+    
+    All execution records are inserted in a single statement. Items run with
+    at most `max_concurrency` in flight and results are streamed back as
+    newline-delimited JSON, one line per item in completion order:
+    `{"index", "execution_id", "status", "result", "error"}`. A failing item
+    does not affect the others. Fetch an item's steps with
+    `/api/v1/agent/execution/{id}?include=steps`.
+    
+    With `async_mode` every item is queued instead, and the response is
+    `202 Accepted` with the list of execution handles in request order.
+    Per-item `async_mode`, `memoize` and `Idempotency-Key` do not apply here.
+    """
+    max_items = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+    if len(batch.items) > max_items:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {max_items} items")
+    
+    logger.info(f"Executing batch of {len(batch.items)} agent tasks for tenant {tenant_id}")
+    
+    now = datetime.utcnow()
+    status = "queued" if batch.async_mode else "running"
+    rows = [
+        {
+            "id": str(uuid.uuid4()),
+            "tenant_id": tenant_id,
+            "task": item.task,
+            "status": status,
+            "model": item.model or os.getenv("DEFAULT_MODEL"),
+            "exec_metadata": item.metadata or {},
+            "request_hash": request_hash(
+                tenant_id, item.task, item.tools, item.model, item.max_steps, item.max_execution_time, item.max_tokens
+            ),
+            "created_at": now,
+            "started_at": None if batch.async_mode else now
+        }
+        for item in batch.items
+    ]
+    with db_write("bulk_insert"):
+        await db.execute(insert(AgentExecution), rows)
         await db.commit()
-        
-        raise HTTPException(status_code=500, detail=f"Agent execution failed: {str(e)}")
+    
+    if batch.async_mode:
+        return await enqueue_batch(batch, rows, tenant_id)
+    
+    executor = AgentExecutor(
+        tenant_id=tenant_id,
+        pool=app.state.worker_pool,
+        models=app.state.models,
+        events=app.state.step_events,
+        traces=app.state.traces,
+        signals=app.state.cancel_signals,
+        processes=app.state.processes
+    )
+    semaphore = asyncio.Semaphore(
+        batch.max_concurrency or int(os.getenv("BATCH_MAX_CONCURRENCY", str(app.state.worker_pool.max_workers)))
+    )
+    tasks = []
+    for index, (item, row) in enumerate(zip(batch.items, rows)):
+        task = asyncio.create_task(run_batch_item(index, item, row["id"], executor, semaphore))
+        # Items keep running and record their outcome even if the client disconnects
+        app.state.batch_tasks.add(task)
+        task.add_done_callback(app.state.batch_tasks.discard)
+        tasks.append(task)
+    
+    async def results():
+        for completed in asyncio.as_completed(tasks):
+            yield json.dumps(await completed, default=str) + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+async def run_batch_item(
+    index: int,
+    item: AgentExecutionRequest,
+    execution_id: str,
+    executor: AgentExecutor,
+    semaphore: asyncio.Semaphore
+) -> Dict[str, Any]:
+    """Run one batch item to completion and record its outcome"""
+    async with semaphore:
+        with execution_span(execution_id, executor.tenant_id, **{"execution.mode": "batch"}):
+            try:
+                result = await executor.submit(
+                    task=item.task,
+                    tools=item.tools,
+                    model=item.model,
+                    max_steps=item.max_steps,
+                    execution_id=execution_id,
+                    max_execution_time=item.max_execution_time,
+                    max_tokens=item.max_tokens
+                )
+            except Exception as e:
+                if isinstance(e, ExecutionCancelled):
+                    logger.warning(f"Batch item {index} ({execution_id}) stopped: {e}")
+                else:
+                    logger.error(f"Batch item {index} ({execution_id}) failed: {e}", exc_info=True)
+                    record_failure(e)
+                status = await finish_execution(executor, app.state.traces, execution_id, error=e)
+                outcome = {"status": status, "result": None, "error": str(e)}
+            else:
+                await finish_execution(
+                    executor, app.state.traces, execution_id, output=result["output"], routing=result.get("routing")
+                )
+                outcome = {"status": "completed", "result": result["output"], "error": None}
+    
+    return {"index": index, "execution_id": execution_id, **outcome}
+
+async def enqueue_batch(
+    batch: AgentBatchRequest,
+    rows: List[Dict[str, Any]],
+    tenant_id: str
+) -> JSONResponse:
+    """Hand already recorded batch items to the background workers"""
+    handles = []
+    for item, row in zip(batch.items, rows):
+        try:
+            await app.state.job_queue.enqueue({
+                "execution_id": row["id"],
+                "tenant_id": tenant_id,
+                "task": item.task,
+                "tools": item.tools,
+                "model": item.model,
+                "max_steps": item.max_steps,
+                "max_execution_time": item.max_execution_time,
+                "max_tokens": item.max_tokens
+            })
+            handles.append({"execution_id": row["id"], "status": "queued", "error": None})
+        except Exception as e:
+            logger.error(f"Failed to enqueue execution {row['id']}: {e}", exc_info=True)
+            error = f"Failed to enqueue execution: {str(e)}"
+            await update_execution(row["id"], tenant_id, status="failed", error=error, completed_at=datetime.utcnow())
+            handles.append({"execution_id": row["id"], "status": "failed", "error": error})
+    
+    return JSONResponse(content=handles, status_code=202)
 
 # Get execution status
 @app.get("/api/v1/agent/execution/{execution_id}", response_model=AgentExecutionResponse)
 async def get_execution_status(
     execution_id: str,
     tenant_id: str = Depends(get_tenant_id),
+    include: Optional[str] = None,
+    steps_from: int = Query(default=0, ge=0),
+    steps_limit: Optional[int] = Query(default=None, ge=1),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -217,6 +763,9 @@ async def get_execution_status(
     
     Tenant ID is automatically determined from Omnistrate system parameters.
     Only returns executions for the current tenant.
+    
+    Steps are only loaded with `include=steps`; `steps_from` and `steps_limit`
+    select a range of step numbers, so pollers can fetch just the new steps.
     """
     result = await db.execute(
         select(AgentExecution).where(
@@ -229,49 +778,239 @@ async def get_execution_status(
     if not execution:
         raise HTTPException(status_code=404, detail="Execution not found")
     
+    steps = None
+    if include and "steps" in include.split(","):
+        steps = await execution_steps(db, execution, steps_from, steps_limit)
+    
     return AgentExecutionResponse(
         execution_id=execution.id,
         status=execution.status,
         result=execution.result,
         error=execution.error,
-        steps=execution.steps,
+        steps=steps,
+        model=execution.model,
+        routing=execution.routing,
         created_at=execution.created_at,
         completed_at=execution.completed_at
     )
 
+# Stream execution steps
+@app.get("/api/v1/agent/execution/{execution_id}/events")
+async def stream_execution_events(
+    execution_id: str,
+    tenant_id: str = Depends(get_tenant_id),
+    db: AsyncSession = Depends(get_db),
+    last_event_id: Optional[int] = Header(default=None)
+):
+    """
+    Stream the steps of an agent execution as Server-Sent Events.
+    
+    Each `step` event carries the generated code, tool calls, observations,
+    timing and token usage of one agent step as soon as it finishes. The
+    stream ends with a `final` or `error` event. Reconnecting clients can
+    send `Last-Event-ID` to resume after the last event they received.
+    """
+    result = await db.execute(
+        select(AgentExecution).where(
+            AgentExecution.id == execution_id,
+            AgentExecution.tenant_id == tenant_id
+        )
+    )
+    execution = result.scalar_one_or_none()
+    
+    if not execution:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    
+    async def finished_events(steps):
+        # Runs that already ended are replayed from the stored record
+        for step in steps:
+            yield {"type": "step", **step}
+        if execution.status == "completed":
+            yield {"type": "final", "output": execution.result}
+        else:
+            yield {"type": "error", "error": execution.error}
+    
+    if execution.status not in ("queued", "running"):
+        events = finished_events(await execution_steps(db, execution))
+    else:
+        events = app.state.step_events.subscribe(execution_id, after_seq=last_event_id or 0)
+    
+    async def event_stream():
+        seq = 0
+        async for event in events:
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            seq = event.pop("seq", seq + 1)
+            yield f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+            if event["type"] in TERMINAL_EVENTS:
+                break
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Cancel an execution
+@app.delete("/api/v1/agent/execution/{execution_id}", response_model=AgentExecutionResponse)
+async def cancel_execution(
+    execution_id: str,
+    tenant_id: str = Depends(get_tenant_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Cancel a queued or running agent execution.
+    
+    The record is marked `cancelled` right away. A queued run is never
+    started; a running one stops at its next step, LLM call or tool call and
+    releases its worker, on whichever replica runs it.
+    """
+    result = await db.execute(
+        select(AgentExecution).where(
+            AgentExecution.id == execution_id,
+            AgentExecution.tenant_id == tenant_id
+        )
+    )
+    execution = result.scalar_one_or_none()
+    
+    if not execution:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    
+    was_queued = execution.status == "queued"
+    cancelled = await update_execution(
+        execution_id,
+        tenant_id,
+        where_status=("queued", "running"),
+        status=CANCELLED,
+        error="Execution was cancelled",
+        completed_at=datetime.utcnow()
+    )
+    await db.refresh(execution)
+    if not cancelled:
+        raise HTTPException(status_code=409, detail=f"Execution already {execution.status}")
+    
+    logger.info(f"Cancelled execution {execution_id} for tenant {tenant_id}")
+    await asyncio.to_thread(app.state.cancel_signals.cancel, execution_id)
+    if was_queued:
+        # No run will publish a terminal event for it
+        app.state.step_events.publish(execution_id, {"type": "error", "error": execution.error})
+    
+    return AgentExecutionResponse(
+        execution_id=execution.id,
+        status=execution.status,
+        error=execution.error,
+        created_at=execution.created_at,
+        completed_at=execution.completed_at
+    )
+
+# Fetch the recorded trace of an execution
+@app.get("/api/v1/agent/execution/{execution_id}/trace")
+async def get_execution_trace(
+    execution_id: str,
+    tenant_id: str = Depends(get_tenant_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get the spans recorded for an agent execution, ordered by start time.
+    
+    Requires the file trace exporter (TRACE_EXPORTER=file). The trace id is
+    the execution id without dashes, so the same trace can be looked up in
+    an OTLP backend as well.
+    """
+    result = await db.execute(
+        select(AgentExecution.id).where(
+            AgentExecution.id == execution_id,
+            AgentExecution.tenant_id == tenant_id
+        )
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    
+    spans = await asyncio.to_thread(read_trace, execution_id)
+    if spans is None:
+        raise HTTPException(status_code=404, detail="No trace recorded for this execution")
+    
+    return {"execution_id": execution_id, "trace_id": uuid.UUID(execution_id).hex, "spans": spans}
+
 # List executions for tenant
 @app.get("/api/v1/agent/executions", response_model=List[AgentExecutionResponse])
 async def list_executions(
+    response: Response,
     tenant_id: str = Depends(get_tenant_id),
-    limit: int = 50,
+    limit: int = Query(default=50, ge=1, le=500),
+    cursor: Optional[str] = None,
     offset: int = 0,
+    status: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    include: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
     """
-    List agent executions for the current tenant.
+    List agent executions for the current tenant, newest first.
     
     Tenant ID is automatically determined from Omnistrate system parameters.
+    
+    - **cursor**: Value of the previous page's `X-Next-Cursor` header; the
+      header is absent on the last page. Prefer it over `offset`, which gets
+      slower the deeper the page
+    - **status**: Comma-separated statuses to keep, e.g. `running,queued`
+    - **created_after** / **created_before**: ISO 8601 time range
+    - **include**: Comma-separated large fields to return (`steps`, `result`);
+      they are left out by default
     """
-    result = await db.execute(
-        select(AgentExecution)
-        .where(AgentExecution.tenant_id == tenant_id)
-        .order_by(AgentExecution.created_at.desc())
-        .limit(limit)
-        .offset(offset)
-    )
-    executions = result.scalars().all()
+    included = set(filter(None, (f.strip() for f in (include or "").split(","))))
+    unknown = included - {"steps", "result"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include fields: {', '.join(sorted(unknown))}")
+    
+    columns = [
+        AgentExecution.id,
+        AgentExecution.status,
+        AgentExecution.error,
+        AgentExecution.created_at,
+        AgentExecution.completed_at,
+    ]
+    if "result" in included:
+        columns.append(AgentExecution.result)
+    if "steps" in included:
+        columns.append(AgentExecution.steps)
+    
+    query = select(*columns).where(AgentExecution.tenant_id == tenant_id)
+    if status:
+        query = query.where(AgentExecution.status.in_([s.strip() for s in status.split(",")]))
+    if created_after:
+        query = query.where(AgentExecution.created_at >= created_after)
+    if created_before:
+        query = query.where(AgentExecution.created_at < created_before)
+    if offset and not cursor:
+        query = query.offset(offset)
+    try:
+        query = page_query(query, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    result = await db.execute(query)
+    rows, next_cursor = next_page(result.all(), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    steps = {}
+    if "steps" in included and rows:
+        steps = await load_steps(db, tenant_id, [row.id for row in rows])
     
     return [
         AgentExecutionResponse(
-            execution_id=execution.id,
-            status=execution.status,
-            result=execution.result,
-            error=execution.error,
-            steps=execution.steps,
-            created_at=execution.created_at,
-            completed_at=execution.completed_at
+            execution_id=row.id,
+            status=row.status,
+            result=row.result if "result" in included else None,
+            error=row.error,
+            steps=(steps[row.id] or row.steps) if "steps" in included else None,
+            created_at=row.created_at,
+            completed_at=row.completed_at
         )
-        for execution in executions
+        for row in rows
     ]
 
 if __name__ == "__main__":
@@ -0,0 +1,134 @@
+"""
+Agent Memory Compaction
+
+smolagents rebuilds the prompt from the whole agent memory at every step,
+so long observations (e.g. visited web pages) are re-sent on every later
+step and prompt size grows with each one. The compactor replaces the
+agent's `write_memory_to_messages` to send a compacted view instead; the
+memory itself, and so the stored execution trace, keeps everything.
+
+- Every observation is capped at AGENT_MEMORY_MAX_OBSERVATION_TOKENS.
+- Steps older than the last AGENT_MEMORY_KEEP_RECENT_STEPS have their
+  observations cut to AGENT_MEMORY_OLD_OBSERVATION_TOKENS and lose the
+  "Calling tools" message, which for code agents repeats the code already
+  in the step's model output.
+
+Cut text keeps its beginning and end around an omission marker. Lengths
+are counted with the model's tokenizer (LiteLLM's, falling back to its
+default encoding). Set AGENT_MEMORY_COMPACTION=false to send full memory.
+"""
+
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCompactor:
+    """Builds compacted prompts for one agent run"""
+
+    def __init__(
+        self,
+        model_id: str,
+        keep_recent_steps: int = 2,
+        max_observation_tokens: int = 2000,
+        old_observation_tokens: int = 200,
+    ):
+        self.model_id = model_id
+        self.keep_recent_steps = keep_recent_steps
+        self.max_observation_tokens = max_observation_tokens
+        self.old_observation_tokens = old_observation_tokens
+        # Tokens left out of the most recent prompt
+        self.saved_tokens = 0
+        # (step number, limit) -> (text, tokens saved); old observations are cut once, not every step
+        self._cache: Dict[Tuple[int, int], Tuple[str, int]] = {}
+
+    @classmethod
+    def from_env(cls, model_id: str) -> Optional["MemoryCompactor"]:
+        """A compactor configured from the environment, or None when compaction is off"""
+        if os.getenv("AGENT_MEMORY_COMPACTION", "true").lower() != "true":
+            return None
+        return cls(
+            model_id,
+            keep_recent_steps=int(os.getenv("AGENT_MEMORY_KEEP_RECENT_STEPS", "2")),
+            max_observation_tokens=int(os.getenv("AGENT_MEMORY_MAX_OBSERVATION_TOKENS", "2000")),
+            old_observation_tokens=int(os.getenv("AGENT_MEMORY_OLD_OBSERVATION_TOKENS", "200")),
+        )
+
+    def attach(self, agent: Any):
+        """Make the agent build its prompts through this compactor"""
+        agent.write_memory_to_messages = lambda summary_mode=False: self.messages(agent, summary_mode)
+
+    def messages(self, agent: Any, summary_mode: bool = False) -> List[Any]:
+        """Same messages as MultiStepAgent.write_memory_to_messages, from compacted steps"""
+        from smolagents import ActionStep
+
+        action_steps = [step for step in agent.memory.steps if isinstance(step, ActionStep)]
+        recent = {id(step) for step in action_steps[-self.keep_recent_steps:]} if self.keep_recent_steps else set()
+
+        self.saved_tokens = 0
+        messages = agent.memory.system_prompt.to_messages(summary_mode=summary_mode)
+        for step in agent.memory.steps:
+            if isinstance(step, ActionStep):
+                step = self._compact(step, old=id(step) not in recent)
+            messages.extend(step.to_messages(summary_mode=summary_mode))
+        return messages
+
+    def _compact(self, step: Any, old: bool) -> Any:
+        changes: Dict[str, Any] = {}
+        if step.observations:
+            limit = self.old_observation_tokens if old else self.max_observation_tokens
+            observations, saved = self._truncated(step.step_number, step.observations, limit)
+            if saved:
+                changes["observations"] = observations
+                self.saved_tokens += saved
+        # A code agent's tool call repeats the step's code; error messages still
+        # need its call id. Tool-calling agents' calls carry the only record of
+        # what was requested, so they are kept.
+        if old and step.tool_calls and step.error is None and step.code_action:
+            changes["tool_calls"] = None
+        return replace(step, **changes) if changes else step
+
+    def _truncated(self, step_number: int, text: str, limit: int) -> Tuple[str, int]:
+        key = (step_number, limit)
+        if key not in self._cache:
+            self._cache[key] = self.truncate(text, limit)
+        return self._cache[key]
+
+    def truncate(self, text: str, limit: int) -> Tuple[str, int]:
+        """Cut `text` to at most `limit` tokens, keeping its start and end; returns (text, tokens removed)"""
+        import litellm
+
+        # A token spans at least one character, so short text always fits
+        if len(text) <= limit:
+            return text, 0
+        tokens = litellm.encode(model=self.model_id, text=text)
+        if len(tokens) <= limit:
+            return text, 0
+        # The omission marker counts toward the limit too
+        keep = limit - self._count(self._marker(len(tokens)))
+        while True:
+            head = max(0, keep) * 2 // 3
+            tail = max(0, keep) - head
+            omitted = len(tokens) - head - tail
+            cut = (
+                (litellm.decode(model=self.model_id, tokens=tokens[:head]) if head else "")
+                + self._marker(omitted)
+                + (litellm.decode(model=self.model_id, tokens=tokens[-tail:]) if tail else "")
+            )
+            # Text decoded from a token slice can re-encode a little longer at the joins
+            over = self._count(cut) - limit
+            if over <= 0 or keep <= 0:
+                return cut, len(tokens) - self._count(cut)
+            keep -= over
+
+    def _count(self, text: str) -> int:
+        import litellm
+
+        return len(litellm.encode(model=self.model_id, text=text))
+
+    @staticmethod
+    def _marker(omitted: int) -> str:
+        return f"\n[... {omitted} tokens omitted ...]\n"
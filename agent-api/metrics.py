@@ -0,0 +1,114 @@
+"""
+Prometheus Metrics
+
+Latency histograms for each phase of an execution (DB writes, model setup,
+agent run, steps, tool calls, queue waits), token and outcome counters, and
+collectors that read worker-pool and tool-cache state at scrape time.
+
+Labels are limited to bounded values: model id, tool name, queue, status.
+Tenant and execution ids are never used as labels.
+"""
+
+from typing import Iterable
+import logging
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Agent runs take seconds to minutes; the default buckets stop at 10s
+RUN_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+DB_WRITE_SECONDS = Histogram(
+    "agent_db_write_seconds", "Execution record write time, including commit", ["operation"]
+)
+DB_BATCH_ROWS = Histogram(
+    "agent_db_batch_rows", "Rows written per group-commit transaction",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 200, 500)
+)
+MODEL_SETUP_SECONDS = Histogram(
+    "agent_model_setup_seconds", "Time to get the model and tools and build the agent"
+)
+AGENT_RUN_SECONDS = Histogram(
+    "agent_run_seconds", "Total agent.run time", ["model"], buckets=RUN_BUCKETS
+)
+STEP_SECONDS = Histogram(
+    "agent_step_seconds", "Duration of one agent step", ["model"], buckets=RUN_BUCKETS
+)
+TOOL_CALL_SECONDS = Histogram(
+    "agent_tool_call_seconds", "Duration of one tool call", ["tool"]
+)
+LLM_LIMITER_WAIT_SECONDS = Histogram(
+    "agent_llm_limiter_wait_seconds", "Time an LLM call waited on rate limits, cooldowns or backoff", ["model"]
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "agent_queue_wait_seconds", "Time a task waited before running", ["queue"], buckets=RUN_BUCKETS
+)
+
+# direction: input (cached ones included), output, cached_input, cache_write
+LLM_TOKENS = Counter("agent_llm_tokens", "LLM tokens used", ["model", "direction"])
+EXECUTIONS = Counter("agent_executions", "Finished agent runs", ["status"])
+CACHE_LOOKUPS = Counter("agent_cache_lookups", "Cache lookups outside the tool caches", ["cache", "result"])
+LLM_RETRIES = Counter("agent_llm_retries", "Retried LLM calls", ["model", "reason"])
+PROCESS_RESTARTS = Counter("agent_process_restarts", "Agent worker process replacements", ["reason"])
+
+IN_FLIGHT = Gauge("agent_executions_in_flight", "Agent runs currently executing")
+STARTUP_SECONDS = Gauge("agent_startup_seconds", "Duration of each startup phase", ["phase"])
+DEPENDENCY_UP = Gauge("agent_dependency_up", "Whether the last health probe of a dependency passed", ["dependency"])
+DEPENDENCY_LATENCY_SECONDS = Gauge(
+    "agent_dependency_latency_seconds", "Duration of the last health probe of a dependency", ["dependency"]
+)
+LLM_CONCURRENCY_LIMIT = Gauge("agent_llm_concurrency_limit", "Adaptive limit on concurrent LLM calls", ["model"])
+DB_POOL_CONNECTIONS = Gauge("agent_db_pool_connections", "Database pool connections at the last health probe", ["state"])
+
+# Tool cache stats counters exported by the tool collector
+TOOL_CACHE_EVENTS = ("hits", "shared_hits", "misses", "coalesced", "revalidated", "errors", "evictions")
+
+
+class RuntimeCollector:
+    """Reads worker pool and tool registry state when Prometheus scrapes"""
+
+    def __init__(self, pool, tools):
+        self.pool = pool
+        self.tools = tools
+
+    def collect(self) -> Iterable:
+        stats = self.pool.stats()
+        for name, help_text in (
+            ("max_workers", "Worker pool size"),
+            ("active_workers", "Busy pool workers"),
+            ("queue_depth", "Tasks waiting for a pool worker"),
+            ("utilization", "Busy workers / pool size"),
+        ):
+            yield GaugeMetricFamily(f"agent_pool_{name}", help_text, value=stats[name])
+
+        tasks = CounterMetricFamily("agent_pool_tasks", "Pool task outcomes", labels=["outcome"])
+        for outcome in ("submitted", "rejected", "completed", "failed", "cancelled"):
+            tasks.add_metric([outcome], stats[outcome])
+        yield tasks
+
+        cache = CounterMetricFamily("agent_tool_cache_events", "Tool cache activity", labels=["tool", "event"])
+        for tool in self.tools.stats()["tools"]:
+            for event in TOOL_CACHE_EVENTS:
+                if event in tool.get("stats", {}):
+                    cache.add_metric([tool["name"], event], tool["stats"][event])
+        yield cache
+
+
+def register_runtime_collector(pool, tools) -> RuntimeCollector:
+    collector = RuntimeCollector(pool, tools)
+    REGISTRY.register(collector)
+    return collector
+
+
+def unregister_runtime_collector(collector: RuntimeCollector):
+    try:
+        REGISTRY.unregister(collector)
+    except KeyError:
+        pass
+
+
+def render() -> tuple:
+    """Current metrics in the Prometheus text format, with its content type"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,66 @@
+"""
+Alembic environment
+
+Migrates the database in DATABASE_URL using the app's async engine settings.
+On PostgreSQL, concurrent `alembic upgrade` runs (e.g. several replicas
+starting at once) are serialized with an advisory lock.
+"""
+
+from logging.config import fileConfig
+import asyncio
+
+from alembic import context
+from sqlalchemy import pool, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database import DATABASE_URL, Base
+import models  # noqa: F401 - registers the tables on Base.metadata
+
+config = context.config
+
+# Leave logging alone when migrations run inside the API process
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# Arbitrary key for pg_advisory_xact_lock, shared by every replica
+MIGRATION_LOCK_ID = 72_310_017
+
+
+def run_migrations_offline() -> None:
+    """Emit the migration SQL without connecting (`alembic upgrade head --sql`)"""
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    engine = create_async_engine(DATABASE_URL, poolclass=pool.NullPool)
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_async_migrations())
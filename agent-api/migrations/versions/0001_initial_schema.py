@@ -0,0 +1,114 @@
+"""Initial schema: agent_executions and agent_execution_steps
+
+Databases created by the old startup `create_all` are brought up to date
+instead of failing: existing tables are kept and only missing columns,
+indexes and constraints are added (create_all never altered tables, so
+older deployments lack the newer columns).
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _added_execution_columns():
+    """Columns added to agent_executions after the first release"""
+    return [
+        sa.Column("request_hash", sa.String(), nullable=True),
+        sa.Column("idempotency_key", sa.String(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+    ]
+
+
+def _create_executions():
+    op.create_table(
+        "agent_executions",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("tenant_id", sa.String(), nullable=False),
+        sa.Column("task", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("result", sa.Text(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("model", sa.String(), nullable=True),
+        sa.Column("steps", sa.JSON(), nullable=True),
+        sa.Column("exec_metadata", sa.JSON(), nullable=True),
+        *_added_execution_columns(),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+        sa.UniqueConstraint("tenant_id", "idempotency_key", name="uq_agent_executions_tenant_idempotency_key"),
+    )
+
+
+def _upgrade_executions(inspector):
+    columns = {column["name"] for column in inspector.get_columns("agent_executions")}
+    constraints = {c["name"] for c in inspector.get_unique_constraints("agent_executions")}
+    missing = [column for column in _added_execution_columns() if column.name not in columns]
+    if not missing and "uq_agent_executions_tenant_idempotency_key" in constraints:
+        return
+    with op.batch_alter_table("agent_executions") as batch:
+        for column in missing:
+            batch.add_column(column)
+        if "uq_agent_executions_tenant_idempotency_key" not in constraints:
+            batch.create_unique_constraint(
+                "uq_agent_executions_tenant_idempotency_key", ["tenant_id", "idempotency_key"]
+            )
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "agent_executions" in tables:
+        _upgrade_executions(inspector)
+    else:
+        _create_executions()
+
+    indexes = (
+        {index["name"] for index in inspector.get_indexes("agent_executions")}
+        if "agent_executions" in tables else set()
+    )
+    if "ix_agent_executions_tenant_id" not in indexes:
+        op.create_index("ix_agent_executions_tenant_id", "agent_executions", ["tenant_id"])
+    if "ix_agent_executions_tenant_request_hash" not in indexes:
+        op.create_index(
+            "ix_agent_executions_tenant_request_hash",
+            "agent_executions",
+            ["tenant_id", "request_hash", "created_at"],
+        )
+    if "ix_agent_executions_tenant_created_id" not in indexes:
+        op.create_index(
+            "ix_agent_executions_tenant_created_id",
+            "agent_executions",
+            ["tenant_id", sa.text("created_at DESC"), sa.text("id DESC")],
+        )
+
+    if "agent_execution_steps" not in tables:
+        op.create_table(
+            "agent_execution_steps",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("execution_id", sa.String(), nullable=False),
+            sa.Column("tenant_id", sa.String(), nullable=False),
+            sa.Column("step_number", sa.Integer(), nullable=False),
+            sa.Column("payload", sa.LargeBinary(), nullable=False),
+            sa.Column("encoding", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.UniqueConstraint("execution_id", "step_number", name="uq_agent_execution_steps_execution_step"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("agent_execution_steps")
+    op.drop_index("ix_agent_executions_tenant_created_id", table_name="agent_executions")
+    op.drop_index("ix_agent_executions_tenant_request_hash", table_name="agent_executions")
+    op.drop_index("ix_agent_executions_tenant_id", table_name="agent_executions")
+    op.drop_table("agent_executions")
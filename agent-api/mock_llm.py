@@ -0,0 +1,317 @@
+"""
+Mock LLM Provider
+
+Deterministic, offline stand-in for a LiteLLM provider, selected with a
+`mock/` model prefix (e.g. `mock/benchmark`). It replaces the `litellm`
+client of a PooledLiteLLMModel, so runs still go through the same budget,
+tracing and metrics hooks as real models.
+
+Replies come from a script of code-agent responses: the Nth model call of an
+execution returns the Nth reply (the last one repeats), counted from the
+assistant messages already in the conversation, so concurrent executions
+sharing the model do not interfere. A reply may also be an object with
+`content` and `tool_calls` (a list of `{"name", "arguments"}`) to script
+tool-calling agents.
+
+Like Anthropic, the mock caches a prompt prefix only up to a block marked
+with `cache_control`: the marker must be `{"type": "ephemeral"}` on a text
+block, at most four per request, or the call fails with a 400 as the real
+API would. Repeating a marked prefix within five minutes reports its tokens
+as `cache_read_input_tokens`, the first request as
+`cache_creation_input_tokens`.
+
+Configuration:
+- MOCK_LLM_LATENCY_MS: simulated latency per call (default 0)
+- MOCK_LLM_LATENCY_JITTER_MS: extra uniform random latency (default 0)
+- MOCK_LLM_SEED: seed for the jitter (default 0)
+- MOCK_LLM_SCRIPT: JSON list of replies, inline or as a file path
+- MOCK_LLM_MAX_CONCURRENCY: calls beyond this many in flight fail with a
+  429, like a throttling provider (default 0 = never)
+- MOCK_LLM_RETRY_AFTER_SECONDS: `retry-after` sent with those 429s (default none)
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Anthropic's limits for cache breakpoints and ephemeral cache lifetime
+MAX_CACHE_BREAKPOINTS = 4
+CACHE_TTL_SECONDS = 300
+
+DEFAULT_SCRIPT = [
+    "Thought: I will compute an intermediate result first.\n"
+    "<code>\nresult = sum(i * i for i in range(10))\nprint(result)\n</code>",
+    "Thought: I have the result and can answer.\n"
+    "<code>\nfinal_answer(f\"Mock answer: {result}\")\n</code>",
+]
+
+
+# A text reply, or {"content": ..., "tool_calls": [{"name": ..., "arguments": {...}}]}
+Reply = Union[str, Dict[str, Any]]
+
+
+def _valid_reply(reply: Any) -> bool:
+    if isinstance(reply, str):
+        return True
+    return isinstance(reply, dict) and all(
+        isinstance(call, dict) and "name" in call for call in reply.get("tool_calls") or []
+    )
+
+
+def load_script(value: Optional[str]) -> List[Reply]:
+    """
+    Parse MOCK_LLM_SCRIPT: a JSON list given inline or as a path to a JSON file
+
+    Raises:
+        ValueError: If the script is not a non-empty list of replies
+    """
+    if not value:
+        return list(DEFAULT_SCRIPT)
+    if value.lstrip().startswith("["):
+        script = json.loads(value)
+    else:
+        with open(value) as f:
+            script = json.load(f)
+    if not isinstance(script, list) or not script or not all(_valid_reply(r) for r in script):
+        raise ValueError("MOCK_LLM_SCRIPT must be a non-empty JSON list of strings or reply objects")
+    return script
+
+
+def _estimate_tokens(text: str) -> int:
+    # Roughly four characters per token, like most BPE tokenizers on English
+    return max(1, len(text) // 4)
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+class MockProviderError(Exception):
+    """Provider error with the status code and headers litellm exceptions carry"""
+
+    def __init__(self, message: str, status_code: int, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class _Record:
+    """Attribute access over a dict, with the pydantic-style dump smolagents reads"""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def model_dump(self, include=None, **kwargs) -> Dict[str, Any]:
+        return {k: v for k, v in self.__dict__.items() if include is None or k in include}
+
+
+def usage_record(
+    prompt_tokens: int,
+    completion_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_creation_tokens: int = 0
+) -> _Record:
+    """litellm-shaped usage; prompt_tokens includes the cached ones, as litellm reports them"""
+    return _Record(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cache_read_input_tokens=cache_read_tokens,
+        cache_creation_input_tokens=cache_creation_tokens,
+        prompt_tokens_details=_Record(cached_tokens=cache_read_tokens),
+    )
+
+
+def completion_response(
+    model: str,
+    content: Optional[str],
+    prompt_tokens: int,
+    completion_tokens: int,
+    tool_calls: Optional[List[Dict[str, Any]]] = None,
+    cache_read_tokens: int = 0,
+    cache_creation_tokens: int = 0
+) -> _Record:
+    """A litellm-shaped completion response"""
+    message = _Record(role="assistant", content=content, tool_calls=tool_calls)
+    return _Record(
+        model=model,
+        choices=[_Record(index=0, message=message, finish_reason="stop")],
+        usage=usage_record(prompt_tokens, completion_tokens, cache_read_tokens, cache_creation_tokens),
+    )
+
+
+def stream_response(
+    content: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_creation_tokens: int = 0
+) -> Iterator[_Record]:
+    """litellm-shaped stream chunks for a text reply, ending with a usage chunk"""
+    for start in range(0, len(content), 16):
+        delta = _Record(content=content[start:start + 16], tool_calls=None)
+        yield _Record(choices=[_Record(index=0, delta=delta, finish_reason=None)], usage=None)
+    yield _Record(
+        choices=[],
+        usage=usage_record(prompt_tokens, completion_tokens, cache_read_tokens, cache_creation_tokens),
+    )
+
+
+def cache_prefix(messages: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    The messages up to and including the last `cache_control` breakpoint,
+    or None when the request marks nothing
+
+    Raises:
+        MockProviderError: 400 for a malformed marker or too many breakpoints
+    """
+    breakpoints = 0
+    prefix_end = None
+    for index, message in enumerate(messages):
+        content = message.get("content")
+        blocks = content if isinstance(content, list) else []
+        if "cache_control" in message:
+            raise MockProviderError("cache_control must be set on a content block, not a message", 400)
+        for block in blocks:
+            if not isinstance(block, dict) or "cache_control" not in block:
+                continue
+            if block.get("type") != "text":
+                raise MockProviderError(f"cache_control is not supported on {block.get('type')} blocks", 400)
+            if block["cache_control"] != {"type": "ephemeral"}:
+                raise MockProviderError(f"Invalid cache_control: {block['cache_control']}", 400)
+            breakpoints += 1
+            prefix_end = index
+    if breakpoints > MAX_CACHE_BREAKPOINTS:
+        raise MockProviderError(
+            f"A maximum of {MAX_CACHE_BREAKPOINTS} blocks with cache_control may be provided. Found {breakpoints}.",
+            400,
+        )
+    return messages[:prefix_end + 1] if prefix_end is not None else None
+
+
+class MockCompletionClient:
+    """Implements the `completion` call LiteLLMModel makes on the litellm module"""
+
+    def __init__(
+        self,
+        script: Optional[List[Reply]] = None,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        seed: int = 0,
+        max_concurrency: int = 0,
+        retry_after: Optional[float] = None
+    ):
+        self.script = script or list(DEFAULT_SCRIPT)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # Prefix hash -> expiry, least recently used first
+        self._prompt_cache: "OrderedDict[str, float]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "MockCompletionClient":
+        return cls(
+            script=load_script(os.getenv("MOCK_LLM_SCRIPT")),
+            latency_ms=float(os.getenv("MOCK_LLM_LATENCY_MS", "0")),
+            jitter_ms=float(os.getenv("MOCK_LLM_LATENCY_JITTER_MS", "0")),
+            seed=int(os.getenv("MOCK_LLM_SEED", "0")),
+            max_concurrency=int(os.getenv("MOCK_LLM_MAX_CONCURRENCY", "0")),
+            retry_after=float(os.getenv("MOCK_LLM_RETRY_AFTER_SECONDS")) if os.getenv("MOCK_LLM_RETRY_AFTER_SECONDS") else None,
+        )
+
+    def _scripted(self, messages: List[Dict[str, Any]]) -> Reply:
+        turn = sum(1 for message in messages if message.get("role") == "assistant")
+        return self.script[min(turn, len(self.script) - 1)]
+
+    def reply(self, messages: List[Dict[str, Any]], stop: Optional[List[str]] = None) -> str:
+        """Scripted reply text for a conversation, cut at the first stop sequence like a real provider"""
+        reply = self._scripted(messages)
+        text = reply if isinstance(reply, str) else reply.get("content") or ""
+        for sequence in stop or []:
+            index = text.find(sequence)
+            if index != -1:
+                text = text[:index]
+        return text
+
+    def tool_calls(self, messages: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Scripted tool calls for a conversation, shaped like an OpenAI response"""
+        reply = self._scripted(messages)
+        if isinstance(reply, str) or not reply.get("tool_calls"):
+            return None
+        turn = sum(1 for message in messages if message.get("role") == "assistant")
+        return [
+            {
+                "id": f"call_{turn}_{i}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))},
+            }
+            for i, call in enumerate(reply["tool_calls"])
+        ]
+
+    def _cached(self, model: str, messages: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """(cache read tokens, cache creation tokens) for a request"""
+        prefix = cache_prefix(messages)
+        if prefix is None:
+            return 0, 0
+        tokens = sum(_estimate_tokens(_message_text(m)) for m in prefix)
+        key = hashlib.sha256(
+            json.dumps([model, prefix], sort_keys=True, default=str).encode()
+        ).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            hit = self._prompt_cache.get(key, 0) > now
+            # Reads refresh the lifetime, like the real cache
+            self._prompt_cache[key] = now + CACHE_TTL_SECONDS
+            self._prompt_cache.move_to_end(key)
+            while len(self._prompt_cache) > 1024:
+                self._prompt_cache.popitem(last=False)
+        return (tokens, 0) if hit else (0, tokens)
+
+    def _wait(self, timeout: Optional[float]):
+        delay = self.latency_ms
+        if self.jitter_ms:
+            with self._lock:
+                delay += self._random.uniform(0, self.jitter_ms)
+        delay /= 1000
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Mock LLM call timed out after {timeout:.1f}s")
+        if delay:
+            time.sleep(delay)
+
+    def completion(self, model: str, messages: List[Dict[str, Any]], stream: bool = False, **kwargs):
+        # Malformed requests fail before they count against the rate limit
+        cache_prefix(messages)
+        with self._lock:
+            if self.max_concurrency and self._in_flight >= self.max_concurrency:
+                headers = {"retry-after": f"{self.retry_after:g}"} if self.retry_after is not None else {}
+                raise MockProviderError("Mock rate limit exceeded", 429, headers)
+            self._in_flight += 1
+        try:
+            self._wait(kwargs.get("timeout"))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        text = self.reply(messages, kwargs.get("stop"))
+        prompt_tokens = sum(_estimate_tokens(_message_text(m)) for m in messages)
+        completion_tokens = _estimate_tokens(text)
+        cache_read, cache_creation = self._cached(model, messages)
+        if stream:
+            return stream_response(text, prompt_tokens, completion_tokens, cache_read, cache_creation)
+        return completion_response(
+            model, text, prompt_tokens, completion_tokens, self.tool_calls(messages), cache_read, cache_creation
+        )
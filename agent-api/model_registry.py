@@ -0,0 +1,256 @@
+"""
+LLM Model Registry
+
+Process-wide cache of LiteLLM models keyed by (provider, model_id). Each
+entry owns a keep-alive HTTP connection pool that every execution on that
+model shares, so runs stop paying TLS handshakes and client setup, and an
+LLMLimiter that paces and retries the calls of every execution on it.
+"""
+
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+from model_router import ModelRouter
+from recording import REPLAY, recorder
+
+if TYPE_CHECKING:
+    from pooled_model import PooledLiteLLMModel, RoutedModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLAUDE_MODEL = "claude-3-5-sonnet-20241022"
+
+# Endpoints touched during warm-up to open the first pooled connection
+PROVIDER_BASE_URLS = {
+    "anthropic": "https://api.anthropic.com",
+    "openai": "https://api.openai.com",
+}
+
+
+def _api_key(name: str, error: str) -> str:
+    api_key = os.getenv(name)
+    if api_key:
+        return api_key
+    # Replayed runs never reach the provider, so they need no key
+    if recorder.mode == REPLAY:
+        return ""
+    raise ValueError(error)
+
+
+def resolve_model(model: Optional[str]) -> Tuple[str, str, str]:
+    """
+    Map a requested model name to (provider, LiteLLM model id, API key)
+
+    Raises:
+        ValueError: If the model is not recognized, or its provider's API key
+            is not configured
+    """
+    model_id = model or os.getenv("DEFAULT_MODEL", DEFAULT_CLAUDE_MODEL)
+
+    # Offline mock provider for benchmarks and local testing; needs no key
+    if model_id.startswith("mock/"):
+        return "mock", model_id, ""
+
+    if "claude" in model_id.lower() or "anthropic" in model_id.lower():
+        api_key = _api_key("ANTHROPIC_API_KEY", "ANTHROPIC_API_KEY not set for Claude models")
+
+        # LiteLLM expects the model name with provider prefix
+        if not model_id.startswith("anthropic/"):
+            model_id = f"anthropic/{model_id}"
+        return "anthropic", model_id, api_key
+
+    if "gpt" in model_id.lower() or "openai" in model_id.lower():
+        api_key = _api_key("OPENAI_API_KEY", "OPENAI_API_KEY not set for OpenAI models")
+        return "openai", model_id, api_key
+
+    raise ValueError(f"Unrecognized model: {model_id}")
+
+
+class _RegistryEntry:
+    __slots__ = ("provider", "model", "http_client", "transport_client", "created_at")
+
+    def __init__(
+        self,
+        provider: str,
+        model: "PooledLiteLLMModel",
+        http_client: Any,
+        transport_client: httpx.Client
+    ):
+        self.provider = provider
+        self.model = model
+        # LiteLLM's HTTPHandler closes its httpx client when garbage collected
+        self.http_client = http_client
+        self.transport_client = transport_client
+        self.created_at = time.time()
+
+
+class ModelRegistry:
+    """Builds each (provider, model_id) model once and hands out the shared instance"""
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 60.0,
+        timeout: float = 600.0,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], _RegistryEntry] = {}
+        self.router = ModelRouter(self)
+
+    @classmethod
+    def from_env(cls) -> "ModelRegistry":
+        registry = cls(
+            max_connections=int(os.getenv("MODEL_HTTP_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("MODEL_HTTP_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=float(os.getenv("MODEL_HTTP_KEEPALIVE_SECONDS", "60")),
+            timeout=float(os.getenv("MODEL_HTTP_TIMEOUT_SECONDS", "600")),
+        )
+        registry.router = ModelRouter.from_env(registry)
+        return registry
+
+    def get(self, model: Optional[str]) -> "PooledLiteLLMModel":
+        """
+        Get the shared model for a requested model name
+
+        Raises:
+            ValueError: If the provider's API key is not configured
+        """
+        provider, model_id, api_key = resolve_model(model)
+        key = (provider, model_id)
+
+        entry = self._entries.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = self._build(provider, model_id, api_key)
+                    logger.info(f"Registered {provider} model: {model_id}")
+        return entry.model
+
+    def routed(self, model: Optional[str], task: str, tenant_id: str) -> "RoutedModel":
+        """
+        The model an execution runs on: the candidates the router picked,
+        behind failover between them
+
+        Raises:
+            ValueError: If no candidate's provider has an API key configured
+        """
+        from pooled_model import RoutedModel
+
+        route = self.router.route(model, task, tenant_id)
+        return RoutedModel(self.router, route, [self.get(candidate) for candidate in route.candidates])
+
+    def _build(self, provider: str, model_id: str, api_key: str) -> _RegistryEntry:
+        # Imports smolagents, and LiteLLM on first build; kept off the startup path
+        from llm_limiter import LLMLimiter
+        from pooled_model import CACHE_CONTROL_PROVIDERS, PooledLiteLLMModel
+
+        limiter = LLMLimiter.from_env(provider, model_id)
+        prompt_cache = (
+            provider in CACHE_CONTROL_PROVIDERS and os.getenv("PROMPT_CACHE", "true").lower() == "true"
+        )
+        transport_client = httpx.Client(limits=self.limits, timeout=self.timeout)
+
+        if provider == "mock":
+            from mock_llm import MockCompletionClient
+
+            model = PooledLiteLLMModel(
+                model_id=model_id,
+                provider=provider,
+                http_client=None,
+                limiter=limiter,
+                prompt_cache=prompt_cache,
+                client=recorder.wrap_client(MockCompletionClient.from_env()),
+            )
+            return _RegistryEntry(provider, model, None, transport_client)
+
+        # LiteLLM takes a provider-specific client object per completion call.
+        # Retries are left to the model's limiter, not the SDK.
+        if provider == "openai":
+            from openai import OpenAI
+
+            http_client = OpenAI(api_key=api_key, http_client=transport_client, max_retries=0)
+        else:
+            from litellm.llms.custom_httpx.http_handler import HTTPHandler
+
+            http_client = HTTPHandler(client=transport_client)
+
+        model = PooledLiteLLMModel(
+            model_id=model_id,
+            api_key=api_key,
+            provider=provider,
+            http_client=http_client,
+            limiter=limiter,
+            prompt_cache=prompt_cache,
+        )
+        # Record or replay mode swaps the litellm module for a recording client
+        model.client = recorder.wrap_client(model.client)
+        return _RegistryEntry(provider, model, http_client, transport_client)
+
+    def warm_up(self, model: Optional[str] = None):
+        """
+        Build the model (DEFAULT_MODEL when not given) and open its first
+        pooled connection, so the first execution skips the TLS handshake.
+        """
+        try:
+            llm_model = self.get(model)
+        except ValueError as e:
+            logger.warning(f"Skipping model warm-up: {e}")
+            return
+
+        entry = self._entries[(llm_model.provider, llm_model.model_id)]
+        base_url = PROVIDER_BASE_URLS.get(entry.provider)
+        if not base_url or recorder.mode == REPLAY:
+            return
+        try:
+            start = time.perf_counter()
+            entry.transport_client.head(base_url, timeout=10.0)
+            logger.info(
+                f"Warmed up {llm_model.model_id} connection pool in "
+                f"{(time.perf_counter() - start) * 1000:.0f}ms"
+            )
+        except Exception as e:
+            # Warm-up is an optimization and must never block startup
+            logger.warning(f"Model connection warm-up failed for {llm_model.model_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-model call counts and connection pool usage"""
+        with self._lock:
+            entries = list(self._entries.values())
+
+        models = []
+        for entry in entries:
+            # httpx does not expose pool state publicly; read it defensively
+            pool = getattr(getattr(entry.transport_client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            models.append({
+                "provider": entry.provider,
+                "model_id": entry.model.model_id,
+                "calls": entry.model.calls,
+                "created_at": entry.created_at,
+                "connections": len(connections),
+                "idle_connections": sum(1 for conn in connections if conn.is_idle()),
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "limiter": entry.model.limiter.stats(),
+            })
+        return {"models": models, "routing": self.router.stats()}
+
+    def close(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.transport_client.close()
@@ -0,0 +1,315 @@
+"""
+Model Routing
+
+Chooses the models an execution runs on from a declared routing policy,
+instead of sending everything to DEFAULT_MODEL:
+
+    {
+      "tiers": {
+        "default": ["claude-sonnet-4-5", "gpt-4o"],
+        "fast": ["claude-3-5-haiku-20241022", "gpt-4o-mini"]
+      },
+      "rules": [
+        {"tenant": "acme", "tier": "fast"},
+        {"max_task_chars": 200, "tier": "fast"}
+      ]
+    }
+
+A request's `model` may name a tier, or a model, which is tried first with
+the rest of its tier as fallbacks. Without one, the first matching rule
+picks the tier (rules match on `tenant`, `max_task_chars` and
+`min_task_chars`), else the "default" tier, else DEFAULT_MODEL alone.
+
+The router keeps rolling latency and error rates per model. Within a tier,
+a model counts as degraded when its error rate over the last
+MODEL_ROUTING_WINDOW_SECONDS reaches MODEL_ROUTING_MAX_ERROR_RATE, or when
+its p95 latency exceeds MODEL_ROUTING_MAX_P95_SECONDS. Degraded models
+move behind healthy ones, and models whose provider has no API key are
+skipped. During a run, a provider failure that outlasts the limiter's
+retries fails over to the next candidate (see RoutedModel). The decisions
+are recorded in the execution's `routing` column.
+
+- MODEL_ROUTING_POLICY: the policy as JSON, inline or as a file path
+- MODEL_ROUTING_STRATEGY: priority (tier order, default) or latency (fastest p50 first)
+- MODEL_ROUTING_HEDGE: true to hedge the first LLM call of a run on the
+  next candidate once it takes longer than the primary's p95
+- MODEL_ROUTING_HEDGE_AFTER_SECONDS: fixed hedge delay instead of the p95
+- MODEL_ROUTING_MIN_SAMPLES: calls needed before a model's stats count (default 5)
+"""
+
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import threading
+import time
+
+if TYPE_CHECKING:
+    from model_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+PRIORITY = "priority"
+LATENCY = "latency"
+
+
+def load_policy(value: Optional[str]) -> Dict[str, Any]:
+    """
+    Parse MODEL_ROUTING_POLICY: JSON given inline or as a path to a JSON file
+
+    Raises:
+        ValueError: If a rule names an undeclared tier
+    """
+    if not value:
+        return {"tiers": {}, "rules": []}
+    if value.lstrip().startswith("{"):
+        policy = json.loads(value)
+    else:
+        with open(value) as f:
+            policy = json.load(f)
+    tiers = policy.setdefault("tiers", {})
+    for rule in policy.setdefault("rules", []):
+        if rule.get("tier") not in tiers:
+            raise ValueError(f"Routing rule {rule} names an undeclared tier")
+    return policy
+
+
+class RollingHealth:
+    """Latency and outcome of a model's recent calls"""
+
+    def __init__(self, window: float = 300.0, max_samples: int = 500):
+        self.window = window
+        # (finished at, latency, succeeded)
+        self._samples: Deque[Tuple[float, float, bool]] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._samples.append((time.monotonic(), latency, ok))
+
+    def snapshot(self) -> Dict[str, Any]:
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            samples = list(self._samples)
+        latencies = sorted(latency for _, latency, ok in samples if ok)
+        errors = sum(1 for _, _, ok in samples if not ok)
+        return {
+            "calls": len(samples),
+            "error_rate": round(errors / len(samples), 3) if samples else 0.0,
+            "p50_seconds": round(_percentile(latencies, 0.5), 3) if latencies else None,
+            "p95_seconds": round(_percentile(latencies, 0.95), 3) if latencies else None,
+        }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Route:
+    """The routing decisions for one execution, as stored on its row"""
+
+    def __init__(self, requested: Optional[str], tier: Optional[str], reason: str):
+        self.requested = requested
+        self.tier = tier
+        self.reason = reason
+        self.candidates: List[str] = []
+        # Models left out of the candidates, and healthy-first demotions within them
+        self.skipped: List[Dict[str, str]] = []
+        self.degraded: List[Dict[str, str]] = []
+        self.fallbacks: List[Dict[str, Any]] = []
+        self.hedge: Optional[Dict[str, Any]] = None
+        # The model that answered the most recent call
+        self.model: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def fallback(self, source: str, target: str, error: BaseException, call: int):
+        with self._lock:
+            self.fallbacks.append({
+                "from": source,
+                "to": target,
+                "call": call,
+                "error": f"{type(error).__name__}: {str(error)[:200]}",
+            })
+
+    def hedge_loser(self, outcome: Dict[str, Any]):
+        """Record what the losing hedged call did; it may finish after the winner"""
+        with self._lock:
+            if self.hedge is not None:
+                self.hedge["loser"] = outcome
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            record = {
+                "requested": self.requested,
+                "tier": self.tier,
+                "reason": self.reason,
+                "candidates": list(self.candidates),
+                "skipped": list(self.skipped),
+                "degraded": list(self.degraded),
+                "selected": self.candidates[0] if self.candidates else None,
+                "model": self.model,
+                "fallbacks": list(self.fallbacks),
+            }
+            if self.hedge:
+                record["hedge"] = {
+                    key: dict(value) if isinstance(value, dict) else value for key, value in self.hedge.items()
+                }
+        return record
+
+
+class ModelRouter:
+    """Picks candidate models for an execution and tracks how each model is doing"""
+
+    def __init__(
+        self,
+        models: "ModelRegistry",
+        policy: Optional[Dict[str, Any]] = None,
+        strategy: str = PRIORITY,
+        window: float = 300.0,
+        min_samples: int = 5,
+        max_error_rate: float = 0.5,
+        max_p95: float = 0.0,
+        hedge: bool = False,
+        hedge_after: Optional[float] = None,
+    ):
+        if strategy not in (PRIORITY, LATENCY):
+            raise ValueError(f"Unknown MODEL_ROUTING_STRATEGY: {strategy}")
+        self.models = models
+        self.policy = policy or {"tiers": {}, "rules": []}
+        self.strategy = strategy
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.max_p95 = max_p95
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self._lock = threading.Lock()
+        self._health: Dict[str, RollingHealth] = {}
+
+    @classmethod
+    def from_env(cls, models: "ModelRegistry") -> "ModelRouter":
+        hedge_after = os.getenv("MODEL_ROUTING_HEDGE_AFTER_SECONDS")
+        return cls(
+            models,
+            policy=load_policy(os.getenv("MODEL_ROUTING_POLICY")),
+            strategy=os.getenv("MODEL_ROUTING_STRATEGY", PRIORITY).lower(),
+            window=float(os.getenv("MODEL_ROUTING_WINDOW_SECONDS", "300")),
+            min_samples=int(os.getenv("MODEL_ROUTING_MIN_SAMPLES", "5")),
+            max_error_rate=float(os.getenv("MODEL_ROUTING_MAX_ERROR_RATE", "0.5")),
+            max_p95=float(os.getenv("MODEL_ROUTING_MAX_P95_SECONDS", "0")),
+            hedge=os.getenv("MODEL_ROUTING_HEDGE", "false").lower() == "true",
+            hedge_after=float(hedge_after) if hedge_after else None,
+        )
+
+    def health(self, model_id: str) -> RollingHealth:
+        health = self._health.get(model_id)
+        if health is None:
+            with self._lock:
+                health = self._health.setdefault(model_id, RollingHealth(self.window))
+        return health
+
+    def observe(self, model_id: str, latency: float, ok: bool):
+        """Record the outcome of one LLM call"""
+        self.health(model_id).record(latency, ok)
+
+    def degraded(self, model_id: str) -> Optional[str]:
+        """Why a model is degraded, or None while it looks healthy"""
+        stats = self.health(model_id).snapshot()
+        if stats["calls"] < self.min_samples:
+            return None
+        if stats["error_rate"] >= self.max_error_rate:
+            return f"error rate {stats['error_rate']:.0%} over {stats['calls']} calls"
+        if self.max_p95 and stats["p95_seconds"] is not None and stats["p95_seconds"] > self.max_p95:
+            return f"p95 latency {stats['p95_seconds']:.1f}s"
+        return None
+
+    def hedge_delay(self, model_id: str) -> Optional[float]:
+        """How long the first call may take before it is hedged; None when hedging is off"""
+        if not self.hedge:
+            return None
+        if self.hedge_after is not None:
+            return self.hedge_after
+        stats = self.health(model_id).snapshot()
+        if stats["calls"] < self.min_samples:
+            return None
+        return stats["p95_seconds"]
+
+    def _tier_of(self, model: str) -> Tuple[Optional[str], List[str]]:
+        for name, members in self.policy["tiers"].items():
+            if model in members:
+                return name, members
+        return None, []
+
+    def _select(self, model: Optional[str], task: str, tenant_id: str) -> Tuple[Route, List[str], bool]:
+        """The route, its candidates in policy order, and whether the first is pinned"""
+        tiers = self.policy["tiers"]
+        if model and model in tiers:
+            return Route(model, model, "request tier"), list(tiers[model]), False
+        if model:
+            tier, members = self._tier_of(model)
+            return Route(model, tier, "request model"), [model] + [m for m in members if m != model], True
+        for index, rule in enumerate(self.policy["rules"]):
+            if "tenant" in rule and rule["tenant"] != tenant_id:
+                continue
+            if "max_task_chars" in rule and len(task) > rule["max_task_chars"]:
+                continue
+            if "min_task_chars" in rule and len(task) < rule["min_task_chars"]:
+                continue
+            return Route(None, rule["tier"], f"rule {index}"), list(tiers[rule["tier"]]), False
+        if "default" in tiers:
+            return Route(None, "default", "default tier"), list(tiers["default"]), False
+        from model_registry import DEFAULT_CLAUDE_MODEL
+
+        return Route(None, None, "DEFAULT_MODEL"), [os.getenv("DEFAULT_MODEL", DEFAULT_CLAUDE_MODEL)], False
+
+    def route(self, model: Optional[str], task: str, tenant_id: str) -> Route:
+        """
+        Choose the candidate models for an execution, best first
+
+        Raises:
+            ValueError: If no candidate has its provider's API key configured
+        """
+        from model_registry import resolve_model
+
+        route, candidates, pinned = self._select(model, task, tenant_id)
+        healthy, degraded = [], []
+        first_error = None
+        for candidate in candidates:
+            try:
+                resolve_model(candidate)
+            except ValueError as e:
+                first_error = first_error or e
+                route.skipped.append({"model": candidate, "reason": str(e)})
+                continue
+            reason = None if pinned and candidate == candidates[0] else self.degraded(candidate)
+            if reason:
+                route.degraded.append({"model": candidate, "reason": reason})
+                degraded.append(candidate)
+            else:
+                healthy.append(candidate)
+
+        if self.strategy == LATENCY and not pinned:
+            # Models without samples sort first, so they get measured
+            healthy.sort(key=lambda m: self.health(m).snapshot()["p50_seconds"] or 0.0)
+        # Degraded models stay as a last resort
+        route.candidates = healthy + degraded
+        if not route.candidates:
+            raise first_error or ValueError("No model available for this execution")
+        return route
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = list(self._health)
+        return {
+            "strategy": self.strategy,
+            "hedge": self.hedge,
+            "tiers": self.policy["tiers"],
+            "rules": self.policy["rules"],
+            "models": {
+                model: {**self.health(model).snapshot(), "degraded": self.degraded(model)}
+                for model in models
+            },
+        }
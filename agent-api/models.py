@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, JSON, Text, Integer
+from sqlalchemy import Column, String, DateTime, JSON, Text, Integer, LargeBinary, Index, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from datetime import datetime
 import uuid
@@ -8,24 +8,67 @@ from database import Base
 class AgentExecution(Base):
     """Model for storing agent execution history and results"""
     __tablename__ = "agent_executions"
+    __table_args__ = (
+        # Memoization lookups: recent runs of the same request for a tenant
+        Index("ix_agent_executions_tenant_request_hash", "tenant_id", "request_hash", "created_at"),
+        UniqueConstraint("tenant_id", "idempotency_key", name="uq_agent_executions_tenant_idempotency_key"),
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     tenant_id = Column(String, nullable=False, index=True)
     
     # Execution details
     task = Column(Text, nullable=False)
-    status = Column(String, nullable=False)  # running, completed, failed
+    status = Column(String, nullable=False)  # queued, running, completed, failed, cancelled, timed_out, budget_exceeded
     result = Column(Text, nullable=True)
     error = Column(Text, nullable=True)
     
     # Agent configuration
-    model = Column(String, nullable=True)
-    steps = Column(JSON, nullable=True)
+    model = Column(String, nullable=True)  # Requested model or tier; the model that served the run once finished
+    routing = Column(JSON, nullable=True)  # Model selection, fallbacks and hedging (see model_router.py)
+    steps = Column(JSON, nullable=True)  # Legacy inline trace; new runs store steps in agent_execution_steps
     exec_metadata = Column(JSON, nullable=True)  # Renamed from 'metadata' to avoid SQLAlchemy conflict
     
+    # Deduplication
+    request_hash = Column(String, nullable=True)  # Canonical hash of task, tools, model, max_steps and budgets
+    idempotency_key = Column(String, nullable=True)  # Client-supplied Idempotency-Key header
+    
     # Timestamps
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
     
     def __repr__(self):
         return f"<AgentExecution(id={self.id}, tenant_id={self.tenant_id}, status={self.status})>"
+
+
+# Keyset pagination of a tenant's history, newest first; both columns descend
+# like pagination.page_query's ORDER BY, so a page is one index range scan
+Index(
+    "ix_agent_executions_tenant_created_id",
+    AgentExecution.tenant_id,
+    AgentExecution.created_at.desc(),
+    AgentExecution.id.desc(),
+)
+
+
+class AgentExecutionStep(Base):
+    """One compressed step of an execution trace, kept off the main row"""
+    __tablename__ = "agent_execution_steps"
+    __table_args__ = (
+        UniqueConstraint("execution_id", "step_number", name="uq_agent_execution_steps_execution_step"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    execution_id = Column(String, nullable=False)
+    tenant_id = Column(String, nullable=False)
+    step_number = Column(Integer, nullable=False)
+    
+    # Compressed JSON step record (see trace_store.py)
+    payload = Column(LargeBinary, nullable=False)
+    encoding = Column(String, nullable=False)  # zstd, zlib
+    
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<AgentExecutionStep(execution_id={self.execution_id}, step_number={self.step_number})>"
@@ -0,0 +1,62 @@
+"""
+Keyset Pagination
+
+Opaque cursors for paging agent executions newest-first on (created_at, id).
+Unlike OFFSET, each page is a single index range scan no matter how deep it is.
+"""
+
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+import base64
+
+from sqlalchemy import Select, tuple_
+
+from models import AgentExecution
+
+
+def encode_cursor(created_at: datetime, execution_id: str) -> str:
+    """Cursor pointing just past the given row"""
+    raw = f"{created_at.isoformat()}|{execution_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, execution_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), execution_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def page_query(query: Select, limit: int, cursor: Optional[str] = None) -> Select:
+    """
+    Restrict an AgentExecution query to the page after `cursor`, newest first
+
+    Rows created in the same instant are ordered by id, so no row is skipped
+    or repeated across pages. One extra row is fetched to tell whether
+    another page exists (see next_page).
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(AgentExecution.created_at, AgentExecution.id) < tuple_(cursor_created_at, cursor_id)
+        )
+    return query.order_by(AgentExecution.created_at.desc(), AgentExecution.id.desc()).limit(limit + 1)
+
+
+def next_page(rows: List[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """The rows of a page fetched with page_query, and the cursor of the next page if any"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,355 @@
+"""
+Pooled LiteLLM Model
+
+The smolagents model class behind every ModelRegistry entry. Kept apart from
+the registry so importing the registry does not import smolagents; LiteLLM
+itself is only imported when the first model is built. Every call goes
+through the model's LLMLimiter, which owns rate limiting and retries.
+
+For providers with explicit prompt caching (Anthropic, and the mock
+provider that imitates it), the system prompt, which also lists the
+tools, is marked as a cacheable prefix, so later steps and runs pay the
+cached input price for it.
+
+Agents get a RoutedModel over the candidates their route chose, which
+fails over between them and optionally hedges the first call.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from smolagents import LiteLLMModel, Model
+from smolagents.monitoring import TokenUsage
+
+from execution_control import ExecutionCancelled, current_budget
+from llm_limiter import LLMLimiter, error_status
+from model_router import ModelRouter, Route
+from tracing import current_step_spans, llm_span, record_llm_usage
+
+logger = logging.getLogger(__name__)
+
+# How long a finished run waits for its losing hedged call, so the route
+# records what that call spent
+HEDGE_SETTLE_SECONDS = 10.0
+
+# Request errors another provider would reject just the same
+_NO_FAILOVER_STATUSES = {400, 413, 422}
+
+
+# Providers that cache a prompt prefix only where a request marks it
+CACHE_CONTROL_PROVIDERS = {"anthropic", "mock"}
+
+EPHEMERAL = {"type": "ephemeral"}
+
+
+def mark_cache_prefix(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Mark the end of the system prompt as a cache breakpoint
+
+    Anthropic caches tools, then system, then messages, so one breakpoint on
+    the last system block covers the tool definitions too. The conversation
+    after it changes every step and is not marked.
+    """
+    marked = list(messages)
+    for index, message in enumerate(marked):
+        if message.get("role") != "system":
+            continue
+        content = message.get("content")
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        if not content:
+            continue
+        # Copies: the message dicts may be shared with the agent's memory
+        content = list(content)
+        content[-1] = {**content[-1], "cache_control": EPHEMERAL}
+        marked[index] = {**message, "content": content}
+        break
+    return marked
+
+
+def estimate_tokens(messages: List[Any]) -> int:
+    """Rough prompt size for rate limiting, about four characters per token"""
+    chars = 0
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+        if isinstance(content, list):
+            chars += sum(len(part.get("text", "")) for part in content if isinstance(part, dict))
+        elif content:
+            chars += len(str(content))
+    return chars // 4
+
+
+class PooledLiteLLMModel(LiteLLMModel):
+    """LiteLLMModel that sends every completion through a shared HTTP client"""
+
+    def __init__(
+        self,
+        *args,
+        provider: str,
+        http_client: Any,
+        limiter: Optional[LLMLimiter] = None,
+        prompt_cache: bool = False,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.provider = provider
+        self.http_client = http_client
+        self.limiter = limiter or LLMLimiter(self.model_id)
+        self.prompt_cache = prompt_cache
+        self.calls = 0
+
+    def _prepare_completion_kwargs(self, *args, **kwargs) -> Dict[str, Any]:
+        completion_kwargs = super()._prepare_completion_kwargs(*args, **kwargs)
+        completion_kwargs["client"] = self.http_client
+        if self.prompt_cache:
+            completion_kwargs["messages"] = mark_cache_prefix(completion_kwargs["messages"])
+        # A single call may not outlive the execution's wall-clock budget
+        budget = current_budget.get()
+        remaining = budget.remaining_seconds() if budget else None
+        if remaining is not None:
+            completion_kwargs["timeout"] = max(1.0, remaining)
+        # Approximate under concurrency; only used for stats
+        self.calls += 1
+        return completion_kwargs
+
+    def generate(self, *args, **kwargs):
+        budget = current_budget.get()
+        if budget:
+            budget.check()
+        estimate = estimate_tokens(kwargs.get("messages", args[0] if args else []))
+        with llm_span(self.model_id) as current:
+            started = time.perf_counter()
+            generate = super().generate
+            message = self.limiter.call(lambda: generate(*args, **kwargs), estimate)
+            record_llm_usage(current, message.token_usage, started)
+        if message.token_usage:
+            used = message.token_usage.input_tokens + message.token_usage.output_tokens
+            self.limiter.settle(estimate, used)
+            if budget:
+                budget.add_tokens(used)
+        return message
+
+    def generate_stream(self, *args, **kwargs):
+        budget = current_budget.get()
+        if budget:
+            budget.check()
+        estimate = estimate_tokens(kwargs.get("messages", args[0] if args else []))
+        with llm_span(self.model_id) as current:
+            started = time.perf_counter()
+            first_token_at = None
+            input_tokens = output_tokens = 0
+            generate_stream = super().generate_stream
+            for delta in self.limiter.stream(lambda: generate_stream(*args, **kwargs), estimate):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                if delta.token_usage:
+                    input_tokens += delta.token_usage.input_tokens
+                    output_tokens += delta.token_usage.output_tokens
+                yield delta
+            record_llm_usage(current, TokenUsage(input_tokens, output_tokens), started, first_token_at)
+        self.limiter.settle(estimate, input_tokens + output_tokens)
+        if budget:
+            budget.add_tokens(input_tokens + output_tokens)
+
+
+def _can_fail_over(error: BaseException) -> bool:
+    if isinstance(error, ExecutionCancelled):
+        return False
+    status = error_status(error)
+    if status is not None:
+        return status not in _NO_FAILOVER_STATUSES
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv("MODEL_ROUTING_HEDGE_THREADS", "16")),
+                thread_name_prefix="llm-hedge",
+            )
+        return _hedge_pool
+
+
+class RoutedModel(Model):
+    """
+    The model an agent runs on: calls go to the route's current candidate,
+    and a provider failure that survives the limiter's retries moves the
+    rest of the run to the next one
+    """
+
+    def __init__(self, router: ModelRouter, route: Route, models: List[PooledLiteLLMModel]):
+        super().__init__(model_id=models[0].model_id)
+        self.router = router
+        self.route = route
+        # Parallel to route.candidates
+        self.models = models
+        self._active = 0
+        self._calls = 0
+        self._loser: Optional[Future] = None
+
+    def _switch(self, index: int):
+        self._active = index
+        self.model_id = self.models[index].model_id
+
+    def _call(self, index: int, fn: Callable[[PooledLiteLLMModel], Any]) -> Any:
+        name = self.route.candidates[index]
+        started = time.perf_counter()
+        try:
+            result = fn(self.models[index])
+        except ExecutionCancelled:
+            raise
+        except Exception:
+            self.router.observe(name, time.perf_counter() - started, ok=False)
+            raise
+        self.router.observe(name, time.perf_counter() - started, ok=True)
+        return result
+
+    def _hedged(self, index: int, delay: float, fn: Callable[[PooledLiteLLMModel], Any]) -> Any:
+        """Call candidate `index`; if it is still running after `delay`, race the next one against it"""
+        # The step span opens lazily on the first LLM call; open it on this
+        # thread, so the copied contexts carry it and it closes here
+        steps = current_step_spans.get()
+        if steps is not None:
+            steps.ensure_open()
+        pool = _hedge_executor()
+        primary = pool.submit(contextvars.copy_context().run, self._call, index, fn)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        hedge_index = index + 1
+        self.route.hedge = {
+            "after_seconds": round(delay, 3),
+            "primary": self.route.candidates[index],
+            "hedge": self.route.candidates[hedge_index],
+        }
+        logger.info(f"Hedging slow call to {self.route.candidates[index]} on {self.route.candidates[hedge_index]}")
+        hedge = pool.submit(contextvars.copy_context().run, self._call, hedge_index, fn)
+        names = {primary: index, hedge: hedge_index}
+        pending = set(names)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                self.route.hedge["winner"] = self.route.candidates[names[future]]
+                for loser in pending:
+                    self._track_loser(loser, names[loser])
+                self._switch(names[future])
+                return result
+        self._switch(hedge_index)
+        raise error
+
+    def _track_loser(self, future: Future, index: int):
+        """
+        Let the losing call finish and record its tokens on the route
+
+        A provider request in flight cannot be recalled, and its tokens are
+        billed anyway: they count toward the run's token budget as they
+        arrive. Only a call still waiting for a hedge thread is dropped.
+        """
+        name = self.route.candidates[index]
+        if future.cancel():
+            self.route.hedge_loser({"model": name, "cancelled": True})
+            return
+        self.route.hedge_loser({"model": name, "running": True})
+
+        def record(done: Future):
+            try:
+                message = done.result()
+            except BaseException as e:
+                self.route.hedge_loser({"model": name, "error": f"{type(e).__name__}: {str(e)[:200]}"})
+                return
+            usage = getattr(message, "token_usage", None)
+            self.route.hedge_loser({
+                "model": name,
+                "input_tokens": usage.input_tokens if usage else None,
+                "output_tokens": usage.output_tokens if usage else None,
+            })
+
+        future.add_done_callback(record)
+        self._loser = future
+
+    def settle(self):
+        """Wait briefly for a losing hedged call, so the route reports its usage"""
+        if self._loser is None:
+            return
+        timeout = HEDGE_SETTLE_SECONDS
+        budget = current_budget.get()
+        remaining = budget.remaining_seconds() if budget is not None else None
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        wait([self._loser], timeout=timeout)
+
+    def _run(self, fn: Callable[[PooledLiteLLMModel], Any]) -> Any:
+        self._calls += 1
+        call = self._calls
+        index = self._active
+        hedge = None
+        if call == 1 and index + 1 < len(self.models):
+            hedge = self.router.hedge_delay(self.route.candidates[index])
+        while True:
+            try:
+                if hedge is not None:
+                    result = self._hedged(index, hedge, fn)
+                else:
+                    result = self._call(index, fn)
+                self.route.model = self.route.candidates[self._active]
+                return result
+            except Exception as e:
+                # A failed hedge has already tried the next candidate
+                index = self._active if hedge is not None else index
+                if not _can_fail_over(e) or index + 1 >= len(self.models):
+                    raise
+                source, target = self.route.candidates[index], self.route.candidates[index + 1]
+                logger.warning(f"Failing over from {source} to {target}: {e}")
+                self.route.fallback(source, target, e, call)
+                index += 1
+                self._switch(index)
+                hedge = None
+
+    def generate(self, *args, **kwargs):
+        return self._run(lambda model: model.generate(*args, **kwargs))
+
+    def generate_stream(self, *args, **kwargs):
+        # Failing over is only possible before the first chunk
+        self._calls += 1
+        call = self._calls
+        index = self._active
+        while True:
+            name = self.route.candidates[index]
+            started = time.perf_counter()
+            received = False
+            try:
+                for delta in self.models[index].generate_stream(*args, **kwargs):
+                    received = True
+                    yield delta
+            except Exception as e:
+                if isinstance(e, ExecutionCancelled):
+                    raise
+                self.router.observe(name, time.perf_counter() - started, ok=False)
+                if received or not _can_fail_over(e) or index + 1 >= len(self.models):
+                    raise
+                logger.warning(f"Failing over from {name} to {self.route.candidates[index + 1]}: {e}")
+                self.route.fallback(name, self.route.candidates[index + 1], e, call)
+                index += 1
+                self._switch(index)
+                continue
+            self.router.observe(name, time.perf_counter() - started, ok=True)
+            self.route.model = name
+            return
@@ -0,0 +1,366 @@
+"""
+Agent Process Pool
+
+Runs agent executions in pre-started worker processes instead of the API
+process, so CPU-heavy agent code does not contend on the GIL with request
+handling (AGENT_EXECUTION_MODE=process).
+
+Workers are started through a fork server that has smolagents, LiteLLM and
+the registries already imported; each worker then builds its models and
+tools once and serves runs until it is recycled. The thread pool still does
+admission and fair scheduling: each pool thread hands its run to an idle
+worker process and relays step records, cancellation and the result.
+
+- AGENT_PROCESS_MAX_RUNS: replace a worker after this many runs (0 = never)
+- AGENT_PROCESS_MAX_MEMORY_MB: kill a worker whose RSS grows past this, failing its run
+- AGENT_PROCESS_KILL_GRACE_SECONDS: how long a stopped run may take to wind down before its worker is killed
+
+A worker that crashes fails only the run it was executing and is replaced.
+"""
+
+from queue import Queue
+from typing import Any, Callable, Dict, Optional
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from execution_control import BUDGET_EXCEEDED, CANCELLED, TIMED_OUT, ExecutionBudget, ExecutionCancelled
+from metrics import PROCESS_RESTARTS
+
+logger = logging.getLogger(__name__)
+
+# Imported once by the fork server so new workers start with them loaded
+PRELOAD_MODULES = ["litellm", "smolagents", "pooled_model", "process_pool", "agent_executor", "tool_registry"]
+
+# Cancel flag values shared with a worker while it runs
+_STOP_CODES = {CANCELLED: 1, TIMED_OUT: 2, BUDGET_EXCEEDED: 3}
+_STOP_STATUSES = {code: status for status, code in _STOP_CODES.items()}
+
+
+class AgentProcessError(RuntimeError):
+    """Raised when a run fails inside a worker process, or the worker dies"""
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _WorkerProcess:
+    """One worker process and the pipes and cancel flag it shares with the API"""
+
+    def __init__(self, ctx, index: int):
+        self.index = index
+        self.runs = 0
+        inbox_reader, self.inbox = ctx.Pipe(duplex=False)
+        self.outbox, outbox_writer = ctx.Pipe(duplex=False)
+        self.cancel_flag = ctx.Value("i", 0, lock=False)
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(inbox_reader, outbox_writer, self.cancel_flag),
+            name=f"agent-process-{index}",
+            daemon=True,
+        )
+        self.process.start()
+        inbox_reader.close()
+        outbox_writer.close()
+
+    def stop(self, timeout: float = 5.0):
+        """Ask the worker to exit, killing it if it does not"""
+        try:
+            self.inbox.send(("stop", None))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(5.0)
+        self.inbox.close()
+        self.outbox.close()
+
+
+class AgentProcessPool:
+    """Fixed set of worker processes, each running one agent execution at a time"""
+
+    def __init__(
+        self,
+        size: int,
+        max_runs: int = 100,
+        max_memory_mb: int = 0,
+        kill_grace_seconds: float = 10.0,
+        poll_interval: float = 0.25,
+    ):
+        """
+        Args:
+            size: Number of worker processes; match the thread pool's max_workers
+            max_runs: Runs after which a worker is replaced (0 = never)
+            max_memory_mb: RSS limit per worker; exceeding it kills the worker (0 = none)
+            kill_grace_seconds: Time a stopped run gets before its worker is killed
+            poll_interval: How often a waiting run checks budget, liveness and memory
+        """
+        self.size = size
+        self.max_runs = max_runs
+        self.max_memory_mb = max_memory_mb
+        self.kill_grace_seconds = kill_grace_seconds
+        self.poll_interval = poll_interval
+
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._idle: "Queue[_WorkerProcess]" = Queue()
+        self._lock = threading.Lock()
+        self._workers: Dict[int, _WorkerProcess] = {}
+        self._stopping = False
+        self._counters = {"runs": 0, "recycled": 0, "crashed": 0, "killed": 0, "memory": 0}
+
+    @classmethod
+    def from_env(cls, size: int) -> "AgentProcessPool":
+        return cls(
+            size=size,
+            max_runs=int(os.getenv("AGENT_PROCESS_MAX_RUNS", "100")),
+            max_memory_mb=int(os.getenv("AGENT_PROCESS_MAX_MEMORY_MB", "0")),
+            kill_grace_seconds=float(os.getenv("AGENT_PROCESS_KILL_GRACE_SECONDS", "10")),
+        )
+
+    def start(self):
+        """Start the workers; they finish initializing in the background"""
+        if self._ctx.get_start_method() == "forkserver":
+            self._ctx.set_forkserver_preload(PRELOAD_MODULES)
+        for index in range(self.size):
+            worker = _WorkerProcess(self._ctx, index)
+            self._workers[index] = worker
+            self._idle.put(worker)
+        logger.info(
+            f"Agent process pool started: workers={self.size}, "
+            f"max_runs={self.max_runs}, max_memory_mb={self.max_memory_mb or 'unlimited'}"
+        )
+
+    def run(
+        self,
+        payload: Dict[str, Any],
+        budget: ExecutionBudget,
+        on_step: Callable[[Dict[str, Any]], None]
+    ) -> Dict[str, Any]:
+        """
+        Run one execution on an idle worker, blocking the calling thread
+
+        Step records are passed to `on_step` as they arrive. When the budget
+        stops, the worker is told to stop the agent and is killed if it has
+        not finished within the kill grace period.
+
+        Raises:
+            ExecutionCancelled: If the run was cancelled or ran out of budget
+            AgentProcessError: If the run failed or its worker died
+        """
+        worker = self._idle.get()
+        restart: Optional[str] = None
+        try:
+            worker.runs += 1
+            worker.cancel_flag.value = 0
+            try:
+                worker.inbox.send(("run", payload))
+            except OSError:
+                restart = "crashed"
+                raise self._crash_error(worker)
+            stop_deadline = None
+
+            while True:
+                if worker.outbox.poll(self.poll_interval):
+                    try:
+                        kind, data = worker.outbox.recv()
+                    except (EOFError, OSError):
+                        restart = "crashed"
+                        raise self._crash_error(worker)
+                    if kind == "step":
+                        on_step(data)
+                    elif kind == "result":
+                        return data
+                    elif kind == "cancelled":
+                        raise ExecutionCancelled(budget.status or data["status"], budget.reason or data["message"])
+                    elif kind == "error":
+                        raise AgentProcessError(data["message"])
+                    continue
+
+                if not worker.process.is_alive():
+                    restart = "crashed"
+                    raise self._crash_error(worker)
+
+                if self.max_memory_mb:
+                    rss = _rss_mb(worker.process.pid)
+                    if rss is not None and rss > self.max_memory_mb:
+                        restart = "memory"
+                        raise AgentProcessError(
+                            f"Agent worker exceeded its memory limit of {self.max_memory_mb} MB"
+                        )
+
+                if budget.exceeded():
+                    worker.cancel_flag.value = _STOP_CODES.get(budget.status, _STOP_CODES[CANCELLED])
+                    if stop_deadline is None:
+                        stop_deadline = time.monotonic() + self.kill_grace_seconds
+                    elif time.monotonic() > stop_deadline:
+                        restart = "killed"
+                        raise ExecutionCancelled(budget.status, budget.reason)
+        finally:
+            with self._lock:
+                self._counters["runs"] += 1
+            self._release(worker, restart)
+
+    def _crash_error(self, worker: _WorkerProcess) -> AgentProcessError:
+        worker.process.join(1.0)
+        return AgentProcessError(
+            f"Agent worker process exited unexpectedly (exit code {worker.process.exitcode})"
+        )
+
+    def _release(self, worker: _WorkerProcess, restart: Optional[str]):
+        if restart is None and self.max_runs and worker.runs >= self.max_runs:
+            restart = "recycled"
+        if restart is None:
+            with self._lock:
+                if not self._stopping:
+                    self._idle.put(worker)
+                    return
+                self._workers.pop(worker.index, None)
+            worker.stop()
+            return
+
+        if restart == "recycled":
+            worker.stop()
+        else:
+            worker.kill()
+        logger.info(f"Replacing agent worker process {worker.index} ({restart})")
+        PROCESS_RESTARTS.labels(restart).inc()
+        with self._lock:
+            self._counters[restart] += 1
+            if self._stopping:
+                self._workers.pop(worker.index, None)
+                return
+            replacement = self._workers[worker.index] = _WorkerProcess(self._ctx, worker.index)
+            self._idle.put(replacement)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            workers = list(self._workers.values())
+            counters = dict(self._counters)
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "alive": sum(1 for w in workers if w.process.is_alive()),
+            "max_runs": self.max_runs,
+            "max_memory_mb": self.max_memory_mb,
+            "rss_mb": {w.index: round(_rss_mb(w.process.pid) or 0.0, 1) for w in workers},
+            **counters,
+        }
+
+    def shutdown(self):
+        """Stop idle workers now; busy ones stop when their run returns"""
+        with self._lock:
+            self._stopping = True
+            idle = []
+            while not self._idle.empty():
+                worker = self._idle.get_nowait()
+                self._workers.pop(worker.index, None)
+                idle.append(worker)
+        for worker in idle:
+            worker.stop()
+
+
+def create_process_pool(size: int) -> Optional[AgentProcessPool]:
+    """
+    Build a process pool when AGENT_EXECUTION_MODE is "process"
+
+    The pool is not started; runs submitted before `start()` wait for it.
+    Returns None in the default "thread" mode, where runs stay in the
+    worker pool's threads.
+    """
+    mode = os.getenv("AGENT_EXECUTION_MODE", "thread").lower()
+    if mode == "thread":
+        return None
+    if mode != "process":
+        raise ValueError(f"Unknown AGENT_EXECUTION_MODE: {mode}")
+    return AgentProcessPool.from_env(size)
+
+
+class _CancelFlag:
+    """Cancel signals of a worker process: the flag the API sets for the current run"""
+
+    def __init__(self, flag):
+        self.flag = flag
+
+    def requested(self, execution_id: str) -> Optional[str]:
+        return _STOP_STATUSES.get(self.flag.value)
+
+
+class _PipeEvents:
+    """Step event sink of a worker process: sends step records to the API"""
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+
+    def publish(self, execution_id: str, event: Dict[str, Any]):
+        if event.get("type") == "step":
+            self.outbox.send(("step", {k: v for k, v in event.items() if k != "type"}))
+
+
+def _worker_main(inbox, outbox, cancel_flag):
+    """Entry point of a worker process"""
+    from opentelemetry import context as otel_context
+    from opentelemetry.propagate import extract
+
+    from agent_executor import AgentExecutor
+    from model_registry import ModelRegistry
+    from tool_registry import load_plugins, tool_registry
+    from tracing import setup_tracing, shutdown_tracing
+
+    # Ctrl-C and SIGTERM go to the API, which stops workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    setup_tracing()
+    models = ModelRegistry.from_env()
+    models.warm_up()
+    load_plugins()
+    tool_registry.warm_up()
+    logger.info(f"Agent worker process {os.getpid()} ready")
+
+    while True:
+        try:
+            kind, payload = inbox.recv()
+        except (EOFError, OSError):
+            break
+        if kind == "stop":
+            break
+
+        executor = AgentExecutor(payload["tenant_id"], pool=None, models=models, events=_PipeEvents(outbox))
+        budget = ExecutionBudget(
+            payload["execution_id"],
+            max_seconds=payload["max_seconds"],
+            max_tokens=payload["max_tokens"],
+            signals=_CancelFlag(cancel_flag),
+        )
+        token = otel_context.attach(extract(payload["trace_context"]))
+        try:
+            result = executor._execute_sync(
+                payload["task"],
+                payload["tools"],
+                payload["model"],
+                payload["max_steps"],
+                payload["execution_id"],
+                budget,
+            )
+            outbox.send(("result", result))
+        except ExecutionCancelled as e:
+            outbox.send(("cancelled", {"status": e.status, "message": str(e)}))
+        except Exception as e:
+            outbox.send(("error", {"type": type(e).__name__, "message": str(e)}))
+        finally:
+            otel_context.detach(token)
+
+    models.close()
+    shutdown_tracing()
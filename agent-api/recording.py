@@ -0,0 +1,300 @@
+"""
+Record and Replay of LLM and Tool Interactions
+
+Makes agent runs exactly repeatable, so changes to the agent loop can be
+measured in isolation. In record mode every LLM completion and every tool
+call is saved to disk; in replay mode they are served back from there and
+nothing leaves the process, so replaying captured executions measures the
+platform's own CPU, memory and database overhead without LLM cost or
+network variance.
+
+Interactions are keyed by a SHA-256 hash of the request: for LLM calls the
+completion arguments (model, messages, stop sequences, tools, ...) minus
+transport details such as the client, API key and timeout; for tools the
+tool name and arguments. Each is stored once, compressed like the
+execution traces, at `<dir>/<kind>/<hash[:2]>/<hash>.<codec>`. Because
+a replayed run sees the same tool outputs, it produces the same LLM
+requests, so whole executions replay step for step. The execution requests
+themselves are recorded too (`<dir>/run/`), and `benchmark.py --replay`
+re-submits them against a replaying API.
+
+Configuration:
+- AGENT_RECORD_MODE: off (default), record or replay
+- AGENT_RECORDING_DIR: where interactions are stored (default ./recordings)
+- AGENT_REPLAY_LATENCY: recorded (sleep as long as the original call) or zero
+
+A replayed request that was never recorded fails with ReplayMissError.
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import functools
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+
+# Completion arguments that do not change the response
+_TRANSPORT_KWARGS = {"client", "timeout", "api_key", "api_base", "stream", "stream_options"}
+
+
+class ReplayMissError(LookupError):
+    """Raised in replay mode when a request has no recorded interaction"""
+
+
+def request_key(kind: str, request: Dict[str, Any]) -> str:
+    """Content hash of a request; stable across processes and key order"""
+    raw = json.dumps({"kind": kind, **request}, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class InteractionRecorder:
+    """Content-addressed store of LLM and tool interactions, plus the wrappers that use it"""
+
+    def __init__(self, mode: str = OFF, directory: str = "recordings", replay_latency: str = "recorded"):
+        if mode not in (OFF, RECORD, REPLAY):
+            raise ValueError(f"Unknown AGENT_RECORD_MODE: {mode}")
+        if replay_latency not in ("recorded", "zero"):
+            raise ValueError(f"Unknown AGENT_REPLAY_LATENCY: {replay_latency}")
+        self.mode = mode
+        self.directory = directory
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._counters = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    @classmethod
+    def from_env(cls) -> "InteractionRecorder":
+        return cls(
+            mode=os.getenv("AGENT_RECORD_MODE", OFF).lower(),
+            directory=os.getenv("AGENT_RECORDING_DIR", "recordings"),
+            replay_latency=os.getenv("AGENT_REPLAY_LATENCY", "recorded").lower(),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != OFF
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _path(self, kind: str, key: str, encoding: str) -> str:
+        return os.path.join(self.directory, kind, key[:2], f"{key}.{encoding}")
+
+    def save(self, kind: str, key: str, entry: Dict[str, Any]):
+        """Store an interaction; identical requests overwrite each other atomically"""
+        from trace_store import compress_step
+
+        payload, encoding = compress_step(entry)
+        path = self._path(kind, key, encoding)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        self._count("recorded")
+
+    def load(self, kind: str, key: str) -> Dict[str, Any]:
+        """
+        Read a recorded interaction
+
+        Raises:
+            ReplayMissError: If nothing was recorded for the key
+        """
+        from trace_store import decompress_step
+
+        for encoding in ("zstd", "zlib"):
+            path = self._path(kind, key, encoding)
+            try:
+                with open(path, "rb") as f:
+                    entry = decompress_step(f.read(), encoding)
+            except FileNotFoundError:
+                continue
+            self._count("replayed")
+            return entry
+        self._count("misses")
+        raise ReplayMissError(f"No recorded {kind} interaction {key[:12]} in {self.directory}")
+
+    def record_run(self, request: Dict[str, Any]):
+        """Save an execution request (task, tools, model, max_steps) so it can be re-submitted"""
+        if self.mode == RECORD:
+            self.save("run", request_key("run", request), request)
+
+    def runs(self) -> List[Dict[str, Any]]:
+        """The recorded execution requests, oldest first"""
+        from trace_store import decompress_step
+
+        entries = []
+        for root, _, files in os.walk(os.path.join(self.directory, "run")):
+            for name in files:
+                key, _, encoding = name.partition(".")
+                if encoding not in ("zstd", "zlib"):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, "rb") as f:
+                    entries.append((os.path.getmtime(path), key, decompress_step(f.read(), encoding)))
+        return [request for _, _, request in sorted(entries, key=lambda e: e[:2])]
+
+    def _replay_wait(self, entry: Dict[str, Any], timeout: Optional[float] = None):
+        if self.replay_latency == "zero":
+            return
+        delay = entry.get("latency", 0.0)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Replayed call timed out after {timeout:.1f}s")
+        time.sleep(delay)
+
+    def wrap_client(self, client: Any) -> Any:
+        """Wrap the litellm-style completion client of a model (unchanged when off)"""
+        if self.mode == RECORD:
+            return _RecordingClient(self, client)
+        if self.mode == REPLAY:
+            return _ReplayClient(self)
+        return client
+
+    def wrap_tool(self, name: str, forward: Callable[..., Any]) -> Callable[..., Any]:
+        """Wrap a tool's forward() (unchanged when off)"""
+        if self.mode == OFF:
+            return forward
+
+        @functools.wraps(forward)
+        def wrapper(*args, **kwargs):
+            key = request_key("tool", {"tool": name, "args": list(args), "kwargs": kwargs})
+            if self.mode == REPLAY:
+                entry = self.load("tool", key)
+                self._replay_wait(entry)
+                if entry["error"]:
+                    # Same type name, so the agent sees the same error text
+                    raise type(entry["error"]["type"], (Exception,), {})(entry["error"]["message"])
+                return entry["output"]
+
+            started = time.perf_counter()
+            try:
+                output = forward(*args, **kwargs)
+            except Exception as e:
+                self.save("tool", key, {
+                    "tool": name,
+                    "output": None,
+                    "error": {"type": type(e).__name__, "message": str(e)},
+                    "latency": time.perf_counter() - started,
+                })
+                raise
+            self.save("tool", key, {
+                "tool": name,
+                "output": output,
+                "error": None,
+                "latency": time.perf_counter() - started,
+            })
+            return output
+
+        return wrapper
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        return {"mode": self.mode, "directory": self.directory, "replay_latency": self.replay_latency, **counters}
+
+
+def _llm_key(model: str, messages: Any, kwargs: Dict[str, Any]) -> str:
+    request = {k: v for k, v in kwargs.items() if k not in _TRANSPORT_KWARGS}
+    return request_key("llm", {"model": model, "messages": messages, **request})
+
+
+class _RecordingClient:
+    """Passes completions through to the real client and records them"""
+
+    def __init__(self, recorder: InteractionRecorder, client: Any):
+        self.recorder = recorder
+        self.client = client
+
+    def completion(self, model: str, messages: Any, stream: bool = False, **kwargs):
+        key = _llm_key(model, messages, kwargs)
+        started = time.perf_counter()
+        response = self.client.completion(model=model, messages=messages, stream=stream, **kwargs)
+        if stream:
+            return self._record_stream(key, model, response, started)
+
+        from step_events import cache_tokens
+
+        message = response.choices[0].message.model_dump(include={"content", "tool_calls"})
+        cache_read, cache_creation = cache_tokens(response.usage)
+        self.recorder.save("llm", key, {
+            "model": model,
+            "content": message.get("content"),
+            "tool_calls": message.get("tool_calls"),
+            "prompt_tokens": response.usage.prompt_tokens,
+            "completion_tokens": response.usage.completion_tokens,
+            "cache_read_tokens": cache_read or 0,
+            "cache_creation_tokens": cache_creation or 0,
+            "latency": time.perf_counter() - started,
+        })
+        return response
+
+    def _record_stream(self, key: str, model: str, events: Iterator[Any], started: float) -> Iterator[Any]:
+        from step_events import cache_tokens
+
+        # Text streams only; streamed tool call deltas are not reassembled
+        parts = []
+        prompt_tokens = completion_tokens = cache_read = cache_creation = 0
+        for event in events:
+            if getattr(event, "usage", None):
+                prompt_tokens += event.usage.prompt_tokens
+                completion_tokens += event.usage.completion_tokens
+                read, created = cache_tokens(event.usage)
+                cache_read += read or 0
+                cache_creation += created or 0
+            if event.choices and event.choices[0].delta.content:
+                parts.append(event.choices[0].delta.content)
+            yield event
+        self.recorder.save("llm", key, {
+            "model": model,
+            "content": "".join(parts),
+            "tool_calls": None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cache_read_tokens": cache_read,
+            "cache_creation_tokens": cache_creation,
+            "latency": time.perf_counter() - started,
+        })
+
+
+class _ReplayClient:
+    """Serves completions from the recordings, never touching the network"""
+
+    def __init__(self, recorder: InteractionRecorder):
+        self.recorder = recorder
+
+    def completion(self, model: str, messages: Any, stream: bool = False, **kwargs):
+        from mock_llm import completion_response, stream_response
+
+        entry = self.recorder.load("llm", _llm_key(model, messages, kwargs))
+        self.recorder._replay_wait(entry, kwargs.get("timeout"))
+        if stream:
+            return stream_response(
+                entry["content"] or "",
+                entry["prompt_tokens"],
+                entry["completion_tokens"],
+                entry.get("cache_read_tokens", 0),
+                entry.get("cache_creation_tokens", 0),
+            )
+        return completion_response(
+            model,
+            entry["content"],
+            entry["prompt_tokens"],
+            entry["completion_tokens"],
+            entry["tool_calls"],
+            entry.get("cache_read_tokens", 0),
+            entry.get("cache_creation_tokens", 0),
+        )
+
+
+# Process-wide recorder used by the model and tool registries
+recorder = InteractionRecorder.from_env()
@@ -0,0 +1,202 @@
+"""
+Cached Web Search Tool
+
+Drop-in replacement for smolagents' DuckDuckGoSearchTool that caches results
+per normalized query for a configurable TTL and coalesces concurrent
+identical queries, so N executions searching the same thing at once make a
+single upstream call. A caller coalesced onto a search that is still
+running after WEB_SEARCH_COALESCE_TIMEOUT_SECONDS, or after its execution's
+remaining time, gives up waiting and searches on its own.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+import os
+import re
+import threading
+import time
+
+import httpx
+from smolagents import Tool
+
+from execution_control import current_budget
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a query: case-folded with whitespace collapsed"""
+    return re.sub(r"\s+", " ", query).strip().casefold()
+
+
+class SearchResultCache:
+    """TTL cache with single-flight loading"""
+
+    def __init__(self, ttl_seconds: float = 300.0, max_entries: int = 10000, coalesce_timeout: float = 20.0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.coalesce_timeout = coalesce_timeout
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "coalesce_timeouts": 0,
+            "errors": 0,
+            "evictions": 0,
+        }
+
+    def get(self, query: str, load: Callable[[str], str]) -> str:
+        """
+        Return the cached result for `query`, calling `load` on a miss.
+
+        Concurrent misses for the same normalized query wait for the first
+        caller's load instead of starting their own, for at most
+        `coalesce_timeout` seconds or the execution's remaining time; then
+        they load on their own. Failures are not cached.
+        """
+        key = normalize_query(query)
+
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return cached[1]
+
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            try:
+                return future.result(timeout=self._wait_timeout())
+            except FutureTimeoutError:
+                with self._lock:
+                    self._stats["coalesce_timeouts"] += 1
+                logger.warning(f"Coalesced search still running after {self.coalesce_timeout:g}s; searching again")
+                return self._load(key, query, load)
+
+        try:
+            result = self._load(key, query, load)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+        future.set_result(result)
+        return result
+
+    def _wait_timeout(self) -> float:
+        budget = current_budget.get()
+        remaining = budget.remaining_seconds() if budget else None
+        return self.coalesce_timeout if remaining is None else min(self.coalesce_timeout, remaining)
+
+    def _load(self, key: str, query: str, load: Callable[[str], str]) -> str:
+        try:
+            result = load(query)
+        except BaseException:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "inflight": len(self._inflight),
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+class HTTPSearchBackend:
+    """
+    Search backend calling `GET {url}?q=...&max_results=...` that returns a
+    JSON list of {"title", "href", "body"} results. Used to point web_search
+    at a local stub service in tests and benchmarks.
+    """
+
+    def __init__(self, url: str, max_results: int = 10, timeout: float = 20.0):
+        self.url = url
+        self.max_results = max_results
+        self._client = httpx.Client(timeout=timeout)
+
+    def __call__(self, query: str) -> str:
+        response = self._client.get(self.url, params={"q": query, "max_results": self.max_results})
+        response.raise_for_status()
+        return format_results(response.json())
+
+
+class DuckDuckGoSearchBackend:
+    """Live DuckDuckGo search through smolagents' DuckDuckGoSearchTool"""
+
+    def __init__(self, max_results: int = 10):
+        from smolagents import DuckDuckGoSearchTool
+
+        self._tool = DuckDuckGoSearchTool(max_results=max_results)
+
+    def __call__(self, query: str) -> str:
+        return self._tool.forward(query)
+
+
+def format_results(results: list) -> str:
+    """Format results the way DuckDuckGoSearchTool does"""
+    if len(results) == 0:
+        raise Exception("No results found! Try a less restrictive/shorter query.")
+    postprocessed_results = [f"[{result['title']}]({result['href']})\n{result['body']}" for result in results]
+    return "## Search Results\n\n" + "\n\n".join(postprocessed_results)
+
+
+class CachedSearchTool(Tool):
+    """web_search tool backed by a SearchResultCache"""
+
+    name = "web_search"
+    description = """Performs a duckduckgo web search based on your query (think a Google search) then returns the top search results."""
+    inputs = {"query": {"type": "string", "description": "The search query to perform."}}
+    output_type = "string"
+
+    def __init__(self, backend: Callable[[str], str], cache: Optional[SearchResultCache] = None):
+        super().__init__()
+        self.backend = backend
+        self.cache = cache or SearchResultCache()
+
+    @classmethod
+    def from_env(cls) -> "CachedSearchTool":
+        max_results = int(os.getenv("WEB_SEARCH_MAX_RESULTS", "10"))
+        backend_url = os.getenv("WEB_SEARCH_BACKEND_URL")
+        if backend_url:
+            logger.info(f"Using HTTP search backend: {backend_url}")
+            backend = HTTPSearchBackend(backend_url, max_results=max_results)
+        else:
+            backend = DuckDuckGoSearchBackend(max_results=max_results)
+
+        cache = SearchResultCache(
+            ttl_seconds=float(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", "300")),
+            max_entries=int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "10000")),
+            coalesce_timeout=float(os.getenv("WEB_SEARCH_COALESCE_TIMEOUT_SECONDS", "20")),
+        )
+        return cls(backend=backend, cache=cache)
+
+    def forward(self, query: str) -> str:
+        return self.cache.get(query, self.backend)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
@@ -0,0 +1,171 @@
+"""
+Startup, Readiness and Schema Migrations
+
+The API opens its port as soon as the cheap parts of startup are done; model
+clients, tools and worker processes are warmed up afterwards in the
+background. `/health/live` answers from the moment the port is open, while
+`/health/ready` waits for the warm-up and for a reachable database whose
+schema is at the latest Alembic revision.
+
+The schema is managed by the Alembic migrations in `migrations/`, run with
+`alembic upgrade head` before the API starts (or DB_MIGRATE_ON_STARTUP=true).
+
+Import time of the service is budgeted with IMPORT_TIME_BUDGET_MS: the API
+logs a warning when its imports exceed it, and
+
+    python startup.py --check-imports
+
+measures `import main` in a fresh interpreter and exits non-zero when over
+budget, listing the slowest modules.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from metrics import STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+
+def import_budget_ms() -> float:
+    return float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+
+
+class StartupState:
+    """Startup phase timings and readiness of the process"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.warmed_up = False
+        self.schema_current = False
+        self.schema_detail: Optional[str] = None
+        self.errors: List[str] = []
+
+    def record(self, phase: str, seconds: float):
+        self.phases[phase] = round(seconds, 4)
+        STARTUP_SECONDS.labels(phase).set(seconds)
+
+    def check_import_budget(self, seconds: float):
+        self.record("import", seconds)
+        budget = import_budget_ms()
+        if seconds * 1000 > budget:
+            logger.warning(
+                f"Service imports took {seconds * 1000:.0f}ms, over the "
+                f"IMPORT_TIME_BUDGET_MS of {budget:.0f}ms"
+            )
+        else:
+            logger.info(f"Service imports took {seconds * 1000:.0f}ms")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "warmed_up": self.warmed_up,
+            "schema_current": self.schema_current,
+            "schema": self.schema_detail,
+            "phases": self.phases,
+            "errors": self.errors,
+        }
+
+
+def _alembic_config():
+    from alembic.config import Config
+
+    config = Config(ALEMBIC_INI)
+    # Keep the service's logging setup (see migrations/env.py)
+    config.attributes["configure_logger"] = False
+    return config
+
+
+def run_migrations():
+    """Upgrade the database schema to the latest revision (blocking)"""
+    from alembic import command
+
+    started = time.perf_counter()
+    command.upgrade(_alembic_config(), "head")
+    logger.info(f"Database schema migrated in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+def _revisions(connection) -> Tuple[Optional[str], Optional[str]]:
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    current = MigrationContext.configure(connection).get_current_revision()
+    head = ScriptDirectory.from_config(_alembic_config()).get_current_head()
+    return current, head
+
+
+async def check_schema(engine, state: StartupState) -> bool:
+    """Whether the database schema is at the latest migration; records the outcome"""
+    try:
+        async with engine.connect() as conn:
+            current, head = await conn.run_sync(_revisions)
+    except Exception as e:
+        state.schema_detail = f"schema check failed: {e}"
+        return False
+    state.schema_current = current == head
+    state.schema_detail = f"revision {current or 'none'}, latest {head}"
+    if not state.schema_current:
+        logger.warning(f"Database schema is not current ({state.schema_detail}); run `alembic upgrade head`")
+    return state.schema_current
+
+
+def measure_imports(module: str = "main") -> Tuple[float, List[Tuple[int, str]]]:
+    """
+    Import `module` in a fresh interpreter with -X importtime
+
+    Returns the total import time in seconds and the slowest modules as
+    (cumulative microseconds, name) pairs.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    total = 0
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not cumulative.isdigit():
+            continue
+        modules.append((int(cumulative), name))
+        if name == module:
+            total = int(cumulative)
+    return total / 1e6, sorted(modules, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup checks for the Agent Platform API")
+    parser.add_argument("--check-imports", action="store_true", help="Fail when importing main exceeds IMPORT_TIME_BUDGET_MS")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest modules to list")
+    args = parser.parse_args()
+    if not args.check_imports:
+        parser.print_help()
+        return
+
+    seconds, modules = measure_imports()
+    budget = import_budget_ms()
+    print(f"import main: {seconds * 1000:.0f}ms (budget {budget:.0f}ms)")
+    # Top-level packages only; nested modules are included in their parents
+    top_level = [(us, name) for us, name in modules if "." not in name and name != "main"]
+    for us, name in top_level[:args.top]:
+        print(f"  {us / 1000:8.1f}ms  {name}")
+    if seconds * 1000 > budget:
+        print("Import time budget exceeded")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
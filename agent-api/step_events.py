@@ -0,0 +1,299 @@
+"""
+Agent Step Events
+
+Turns smolagents memory steps into JSON step records and fans them out to
+live subscribers while an execution runs. Events are published from worker
+threads (or worker processes, with Redis) and consumed by the SSE endpoint.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Event types that end a stream
+TERMINAL_EVENTS = ("final", "error")
+
+
+def cache_tokens(usage: Any) -> Tuple[Optional[int], Optional[int]]:
+    """
+    (cache read tokens, cache creation tokens) from a litellm usage object;
+    None where the provider did not report them
+
+    Anthropic reports both; OpenAI's automatic prefix caching only reports
+    reads, under prompt_tokens_details.
+    """
+    if usage is None:
+        return None, None
+    read = getattr(usage, "cache_read_input_tokens", None)
+    if read is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        read = getattr(details, "cached_tokens", None) if details is not None else None
+    return read, getattr(usage, "cache_creation_input_tokens", None)
+
+
+def step_record(step: Any) -> Dict[str, Any]:
+    """
+    Build a JSON-serializable record from a smolagents ActionStep
+
+    Reads the fields smolagents keeps in `agent.memory.steps`: generated
+    code, tool calls, observations, timing and token usage. Prompt cache
+    usage comes from the raw provider response, which streamed steps lack.
+    """
+    token_usage = getattr(step, "token_usage", None)
+    message = getattr(step, "model_output_message", None)
+    cached, cache_created = cache_tokens(getattr(getattr(message, "raw", None), "usage", None))
+    timing = getattr(step, "timing", None)
+    error = getattr(step, "error", None)
+
+    return {
+        "step": step.step_number,
+        "model_output": step.model_output if isinstance(step.model_output, str) else None,
+        "code": step.code_action,
+        "tool_calls": [
+            {"name": call.name, "arguments": _jsonable(call.arguments)}
+            for call in (step.tool_calls or [])
+        ],
+        "observations": step.observations,
+        "error": str(error) if error else None,
+        "is_final_answer": step.is_final_answer,
+        "started_at": timing.start_time if timing else None,
+        "duration": round(timing.duration, 4) if timing and timing.duration is not None else None,
+        "input_tokens": token_usage.input_tokens if token_usage else None,
+        "output_tokens": token_usage.output_tokens if token_usage else None,
+        # input_tokens counts cached tokens too; only the uncached ones pay full price
+        "cached_input_tokens": cached,
+        "cache_creation_input_tokens": cache_created,
+        "uncached_input_tokens": (
+            token_usage.input_tokens - (cached or 0) if token_usage and cached is not None else None
+        ),
+    }
+
+
+def _jsonable(value: Any) -> Any:
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class StepEventBroker(ABC):
+    """Interface shared by the step event brokers"""
+
+    backend = "base"
+
+    @abstractmethod
+    def publish(self, execution_id: str, event: Dict[str, Any]):
+        """Publish an event; safe to call from any thread"""
+
+    @abstractmethod
+    def subscribe(
+        self,
+        execution_id: str,
+        after_seq: int = 0,
+        heartbeat: float = 15.0
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield events for an execution, replaying those already published.
+
+        Yields None every `heartbeat` seconds without events so callers can
+        keep idle connections alive. Stops after a terminal event.
+        """
+
+    async def close(self):
+        pass
+
+
+class _Channel:
+    __slots__ = ("history", "subscribers", "next_seq", "updated_at", "closed")
+
+    def __init__(self):
+        self.history = []
+        self.subscribers: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = set()
+        self.next_seq = 1
+        self.updated_at = time.monotonic()
+        self.closed = False
+
+
+class InMemoryStepEventBroker(StepEventBroker):
+    """Per-process broker; events are kept for a while after a run ends"""
+
+    backend = "memory"
+
+    def __init__(self, retention_seconds: float = 300.0, history_limit: int = 1000):
+        self.retention_seconds = retention_seconds
+        self.history_limit = history_limit
+        self._lock = threading.Lock()
+        self._channels: Dict[str, _Channel] = {}
+
+    def publish(self, execution_id: str, event: Dict[str, Any]):
+        with self._lock:
+            self._expire()
+            channel = self._channels.setdefault(execution_id, _Channel())
+            event = {**event, "seq": channel.next_seq}
+            channel.next_seq += 1
+            channel.history.append(event)
+            if len(channel.history) > self.history_limit:
+                del channel.history[0]
+            channel.updated_at = time.monotonic()
+            channel.closed = event.get("type") in TERMINAL_EVENTS
+            subscribers = list(channel.subscribers)
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # Subscriber's event loop is gone
+                pass
+
+    async def subscribe(
+        self,
+        execution_id: str,
+        after_seq: int = 0,
+        heartbeat: float = 15.0
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            channel = self._channels.setdefault(execution_id, _Channel())
+            history = list(channel.history)
+            channel.subscribers.add(subscriber)
+
+        try:
+            last_seq = after_seq
+            for event in history:
+                if event["seq"] <= last_seq:
+                    continue
+                last_seq = event["seq"]
+                yield event
+                if event.get("type") in TERMINAL_EVENTS:
+                    return
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber[1].get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event["seq"] <= last_seq:
+                    continue
+                last_seq = event["seq"]
+                yield event
+                if event.get("type") in TERMINAL_EVENTS:
+                    return
+        finally:
+            with self._lock:
+                channel.subscribers.discard(subscriber)
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [
+            execution_id
+            for execution_id, channel in self._channels.items()
+            if not channel.subscribers
+            and now - channel.updated_at > (self.retention_seconds if channel.closed else 3600)
+        ]
+        for execution_id in expired:
+            del self._channels[execution_id]
+
+
+class RedisStepEventBroker(StepEventBroker):
+    """
+    Cross-process broker: each event is appended to a Redis list (for replay)
+    and published on a pub/sub channel (for live delivery).
+    """
+
+    backend = "redis"
+
+    def __init__(self, redis_url: str, retention_seconds: int = 300, prefix: str = "agent:events"):
+        import redis
+        import redis.asyncio as aredis
+
+        self.retention_seconds = retention_seconds
+        self.prefix = prefix
+        # Publishing happens on worker threads, so it uses the blocking client
+        self._redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        self._aredis = aredis.from_url(redis_url, decode_responses=True)
+
+    def _key(self, execution_id: str) -> str:
+        return f"{self.prefix}:{execution_id}"
+
+    def publish(self, execution_id: str, event: Dict[str, Any]):
+        key = self._key(execution_id)
+        try:
+            seq = self._redis.rpush(key, json.dumps(event))
+            terminal = event.get("type") in TERMINAL_EVENTS
+            self._redis.expire(key, self.retention_seconds if terminal else 3600)
+            self._redis.publish(key, json.dumps({**event, "seq": seq}))
+        except Exception as e:
+            # Streaming is best-effort and must never fail the execution
+            logger.warning(f"Failed to publish step event for {execution_id}: {e}")
+
+    async def subscribe(
+        self,
+        execution_id: str,
+        after_seq: int = 0,
+        heartbeat: float = 15.0
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        key = self._key(execution_id)
+        pubsub = self._aredis.pubsub()
+        # Subscribe before reading history so nothing falls in between
+        await pubsub.subscribe(key)
+        try:
+            last_seq = after_seq
+            for seq, raw in enumerate(await self._aredis.lrange(key, 0, -1), start=1):
+                if seq <= last_seq:
+                    continue
+                last_seq = seq
+                event = {**json.loads(raw), "seq": seq}
+                yield event
+                if event.get("type") in TERMINAL_EVENTS:
+                    return
+
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+                if message is None:
+                    yield None
+                    continue
+                event = json.loads(message["data"])
+                if event["seq"] <= last_seq:
+                    continue
+                last_seq = event["seq"]
+                yield event
+                if event.get("type") in TERMINAL_EVENTS:
+                    return
+        finally:
+            await pubsub.unsubscribe(key)
+            await pubsub.aclose()
+
+    async def close(self):
+        self._redis.close()
+        await self._aredis.aclose()
+
+
+def create_step_event_broker() -> StepEventBroker:
+    """
+    Build the broker selected by STEP_EVENTS_BACKEND ("redis" or "memory").
+
+    Defaults to Redis when REDIS_URL is set, so events published by separate
+    worker processes reach the API process serving the stream.
+    """
+    redis_url = os.getenv("REDIS_URL")
+    backend = os.getenv("STEP_EVENTS_BACKEND", "redis" if redis_url else "memory").lower()
+    retention = int(os.getenv("STEP_EVENTS_RETENTION_SECONDS", "300"))
+
+    if backend == "redis":
+        if not redis_url:
+            raise ValueError("REDIS_URL not set for the redis step events backend")
+        return RedisStepEventBroker(redis_url, retention_seconds=retention)
+
+    if backend == "memory":
+        return InMemoryStepEventBroker(retention_seconds=retention)
+
+    raise ValueError(f"Unknown STEP_EVENTS_BACKEND: {backend}")
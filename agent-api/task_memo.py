@@ -0,0 +1,131 @@
+"""
+Agent Task Memoization
+
+Helpers for deduplicating identical agent tasks:
+- a canonical hash of an execution request,
+- lookups of recent completed executions and of Idempotency-Key records,
+- single-flight attachment of concurrent identical requests to one run.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from execution_control import effective_limits
+from models import AgentExecution
+
+logger = logging.getLogger(__name__)
+
+
+def request_hash(
+    tenant_id: str,
+    task: str,
+    tools: Optional[List[str]],
+    model: Optional[str],
+    max_steps: Optional[int],
+    max_execution_time: Optional[int] = None,
+    max_tokens: Optional[int] = None
+) -> str:
+    """
+    Canonical hash of everything that determines an agent run's outcome
+
+    Tool order does not matter; `None` (default tools) and `[]` (no tools)
+    stay distinct. The model falls back to DEFAULT_MODEL and the budgets to
+    the configured limits, like execution does, so a run cut short by a
+    smaller budget is never reused for a larger one.
+    """
+    max_seconds, max_tokens = effective_limits(max_execution_time, max_tokens)
+    canonical = {
+        "tenant_id": tenant_id,
+        "task": task,
+        "tools": sorted(set(tools)) if tools is not None else None,
+        "model": model or os.getenv("DEFAULT_MODEL"),
+        "max_steps": max_steps,
+        "max_execution_time": max_seconds,
+        "max_tokens": max_tokens,
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def find_recent_execution(
+    db: AsyncSession,
+    tenant_id: str,
+    request_hash: str,
+    max_age_seconds: int,
+    statuses: tuple = ("completed",)
+) -> Optional[AgentExecution]:
+    """Most recent execution of the same request within the freshness window"""
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+    result = await db.execute(
+        select(AgentExecution)
+        .where(
+            AgentExecution.tenant_id == tenant_id,
+            AgentExecution.request_hash == request_hash,
+            AgentExecution.status.in_(statuses),
+            AgentExecution.created_at >= cutoff
+        )
+        .order_by(AgentExecution.created_at.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def find_by_idempotency_key(
+    db: AsyncSession,
+    tenant_id: str,
+    idempotency_key: str
+) -> Optional[AgentExecution]:
+    result = await db.execute(
+        select(AgentExecution).where(
+            AgentExecution.tenant_id == tenant_id,
+            AgentExecution.idempotency_key == idempotency_key
+        )
+    )
+    return result.scalar_one_or_none()
+
+
+class InflightRuns:
+    """
+    Single-flight registry for the current process: the first caller for a
+    key runs the work, concurrent callers with the same key await its result.
+    """
+
+    def __init__(self):
+        self._runs: Dict[str, asyncio.Future] = {}
+        self.attached = 0
+
+    def is_running(self, key: str) -> bool:
+        return key in self._runs
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._runs.get(key)
+        if future is not None:
+            self.attached += 1
+            logger.info(f"Attaching to in-flight execution for {key[:16]}")
+            # Shield so a disconnecting follower does not cancel the shared run
+            return await asyncio.shield(future)
+
+        future = self._runs[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Avoid "exception was never retrieved" when nobody attached
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._runs[key]
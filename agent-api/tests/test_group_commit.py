@@ -0,0 +1,140 @@
+import asyncio
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import group_commit
+from database import Base
+from group_commit import GroupCommitWriter
+from models import AgentExecution, AgentExecutionStep
+
+
+def _execution(execution_id, **values):
+    return {
+        "id": execution_id,
+        "tenant_id": "t",
+        "task": "task",
+        "status": "running",
+        "created_at": datetime(2026, 10, 17),
+        **values,
+    }
+
+
+def _step(execution_id, number):
+    return {
+        "execution_id": execution_id,
+        "tenant_id": "t",
+        "step_number": number,
+        "payload": b"{}",
+        "encoding": "json",
+        "created_at": datetime(2026, 10, 17),
+    }
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Point the writer at a fresh SQLite database; yields the list of INSERTs it runs"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'writes.db'}")
+    statements = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT"):
+            rows = len(parameters) if executemany else 1
+            statements.append((statement.split()[2], rows))
+
+    async def create():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create())
+    monkeypatch.setattr(group_commit, "AsyncSessionLocal", async_sessionmaker(engine, expire_on_commit=False))
+    yield engine, statements
+    asyncio.run(engine.dispose())
+
+
+async def _rows(engine, model):
+    async with engine.connect() as connection:
+        return (await connection.execute(select(model))).all()
+
+
+def test_queued_rows_share_one_insert_per_table_in_queue_order(database):
+    engine, statements = database
+
+    async def main():
+        writer = GroupCommitWriter(writers=1)
+        writer.start()
+        # Queued before the writer task runs, so all in one batch
+        futures = [writer.add(AgentExecution, _execution(f"e{i}"), key=f"e{i}") for i in (1, 2)]
+        futures += [writer.add(AgentExecutionStep, _step("e1", n), key="e1") for n in (1, 2, 3)]
+        await asyncio.gather(*futures)
+        await writer.close()
+        return await _rows(engine, AgentExecutionStep)
+
+    steps = asyncio.run(main())
+    # Executions queued first are inserted before their steps
+    assert statements == [("agent_executions", 2), ("agent_execution_steps", 3)]
+    assert [step.step_number for step in sorted(steps, key=lambda s: s.id)] == [1, 2, 3]
+
+
+def test_flush_waits_for_writes_from_other_threads(database):
+    engine, _ = database
+
+    async def main():
+        writer = GroupCommitWriter(window_ms=20)
+        writer.start()
+        writer.add(AgentExecution, _execution("e1"), key="e1")
+        threads = [
+            threading.Thread(target=writer.add_threadsafe, args=(AgentExecutionStep, _step("e1", n)), kwargs={"key": "e1"})
+            for n in range(1, 6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        await writer.flush("e1")
+        rows = await _rows(engine, AgentExecutionStep)
+        await writer.close()
+        return rows
+
+    assert sorted(step.step_number for step in asyncio.run(main())) == [1, 2, 3, 4, 5]
+
+
+def test_bad_row_fails_only_its_own_write(database):
+    engine, _ = database
+
+    async def main():
+        writer = GroupCommitWriter(writers=1)
+        writer.start()
+        futures = [
+            writer.add(AgentExecution, _execution("e1", idempotency_key="k")),
+            writer.add(AgentExecution, _execution("e2", idempotency_key="k")),
+            writer.add(AgentExecution, _execution("e3")),
+        ]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        await writer.close()
+        return results, await _rows(engine, AgentExecution)
+
+    results, rows = asyncio.run(main())
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], IntegrityError)
+    assert sorted(row.id for row in rows) == ["e1", "e3"]
+
+
+def test_finished_writes_are_not_tracked_without_a_flush(database):
+    async def main():
+        writer = GroupCommitWriter()
+        writer.start()
+        await writer.add(AgentExecution, _execution("e1"), key="e1")
+        await asyncio.to_thread(
+            lambda: writer.add_threadsafe(AgentExecutionStep, _step("e1", 1), key="e1").result(5)
+        )
+        pending = dict(writer._pending)
+        await writer.close()
+        return pending
+
+    assert asyncio.run(main()) == {}
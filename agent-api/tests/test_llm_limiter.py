@@ -0,0 +1,128 @@
+import pytest
+
+import llm_limiter
+from llm_limiter import AdaptiveConcurrency, LLMLimiter, TokenBucket
+from mock_llm import MockProviderError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_limiter.time, "monotonic", clock)
+    return clock
+
+
+def test_throttling_halves_the_limit_once_per_round(clock):
+    concurrency = AdaptiveConcurrency(max_limit=16)
+    calls = [concurrency.acquire() for _ in range(4)]
+    clock.now += 1
+    # Every call of the round was throttled; only the first backs off
+    for started in calls:
+        concurrency.release(started, throttled=True)
+    assert concurrency.limit == 8
+    assert concurrency.in_flight == 0
+
+    clock.now += 1
+    concurrency.release(concurrency.acquire(), throttled=True)
+    assert concurrency.limit == 4
+
+
+def test_limit_stays_within_bounds(clock):
+    concurrency = AdaptiveConcurrency(max_limit=4, min_limit=2)
+    for _ in range(5):
+        clock.now += 1
+        concurrency.release(concurrency.acquire(), throttled=True)
+    assert concurrency.limit == 2
+    for _ in range(100):
+        concurrency.release(concurrency.acquire())
+    assert concurrency.limit == 4
+
+
+def test_successes_recover_about_one_slot_per_round(clock):
+    concurrency = AdaptiveConcurrency(max_limit=32)
+    concurrency.release(concurrency.acquire(), throttled=True)
+    assert concurrency.limit == 16
+    # A full round of successes at the current limit adds about one slot
+    for _ in range(16):
+        concurrency.release(concurrency.acquire())
+    assert 16.9 < concurrency.limit < 17.1
+
+
+def test_acquire_times_out_when_no_slot_frees(clock):
+    concurrency = AdaptiveConcurrency(max_limit=1)
+    concurrency.acquire()
+    with pytest.raises(TimeoutError):
+        concurrency.acquire(deadline=clock.now)
+
+
+def test_token_bucket_refills_over_time(clock):
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.reserve(60) == 0.0
+    # One token a second; ten tokens of debt wait ten seconds
+    assert bucket.reserve(10) == pytest.approx(10.0)
+    clock.now += 30
+    # 20 tokens back after paying off the debt
+    assert bucket.reserve(25) == pytest.approx(5.0)
+    clock.now += 300
+    # Refills up to one minute's allowance, not beyond
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+
+def test_token_bucket_adjusts_to_actual_usage(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.reserve(30)
+    bucket.adjust(-20)  # used 20 fewer than reserved
+    assert bucket.reserve(50) == 0.0
+
+
+def test_call_retries_throttled_calls_and_backs_off():
+    limiter = LLMLimiter("m", max_concurrency=8, retry_base=0.001, retry_max=0.001)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise MockProviderError("slow down", 429)
+        return "ok"
+
+    assert limiter.call(fn) == "ok"
+    assert len(attempts) == 3
+    stats = limiter.stats()
+    assert stats["retries"] == 2
+    assert stats["in_flight"] == 0
+    assert stats["concurrency_limit"] < 8
+
+
+def test_call_does_not_retry_client_errors():
+    limiter = LLMLimiter("m", retry_base=0.001)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        raise MockProviderError("bad request", 400)
+
+    with pytest.raises(MockProviderError):
+        limiter.call(fn)
+    assert len(attempts) == 1
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_call_releases_the_slot_on_base_exceptions():
+    limiter = LLMLimiter("m", max_concurrency=1)
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        limiter.call(interrupted)
+    assert limiter.stats()["in_flight"] == 0
+    assert limiter.call(lambda: "ok") == "ok"
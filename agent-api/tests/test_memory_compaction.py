@@ -0,0 +1,113 @@
+import litellm
+from smolagents import CodeAgent
+from smolagents.memory import ActionStep, ToolCall
+from smolagents.models import Model
+from smolagents.monitoring import AgentLogger, LogLevel, Timing
+from smolagents.utils import AgentExecutionError
+
+from memory_compaction import MemoryCompactor
+
+MODEL_ID = "mock/x"
+LONG = " ".join(f"line{i} of a long web page" for i in range(800))
+
+
+def tokens(text):
+    return len(litellm.encode(model=MODEL_ID, text=text))
+
+
+def code_step(number, observations=LONG, error=None, code="print(page)"):
+    return ActionStep(
+        step_number=number,
+        timing=Timing(start_time=0.0, end_time=1.0),
+        model_output=f"Thought: step {number}\n<code>\n{code}\n</code>",
+        code_action=code,
+        tool_calls=[ToolCall(name="python_interpreter", arguments=code, id=f"call_{number}")],
+        observations=observations,
+        error=error,
+    )
+
+
+def agent_with(*steps):
+    agent = CodeAgent(tools=[], model=Model(model_id=MODEL_ID))
+    agent.memory.steps.extend(steps)
+    return agent
+
+
+def texts(messages):
+    return [
+        "".join(part["text"] for part in m.content) if isinstance(m.content, list) else m.content
+        for m in messages
+    ]
+
+
+def test_truncate_fits_the_limit():
+    compactor = MemoryCompactor(MODEL_ID)
+    for limit in (50, 200, 1000):
+        cut, saved = compactor.truncate(LONG, limit)
+        assert tokens(cut) <= limit
+        assert saved == tokens(LONG) - tokens(cut)
+        assert cut.startswith("line0 of")
+        assert cut.rstrip().endswith("line799 of a long web page")
+        assert "tokens omitted" in cut
+
+
+def test_short_text_is_not_cut():
+    assert MemoryCompactor(MODEL_ID).truncate("short observation", 50) == ("short observation", 0)
+
+
+def test_old_steps_are_compacted_and_recent_steps_kept():
+    compactor = MemoryCompactor(MODEL_ID, keep_recent_steps=2, max_observation_tokens=100_000, old_observation_tokens=50)
+    agent = agent_with(code_step(1), code_step(2), code_step(3))
+    sent = "\n".join(texts(compactor.messages(agent)))
+
+    # Only the oldest step is cut, and only its tool call message is dropped
+    assert sent.count(LONG) == 2
+    assert sent.count("tokens omitted") == 1
+    assert "call_1" not in sent
+    assert "call_2" in sent and "call_3" in sent
+    assert compactor.saved_tokens > 0
+    # Memory, and so the stored trace, keeps everything
+    assert agent.memory.steps[0].observations == LONG
+    assert agent.memory.steps[0].tool_calls
+
+
+def test_old_steps_with_errors_keep_their_tool_calls():
+    compactor = MemoryCompactor(MODEL_ID, keep_recent_steps=1)
+    failed = code_step(1, error=AgentExecutionError("NameError: page", AgentLogger(LogLevel.OFF)))
+    sent = "\n".join(texts(compactor.messages(agent_with(failed, code_step(2)))))
+    assert "call_1" in sent
+
+
+def test_tool_calling_steps_keep_their_tool_calls():
+    compactor = MemoryCompactor(MODEL_ID, keep_recent_steps=1)
+    step = ActionStep(
+        step_number=1,
+        timing=Timing(start_time=0.0, end_time=1.0),
+        tool_calls=[ToolCall(name="web_search", arguments={"query": "x"}, id="call_1")],
+        observations="results",
+    )
+    sent = "\n".join(texts(compactor.messages(agent_with(step, code_step(2)))))
+    assert "call_1" in sent
+
+
+def test_saved_tokens_is_per_prompt():
+    compactor = MemoryCompactor(MODEL_ID, keep_recent_steps=1, old_observation_tokens=50)
+    agent = agent_with(code_step(1), code_step(2, observations="ok"))
+    compactor.messages(agent)
+    first = compactor.saved_tokens
+    compactor.messages(agent)
+    assert first > 0
+    assert compactor.saved_tokens == first
+
+
+def test_compaction_can_be_turned_off(monkeypatch):
+    agent = agent_with(code_step(1), code_step(2), code_step(3))
+    full = texts(agent.write_memory_to_messages())
+
+    monkeypatch.setenv("AGENT_MEMORY_COMPACTION", "false")
+    assert MemoryCompactor.from_env(MODEL_ID) is None
+
+    monkeypatch.setenv("AGENT_MEMORY_COMPACTION", "true")
+    compactor = MemoryCompactor.from_env(MODEL_ID)
+    compactor.attach(agent)
+    assert texts(agent.write_memory_to_messages()) != full
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+from smolagents.monitoring import TokenUsage
+
+from model_registry import resolve_model
+from model_router import ModelRouter
+from pooled_model import RoutedModel
+
+POLICY = {"tiers": {"default": ["mock/a", "mock/b"]}, "rules": []}
+
+
+class Message:
+    def __init__(self, content, input_tokens, output_tokens):
+        self.content = content
+        self.token_usage = TokenUsage(input_tokens=input_tokens, output_tokens=output_tokens)
+
+
+class FakeModel:
+    def __init__(self, model_id, answer, release=None):
+        self.model_id = model_id
+        self.answer = answer
+        self.release = release
+
+    def generate(self, *args, **kwargs):
+        if self.release is not None:
+            self.release.wait(5)
+        return self.answer
+
+
+def test_unrecognized_model_is_rejected():
+    with pytest.raises(ValueError, match="Unrecognized model"):
+        resolve_model("llama-3")
+
+
+def test_unrecognized_models_are_skipped():
+    router = ModelRouter(None, policy={"tiers": {"default": ["llama-3", "mock/a"]}, "rules": []})
+    route = router.route(None, "task", "tenant")
+    assert route.candidates == ["mock/a"]
+    assert route.skipped == [{"model": "llama-3", "reason": "Unrecognized model: llama-3"}]
+
+
+def test_degraded_models_stay_candidates_but_are_not_skipped():
+    router = ModelRouter(None, policy=POLICY, min_samples=2)
+    for _ in range(2):
+        router.observe("mock/a", 0.1, ok=False)
+    routing = router.route(None, "task", "tenant").to_dict()
+    assert routing["candidates"] == ["mock/b", "mock/a"]
+    assert routing["skipped"] == []
+    assert [d["model"] for d in routing["degraded"]] == ["mock/a"]
+
+
+def test_losing_hedged_call_records_its_tokens():
+    router = ModelRouter(None, policy=POLICY, hedge=True, hedge_after=0.05)
+    route = router.route(None, "task", "tenant")
+    release = threading.Event()
+    slow = FakeModel("mock/a", Message("slow", 100, 20), release)
+    fast = FakeModel("mock/b", Message("fast", 90, 10))
+    model = RoutedModel(router, route, [slow, fast])
+
+    assert model.generate([]).content == "fast"
+    assert route.hedge["winner"] == "mock/b"
+    assert route.to_dict()["hedge"]["loser"] == {"model": "mock/a", "running": True}
+
+    release.set()
+    model.settle()
+    assert route.to_dict()["hedge"]["loser"] == {"model": "mock/a", "input_tokens": 100, "output_tokens": 20}
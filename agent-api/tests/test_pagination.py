@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from database import Base
+from models import AgentExecution
+from pagination import decode_cursor, encode_cursor, next_page, page_query
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 10, 17, 12, 30, 45, 123456)
+    cursor = encode_cursor(created_at, "exec|with-separator")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, "exec|with-separator")
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64 !", "bm8tc2VwYXJhdG9y"])
+def test_malformed_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[AgentExecution.__table__])
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def _pages(session, limit):
+    cursor, pages = None, []
+    while True:
+        query = page_query(select(AgentExecution.id, AgentExecution.created_at), limit, cursor)
+        rows, cursor = next_page(session.execute(query).all(), limit)
+        pages.append([row.id for row in rows])
+        if cursor is None:
+            return pages
+
+
+def test_pages_are_stable_on_equal_created_at(session):
+    now = datetime(2026, 10, 17)
+    # Five rows share one timestamp, so only the id orders them
+    ids = [f"exec-{i:02d}" for i in range(12)]
+    for i, execution_id in enumerate(ids):
+        created_at = now if i < 5 else now - timedelta(seconds=i)
+        session.add(AgentExecution(id=execution_id, tenant_id="t", task="x", status="completed", created_at=created_at))
+    session.commit()
+
+    pages = _pages(session, limit=2)
+    seen = [execution_id for page in pages for execution_id in page]
+    assert seen == sorted(ids[:5], reverse=True) + ids[5:]
+    assert all(len(page) == 2 for page in pages)
+
+
+def test_last_page_has_no_cursor(session):
+    session.add(AgentExecution(id="only", tenant_id="t", task="x", status="completed", created_at=datetime(2026, 1, 1)))
+    session.commit()
+    assert _pages(session, limit=5) == [["only"]]
@@ -0,0 +1,97 @@
+import pytest
+from smolagents.memory import ActionStep
+from smolagents.models import ChatMessage
+from smolagents.monitoring import Timing, TokenUsage
+
+from mock_llm import MockCompletionClient, MockProviderError, cache_prefix, completion_response
+from model_registry import ModelRegistry
+from pooled_model import mark_cache_prefix
+from step_events import step_record
+
+SYSTEM = "You are a helpful agent. " * 40
+
+
+def conversation(task="What is 2 + 2?"):
+    return [
+        {"role": "system", "content": SYSTEM},
+        {"role": "user", "content": [{"type": "text", "text": task}]},
+    ]
+
+
+def text(value, **marker):
+    return {"type": "text", "text": value, **marker}
+
+
+def test_marked_messages_pass_the_mock_shape_check():
+    messages = conversation()
+    marked = mark_cache_prefix(messages)
+    assert marked[0]["content"] == [text(SYSTEM, cache_control={"type": "ephemeral"})]
+    # The conversation after the system prompt changes every step
+    assert "cache_control" not in str(marked[1])
+    # The agent's own messages are left as they were
+    assert messages[0]["content"] == SYSTEM
+    assert cache_prefix(marked) == marked[:1]
+
+
+def test_repeated_prefix_is_read_from_the_cache():
+    model = ModelRegistry().get("mock/prompt-cache")
+    messages = [ChatMessage.from_dict(m) for m in conversation()]
+
+    first = model.generate(messages).raw.usage
+    second = model.generate(messages).raw.usage
+    assert first.cache_creation_input_tokens > 0
+    assert first.cache_read_input_tokens == 0
+    assert second.cache_read_input_tokens == first.cache_creation_input_tokens
+    assert second.cache_creation_input_tokens == 0
+
+
+@pytest.mark.parametrize("block", [
+    text("x", cache_control={"type": "persistent"}),
+    {"type": "image", "source": {}, "cache_control": {"type": "ephemeral"}},
+])
+def test_malformed_marker_is_rejected(block):
+    messages = [{"role": "user", "content": [block]}]
+    with pytest.raises(MockProviderError) as raised:
+        MockCompletionClient().completion("mock/x", messages)
+    assert raised.value.status_code == 400
+
+
+def test_marker_on_a_message_is_rejected():
+    messages = [{"role": "user", "content": "x", "cache_control": {"type": "ephemeral"}}]
+    with pytest.raises(MockProviderError) as raised:
+        MockCompletionClient().completion("mock/x", messages)
+    assert raised.value.status_code == 400
+
+
+def test_more_than_four_breakpoints_are_rejected():
+    marked = [text(str(i), cache_control={"type": "ephemeral"}) for i in range(5)]
+    with pytest.raises(MockProviderError) as raised:
+        MockCompletionClient().completion("mock/x", [{"role": "user", "content": marked}])
+    assert raised.value.status_code == 400
+
+    MockCompletionClient().completion("mock/x", [{"role": "user", "content": marked[:4]}])
+
+
+def test_step_record_splits_cached_input_tokens():
+    raw = completion_response("mock/x", "done", 300, 20, cache_read_tokens=250)
+    step = ActionStep(
+        step_number=1,
+        timing=Timing(start_time=0.0, end_time=1.0),
+        model_output_message=ChatMessage(role="assistant", content="done", raw=raw),
+        token_usage=TokenUsage(input_tokens=300, output_tokens=20),
+    )
+    record = step_record(step)
+    assert record["cached_input_tokens"] == 250
+    assert record["cache_creation_input_tokens"] == 0
+    assert record["uncached_input_tokens"] == 50
+
+
+def test_step_record_without_cache_usage():
+    step = ActionStep(
+        step_number=1,
+        timing=Timing(start_time=0.0, end_time=1.0),
+        token_usage=TokenUsage(input_tokens=300, output_tokens=20),
+    )
+    record = step_record(step)
+    assert record["cached_input_tokens"] is None
+    assert record["uncached_input_tokens"] is None
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from search_cache import SearchResultCache, normalize_query
+
+
+def test_normalize_query_folds_case_and_whitespace():
+    assert normalize_query("  Python   ASYNC\tio ") == "python async io"
+
+
+def test_hit_within_ttl_and_reload_after():
+    cache = SearchResultCache(ttl_seconds=0.05)
+    calls = []
+
+    def load(query):
+        calls.append(query)
+        return f"result {len(calls)}"
+
+    assert cache.get("Query", load) == "result 1"
+    assert cache.get("query ", load) == "result 1"
+    time.sleep(0.06)
+    assert cache.get("query", load) == "result 2"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_failures_are_not_cached():
+    cache = SearchResultCache()
+
+    def fail(query):
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        cache.get("q", fail)
+    assert cache.get("q", lambda q: "ok") == "ok"
+    assert cache.stats()["errors"] == 1
+
+
+def test_concurrent_identical_queries_share_one_load():
+    cache = SearchResultCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def load(query):
+        calls.append(query)
+        started.set()
+        release.wait(5)
+        return "shared"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get("q", load)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(cache.get("Q", load))) for _ in range(5)]
+    for thread in followers:
+        thread.start()
+    while cache.stats()["coalesced"] < 5:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert results == ["shared"] * 6
+    assert len(calls) == 1
+    assert cache.stats()["inflight"] == 0
+
+
+def test_leader_error_reaches_followers():
+    cache = SearchResultCache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def load(query):
+        started.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    errors = []
+
+    def search():
+        try:
+            cache.get("q", load)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=search)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=search)
+    follower.start()
+    while cache.stats()["coalesced"] < 1:
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert errors == ["boom", "boom"]
+
+
+def test_follower_searches_itself_when_leader_hangs():
+    cache = SearchResultCache(coalesce_timeout=0.05)
+    started = threading.Event()
+    release = threading.Event()
+
+    def hung(query):
+        started.set()
+        release.wait(5)
+        return "late"
+
+    leader = threading.Thread(target=lambda: cache.get("q", hung))
+    leader.start()
+    started.wait(5)
+    try:
+        assert cache.get("q", lambda q: "fresh") == "fresh"
+        assert cache.stats()["coalesce_timeouts"] == 1
+    finally:
+        release.set()
+        leader.join(5)
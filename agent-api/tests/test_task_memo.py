@@ -0,0 +1,16 @@
+from task_memo import request_hash
+
+
+def test_tool_order_does_not_matter():
+    assert request_hash("t", "task", ["a", "b"], "m", 10) == request_hash("t", "task", ["b", "a", "a"], "m", 10)
+    assert request_hash("t", "task", None, "m", 10) != request_hash("t", "task", [], "m", 10)
+
+
+def test_budgets_are_part_of_the_hash(monkeypatch):
+    monkeypatch.setenv("MAX_EXECUTION_TIME", "300")
+    monkeypatch.setenv("MAX_EXECUTION_TOKENS", "0")
+    base = request_hash("t", "task", None, "m", 10)
+    assert request_hash("t", "task", None, "m", 10, max_execution_time=30) != base
+    assert request_hash("t", "task", None, "m", 10, max_tokens=1000) != base
+    # Budgets above the configured limits are capped, so they run the same
+    assert request_hash("t", "task", None, "m", 10, max_execution_time=900) == base
@@ -0,0 +1,104 @@
+import contextvars
+import threading
+import time
+
+import pytest
+from smolagents import Tool
+from smolagents.memory import ActionStep
+from smolagents.models import ChatMessage, ChatMessageToolCall, ChatMessageToolCallFunction, Model
+from smolagents.monitoring import Timing
+
+from tool_calling import ParallelToolCallingAgent
+from tool_registry import ToolRegistry, ToolSpec
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+class RecordingTool(Tool):
+    inputs = {"value": {"type": "string", "description": "Echoed back"}}
+    output_type = "string"
+
+    def __init__(self, name, delay, calls):
+        self.name = name
+        self.description = f"Echoes its value after {delay}s"
+        self.delay = delay
+        self.calls = calls
+        super().__init__()
+
+    def forward(self, value):
+        started = time.monotonic()
+        time.sleep(self.delay)
+        self.calls[self.name] = (started, time.monotonic(), request_id.get())
+        return f"{self.name}:{value}"
+
+
+def tool_call(call_id, name, value):
+    return ChatMessageToolCall(
+        id=call_id, type="function", function=ChatMessageToolCallFunction(name=name, arguments={"value": value})
+    )
+
+
+def test_parallel_tool_calls_keep_request_order_and_context():
+    calls = {}
+    tools = [RecordingTool("slow", 0.3, calls), RecordingTool("fast", 0.0, calls)]
+    agent = ParallelToolCallingAgent(tools=tools, model=Model(model_id="mock/x"), max_tool_threads=4)
+    # Ids that sort opposite to request order, with the slow call first
+    message = ChatMessage(
+        role="assistant", content=None, tool_calls=[tool_call("zb", "slow", "a"), tool_call("za", "fast", "b")]
+    )
+    step = ActionStep(step_number=1, timing=Timing(start_time=time.time()))
+
+    token = request_id.set("req-1")
+    try:
+        list(agent.process_tool_calls(message, step))
+    finally:
+        request_id.reset(token)
+
+    assert [call.id for call in step.tool_calls] == ["zb", "za"]
+    assert step.observations == "slow:a\nfast:b"
+    slow_started, slow_finished, slow_context = calls["slow"]
+    fast_started, fast_finished, fast_context = calls["fast"]
+    # The fast call ran while the slow one was still going
+    assert fast_started < slow_finished
+    assert slow_context == fast_context == "req-1"
+
+
+class Echo:
+    def forward(self, value, release=None):
+        if release is not None:
+            release.wait(5)
+        return value
+
+
+def registry_tool(**limits):
+    registry = ToolRegistry()
+    registry.register(ToolSpec("echo", Echo, **limits))
+    return registry.get_tools(["echo"], tenant_id="t1")[0]
+
+
+def test_tool_timeout():
+    tool = registry_tool(timeout=0.1)
+    assert tool.forward("x") == "x"
+    release = threading.Event()
+    with pytest.raises(TimeoutError, match="did not finish within"):
+        tool.forward("x", release)
+    release.set()
+
+
+def test_tool_concurrency_limit_holds_the_slot_until_the_call_returns():
+    tool = registry_tool(max_concurrency=1, timeout=0.1)
+    release = threading.Event()
+    with pytest.raises(TimeoutError, match="did not finish"):
+        tool.forward("x", release)
+    # The timed-out call is still running and keeps the only slot
+    with pytest.raises(TimeoutError, match="busy"):
+        tool.forward("y")
+
+    release.set()
+    deadline = time.monotonic() + 2
+    while True:
+        try:
+            assert tool.forward("z") == "z"
+            break
+        except TimeoutError:
+            assert time.monotonic() < deadline
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import worker
+from database import Base
+from job_queue import InMemoryJobQueue
+from models import AgentExecution
+from worker import JobWorker
+from worker_pool import PoolSaturatedError
+
+JOB = {"execution_id": "e1", "tenant_id": "t", "task": "task"}
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A fresh SQLite database holding one queued execution"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'worker.db'}")
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def create():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with sessions() as session:
+            session.add(AgentExecution(
+                id="e1", tenant_id="t", task="task", status="queued", created_at=datetime(2026, 10, 17)
+            ))
+            await session.commit()
+
+    asyncio.run(create())
+    monkeypatch.setattr(worker, "AsyncSessionLocal", sessions)
+    yield engine
+    asyncio.run(engine.dispose())
+
+
+async def _execution(engine):
+    async with engine.connect() as connection:
+        return (await connection.execute(select(AgentExecution))).one()
+
+
+class RecordingQueue(InMemoryJobQueue):
+    def __init__(self):
+        super().__init__()
+        self.acked = []
+
+    async def ack(self, job):
+        self.acked.append(job["execution_id"])
+
+
+class SaturatedExecutor:
+    """Stands in for AgentExecutor when the shared pool is full"""
+
+    def __init__(self, **kwargs):
+        pass
+
+    async def execute(self, **kwargs):
+        raise PoolSaturatedError("Agent worker pool is saturated", status_code=503, retry_after=0)
+
+
+def _worker(queue):
+    pool = SimpleNamespace(max_workers=1)
+    return JobWorker(queue, pool, models=None, traces=SimpleNamespace())
+
+
+def test_saturated_pool_requeues_the_job(database, monkeypatch):
+    monkeypatch.setattr(worker, "AgentExecutor", SaturatedExecutor)
+    queue = RecordingQueue()
+
+    async def main():
+        await _worker(queue)._run_traced_job({**JOB, "_receipt": "raw"})
+        return await queue.dequeue(timeout=0.1)
+
+    requeued = asyncio.run(main())
+    assert requeued["execution_id"] == "e1"
+    assert "_receipt" not in requeued
+    assert queue.acked == ["e1"]
+    row = asyncio.run(_execution(database))
+    assert row.status == "queued"
+    assert row.started_at is None
+    assert row.error is None
+
+
+def test_failed_claim_is_logged_and_left_unacknowledged(database, monkeypatch, caplog):
+    async def unavailable(*args, **kwargs):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(worker, "update_execution", unavailable)
+    queue = RecordingQueue()
+    with caplog.at_level(logging.ERROR, logger="worker"):
+        asyncio.run(_worker(queue)._run_traced_job(JOB))
+    assert "Failed to claim execution e1" in caplog.text
+    assert queue.acked == []
+    assert asyncio.run(_execution(database)).status == "queued"
@@ -0,0 +1,59 @@
+"""
+Parallel Tool-Calling Agent
+
+A smolagents ToolCallingAgent for models that request several tool calls in
+one step. smolagents already runs those calls on a thread pool
+(AGENT_MAX_TOOL_THREADS wide); this subclass fixes the two things the
+service depends on:
+
+- Calls run in a copy of the agent thread's context, so execution budgets,
+  cancellation and tool spans reach the pool threads.
+- The step's tool calls and observations are stored in the order the model
+  requested them, rather than sorted by call id, so the next prompt and the
+  stored trace read the same as if the calls had run one after another.
+
+Per-tool concurrency limits and timeouts are applied by the tool registry.
+"""
+
+from typing import Any, Dict, Generator
+import contextvars
+import logging
+
+from smolagents import ActionStep, ToolCallingAgent
+from smolagents.models import ChatMessage
+from smolagents.agents import ToolOutput
+
+logger = logging.getLogger(__name__)
+
+
+class ParallelToolCallingAgent(ToolCallingAgent):
+    """ToolCallingAgent that keeps context and call order across parallel tool calls"""
+
+    _tool_context: contextvars.Context
+
+    def process_tool_calls(
+        self, chat_message: ChatMessage, memory_step: ActionStep
+    ) -> Generator[Any, None, None]:
+        self._tool_context = contextvars.copy_context()
+        previous = memory_step.observations
+        outputs: Dict[str, ToolOutput] = {}
+        for event in super().process_tool_calls(chat_message, memory_step):
+            if isinstance(event, ToolOutput):
+                outputs[event.id] = event
+            yield event
+
+        # Results arrive in completion order and smolagents merges them by
+        # id; put both back in request order
+        order = [call.id for call in chat_message.tool_calls or []]
+        calls = {call.id: call for call in memory_step.tool_calls or []}
+        memory_step.tool_calls = [calls[i] for i in order if i in calls] or memory_step.tool_calls
+        observations = [outputs[i].observation for i in order if i in outputs]
+        if observations:
+            memory_step.observations = "\n".join(([previous] if previous else []) + observations)
+
+    def execute_tool_call(self, tool_name: str, arguments: Any) -> Any:
+        # Each call gets its own copy, so concurrent calls cannot see each other's changes
+        context = getattr(self, "_tool_context", None)
+        if context is None:
+            return super().execute_tool_call(tool_name, arguments)
+        return context.copy().run(super().execute_tool_call, tool_name, arguments)
@@ -0,0 +1,286 @@
+"""
+Agent Tool Registry
+
+Single place where agent tools are declared. Each tool is registered with a
+factory and declares its construction cost, whether one instance can be
+shared between concurrent executions, and whether it is tenant-scoped.
+
+- Shared (thread-safe, not tenant-scoped) tools are built once per process:
+  cheap ones at warm-up, expensive ones the first time a task asks for them.
+- Tenant-scoped and non-thread-safe tools get a fresh instance per execution.
+
+Tools may also declare how many of their calls can run at once in the
+process and how long one call may take (TOOL_TIMEOUT_SECONDS by default),
+so parallel tool calls cannot flood a slow backend or hang a step.
+
+New tools register with the `register_tool` decorator, either in this module
+or in a plugin module listed in AGENT_TOOL_PLUGINS.
+"""
+
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+import contextvars
+import functools
+import importlib
+import logging
+import os
+import threading
+import time
+
+from recording import recorder
+from tracing import instrument_tool
+
+logger = logging.getLogger(__name__)
+
+CHEAP = "cheap"
+EXPENSIVE = "expensive"
+
+
+class ToolSpec:
+    """Declaration of a tool and how its instances are managed"""
+
+    __slots__ = ("name", "factory", "cost", "thread_safe", "tenant_scoped", "default", "max_concurrency", "timeout")
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[..., Any],
+        cost: str = CHEAP,
+        thread_safe: bool = True,
+        tenant_scoped: bool = False,
+        default: bool = True,
+        max_concurrency: int = 0,
+        timeout: Optional[float] = None,
+    ):
+        """
+        Args:
+            name: Tool name used in execution requests
+            factory: Builds the tool; receives `tenant_id` if tenant-scoped
+            cost: CHEAP tools are pre-built at warm-up, EXPENSIVE ones on first use
+            thread_safe: Whether one instance may serve concurrent executions
+            tenant_scoped: Whether the tool carries per-tenant state
+            default: Whether the tool is enabled when a request names no tools
+            max_concurrency: Calls of this tool running at once in the process (0 = unlimited)
+            timeout: Seconds a call may take before it fails (default: TOOL_TIMEOUT_SECONDS)
+        """
+        if cost not in (CHEAP, EXPENSIVE):
+            raise ValueError(f"Unknown tool cost: {cost}")
+        self.name = name
+        self.factory = factory
+        self.cost = cost
+        self.thread_safe = thread_safe
+        self.tenant_scoped = tenant_scoped
+        self.default = default
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout if timeout is not None else float(os.getenv("TOOL_TIMEOUT_SECONDS", "0")) or None
+
+    @property
+    def shared(self) -> bool:
+        return self.thread_safe and not self.tenant_scoped
+
+
+class ToolRegistry:
+    """Registry of tool specs with lazily built, process-wide shared instances"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._specs: Dict[str, ToolSpec] = {}
+        self._instances: Dict[str, Any] = {}
+        self._build_seconds: Dict[str, float] = {}
+        self._builds: Dict[str, int] = {}
+        # Shared by every instance of a tool, so limits hold across executions
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+
+    def register(self, spec: ToolSpec):
+        with self._lock:
+            if spec.name in self._specs:
+                logger.warning(f"Replacing registered tool: {spec.name}")
+                self._instances.pop(spec.name, None)
+            self._specs[spec.name] = spec
+            if spec.max_concurrency:
+                self._slots[spec.name] = threading.BoundedSemaphore(spec.max_concurrency)
+            else:
+                self._slots.pop(spec.name, None)
+
+    def names(self) -> List[str]:
+        return list(self._specs)
+
+    def get_tools(self, tool_names: Optional[List[str]], tenant_id: str) -> List[Any]:
+        """
+        Get tool instances for an execution
+
+        None selects the default tools; an empty list selects no tools.
+        Unknown names are logged and skipped. Tools come back sorted by
+        name, so the system prompt listing them is byte-identical for the
+        same tool set and provider prompt caches hit across runs.
+        """
+        if tool_names is None:
+            tool_names = [name for name, spec in self._specs.items() if spec.default]
+
+        tools = []
+        for name in sorted(set(tool_names)):
+            spec = self._specs.get(name)
+            if spec is None:
+                logger.warning(f"Unknown tool: {name}")
+                continue
+            tools.append(self._instance(spec, tenant_id))
+        return tools
+
+    def _instance(self, spec: ToolSpec, tenant_id: str) -> Any:
+        if not spec.shared:
+            return self._build(spec, tenant_id)
+
+        tool = self._instances.get(spec.name)
+        if tool is None:
+            with self._lock:
+                tool = self._instances.get(spec.name)
+                if tool is None:
+                    tool = self._instances[spec.name] = self._build(spec, tenant_id)
+        return tool
+
+    def _build(self, spec: ToolSpec, tenant_id: str) -> Any:
+        start = time.perf_counter()
+        tool = spec.factory(tenant_id) if spec.tenant_scoped else spec.factory()
+        # Spans and budget checks wrap the limits and the recording, so waits
+        # for a slot and replayed calls are measured too
+        tool.forward = instrument_tool(
+            spec.name, self._limited(spec, recorder.wrap_tool(spec.name, tool.forward))
+        )
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._build_seconds[spec.name] = self._build_seconds.get(spec.name, 0.0) + elapsed
+            self._builds[spec.name] = self._builds.get(spec.name, 0) + 1
+        if spec.shared:
+            logger.info(f"Built shared tool {spec.name} in {elapsed * 1000:.0f}ms")
+        return tool
+
+    def _limited(self, spec: ToolSpec, forward: Callable[..., Any]) -> Callable[..., Any]:
+        """Apply the tool's concurrency limit and timeout to its forward()"""
+        slots = self._slots.get(spec.name)
+        timeout = spec.timeout
+        if slots is None and not timeout:
+            return forward
+
+        @functools.wraps(forward)
+        def wrapper(*args, **kwargs):
+            if slots is not None and not slots.acquire(timeout=timeout):
+                raise TimeoutError(
+                    f"Tool {spec.name} is busy: {spec.max_concurrency} calls already running"
+                )
+            release = slots.release if slots is not None else (lambda: None)
+            if not timeout:
+                try:
+                    return forward(*args, **kwargs)
+                finally:
+                    release()
+
+            # The call keeps its slot until it really returns, even after timing out
+            result: Future = Future()
+            context = contextvars.copy_context()
+
+            def call():
+                try:
+                    result.set_result(context.run(forward, *args, **kwargs))
+                except BaseException as e:
+                    result.set_exception(e)
+                finally:
+                    release()
+
+            threading.Thread(target=call, name=f"tool-{spec.name}", daemon=True).start()
+            try:
+                return result.result(timeout=timeout)
+            except FuturesTimeoutError:
+                raise TimeoutError(f"Tool {spec.name} did not finish within {timeout:g}s")
+
+        return wrapper
+
+    def warm_up(self):
+        """Pre-build the cheap shared tools"""
+        for spec in list(self._specs.values()):
+            if spec.shared and spec.cost == CHEAP:
+                try:
+                    self._instance(spec, tenant_id="")
+                except Exception as e:
+                    logger.warning(f"Failed to pre-build tool {spec.name}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        tools = []
+        for spec in list(self._specs.values()):
+            entry = {
+                "name": spec.name,
+                "cost": spec.cost,
+                "thread_safe": spec.thread_safe,
+                "tenant_scoped": spec.tenant_scoped,
+                "default": spec.default,
+                "shared": spec.shared,
+                "max_concurrency": spec.max_concurrency,
+                "timeout_seconds": spec.timeout,
+                "built": spec.name in self._instances,
+                "builds": self._builds.get(spec.name, 0),
+                "build_seconds": round(self._build_seconds.get(spec.name, 0.0), 4),
+            }
+            # Shared tools with internal caches report their own stats
+            instance = self._instances.get(spec.name)
+            if instance is not None and hasattr(instance, "stats"):
+                entry["stats"] = instance.stats()
+            tools.append(entry)
+        return {"tools": tools}
+
+
+# Process-wide registry used by AgentExecutor
+tool_registry = ToolRegistry()
+
+
+def register_tool(
+    name: str,
+    cost: str = CHEAP,
+    thread_safe: bool = True,
+    tenant_scoped: bool = False,
+    default: bool = True,
+    max_concurrency: int = 0,
+    timeout: Optional[float] = None,
+) -> Callable:
+    """Decorator registering a tool factory with the process-wide registry"""
+
+    def decorator(factory: Callable[..., Any]) -> Callable[..., Any]:
+        tool_registry.register(
+            ToolSpec(name, factory, cost, thread_safe, tenant_scoped, default, max_concurrency, timeout)
+        )
+        return factory
+
+    return decorator
+
+
+def load_plugins():
+    """Import the tool plugin modules listed in AGENT_TOOL_PLUGINS (comma-separated)"""
+    for module_name in filter(None, (m.strip() for m in os.getenv("AGENT_TOOL_PLUGINS", "").split(","))):
+        try:
+            importlib.import_module(module_name)
+            logger.info(f"Loaded tool plugin: {module_name}")
+        except Exception as e:
+            logger.error(f"Failed to load tool plugin {module_name}: {e}", exc_info=True)
+
+
+# Built-in tools (agents get tools sorted by name, so prompts stay cache-stable)
+
+@register_tool("tenant_info", tenant_scoped=True)
+def _tenant_info_tool(tenant_id: str):
+    from tenant_tool import TenantInfoTool
+
+    return TenantInfoTool(tenant_id=tenant_id)
+
+
+@register_tool("web_search", cost=EXPENSIVE, max_concurrency=4, timeout=30)
+def _web_search_tool():
+    # Builds a DDGS client; its rate limit and result cache are shared by every execution
+    from search_cache import CachedSearchTool
+
+    return CachedSearchTool.from_env()
+
+
+@register_tool("visit_webpage", max_concurrency=8, timeout=30)
+def _visit_webpage_tool():
+    from webpage_cache import CachedVisitWebpageTool, WebpageCache
+
+    return CachedVisitWebpageTool(cache=WebpageCache.from_env())
@@ -0,0 +1,122 @@
+"""
+Execution Trace Store
+
+Agent steps are stored one row per step in `agent_execution_steps`,
+compressed, and written behind as each step finishes (batched with other
+writes by the group-commit writer), so the main `agent_executions` row
+stays narrow and status polls never read traces.
+
+Compression uses zstd when the `zstandard` package is installed and falls
+back to zlib otherwise; the codec is stored per row so both can be read.
+"""
+
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import zlib
+
+from sqlalchemy import select
+
+from group_commit import GroupCommitWriter
+from models import AgentExecutionStep
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+def compress_step(step: Dict[str, Any]) -> tuple:
+    """Serialize and compress a step record, returning (payload, encoding)"""
+    raw = json.dumps(step, default=str, separators=(",", ":")).encode()
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(raw), "zstd"
+    return zlib.compress(raw, 6), "zlib"
+
+
+def decompress_step(payload: bytes, encoding: str) -> Dict[str, Any]:
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed steps")
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    elif encoding == "zlib":
+        raw = zlib.decompress(payload)
+    else:
+        raw = payload
+    return json.loads(raw)
+
+
+class TraceStore:
+    """
+    Write-behind writer and range reader for execution steps
+
+    `record` may be called from agent worker threads; the step is compressed
+    there and its insert queued on the group-commit writer, which batches it
+    with other executions' writes. Call `flush` before marking an execution
+    finished so readers never see a final status with missing steps.
+    """
+
+    def __init__(self, writer: Optional[GroupCommitWriter] = None):
+        self.writer = writer or GroupCommitWriter.from_env()
+        self.writer.start()
+
+    def record(self, execution_id: str, tenant_id: str, step: Dict[str, Any]):
+        payload, encoding = compress_step(step)
+        future = self.writer.add_threadsafe(
+            AgentExecutionStep,
+            {
+                "execution_id": execution_id,
+                "tenant_id": tenant_id,
+                "step_number": step.get("step") or 0,
+                "payload": payload,
+                "encoding": encoding,
+                "created_at": datetime.utcnow(),
+            },
+            key=execution_id,
+        )
+        future.add_done_callback(lambda f: self._log_failure(f, execution_id, step.get("step")))
+
+    @staticmethod
+    def _log_failure(future: Future, execution_id: str, step_number: Optional[int]):
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Failed to store step {step_number} of {execution_id}: {error}")
+
+    async def flush(self, execution_id: str):
+        """Wait until every write of an execution (its record and steps) is stored"""
+        await self.writer.flush(execution_id)
+
+
+async def load_steps(
+    db,
+    tenant_id: str,
+    execution_ids: List[str],
+    steps_from: int = 0,
+    limit: Optional[int] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Load stored steps for one or more executions, in step order
+
+    Only steps with `step >= steps_from` are returned; `limit` caps the number
+    of steps per query (use it with a single execution).
+    """
+    query = (
+        select(AgentExecutionStep.execution_id, AgentExecutionStep.payload, AgentExecutionStep.encoding)
+        .where(
+            AgentExecutionStep.tenant_id == tenant_id,
+            AgentExecutionStep.execution_id.in_(execution_ids),
+            AgentExecutionStep.step_number >= steps_from
+        )
+        .order_by(AgentExecutionStep.execution_id, AgentExecutionStep.step_number)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+
+    steps: Dict[str, List[Dict[str, Any]]] = {execution_id: [] for execution_id in execution_ids}
+    for row in (await db.execute(query)).all():
+        steps[row.execution_id].append(decompress_step(row.payload, row.encoding))
+    return steps
@@ -0,0 +1,274 @@
+"""
+Execution Tracing
+
+OpenTelemetry spans for agent executions. Each execution is one trace whose
+trace id is the execution's UUID, with a root `agent.execution` span and
+children for DB writes, the agent run, every agent step, LLM call and tool
+call.
+
+Exporters are chosen with TRACE_EXPORTER:
+- "file": one JSON-lines file per trace in TRACE_DIR, readable through
+  `/api/v1/agent/execution/{id}/trace`
+- "otlp": OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (e.g. Langfuse, Jaeger)
+- "none" (default): spans are not recorded
+Several exporters can be combined, e.g. "file,otlp".
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from opentelemetry import context as otel_context
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.id_generator import RandomIdGenerator
+from opentelemetry.trace import Status, StatusCode
+
+from execution_control import current_budget
+from metrics import DB_WRITE_SECONDS, TOOL_CALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("agent-platform")
+
+# Trace id for the next root span, so a trace can be found from its execution id
+_next_trace_id: ContextVar[Optional[int]] = ContextVar("next_trace_id", default=None)
+_file_exporter: Optional["FileSpanExporter"] = None
+
+
+class ExecutionIdGenerator(RandomIdGenerator):
+    """Uses the execution UUID as trace id for execution root spans"""
+
+    def generate_trace_id(self) -> int:
+        trace_id = _next_trace_id.get()
+        return trace_id if trace_id is not None else super().generate_trace_id()
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends finished spans as JSON lines to one file per trace"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, trace_id: int) -> str:
+        return os.path.join(self.directory, f"{trace_id:032x}.jsonl")
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        by_trace: Dict[int, List[str]] = {}
+        for span in spans:
+            by_trace.setdefault(span.context.trace_id, []).append(json.dumps(span_record(span), default=str))
+        try:
+            with self._lock:
+                for trace_id, lines in by_trace.items():
+                    with open(self.path(trace_id), "a") as f:
+                        f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to write trace spans: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def read(self, trace_id: int) -> Optional[List[Dict[str, Any]]]:
+        try:
+            with open(self.path(trace_id)) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return None
+
+    def shutdown(self):
+        pass
+
+
+def span_record(span: ReadableSpan) -> Dict[str, Any]:
+    return {
+        "name": span.name,
+        "trace_id": f"{span.context.trace_id:032x}",
+        "span_id": f"{span.context.span_id:016x}",
+        "parent_span_id": f"{span.parent.span_id:016x}" if span.parent else None,
+        "start_time": span.start_time / 1e9,
+        "end_time": span.end_time / 1e9 if span.end_time else None,
+        "duration": (span.end_time - span.start_time) / 1e9 if span.end_time else None,
+        "status": span.status.status_code.name,
+        "attributes": dict(span.attributes or {}),
+        "events": [{"name": e.name, "timestamp": e.timestamp / 1e9, "attributes": dict(e.attributes or {})} for e in span.events],
+    }
+
+
+def setup_tracing():
+    """Install the tracer provider and exporters configured in TRACE_EXPORTER"""
+    global _file_exporter
+
+    exporters = [e.strip().lower() for e in os.getenv("TRACE_EXPORTER", "none").split(",") if e.strip()]
+    exporters = [e for e in exporters if e != "none"]
+    if not exporters:
+        return
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "agent-platform")}),
+        id_generator=ExecutionIdGenerator(),
+    )
+    for name in exporters:
+        if name == "file":
+            _file_exporter = FileSpanExporter(os.getenv("TRACE_DIR", "/tmp/agent-traces"))
+            provider.add_span_processor(BatchSpanProcessor(_file_exporter, schedule_delay_millis=500))
+        elif name == "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        else:
+            logger.warning(f"Unknown trace exporter: {name}")
+    trace.set_tracer_provider(provider)
+    logger.info(f"Tracing enabled ({', '.join(exporters)})")
+
+
+def shutdown_tracing():
+    provider = trace.get_tracer_provider()
+    if isinstance(provider, TracerProvider):
+        provider.shutdown()
+
+
+def read_trace(execution_id: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Spans recorded for an execution, ordered by start time
+
+    Returns None when the file exporter is off or the trace is not found.
+    """
+    if _file_exporter is None:
+        return None
+    trace.get_tracer_provider().force_flush(timeout_millis=2000)
+    spans = _file_exporter.read(uuid.UUID(execution_id).int)
+    return sorted(spans, key=lambda s: s["start_time"]) if spans is not None else None
+
+
+@contextmanager
+def execution_span(execution_id: str, tenant_id: str, **attributes) -> Iterator[trace.Span]:
+    """Root span of an execution; its trace id is the execution UUID"""
+    token = _next_trace_id.set(uuid.UUID(execution_id).int)
+    try:
+        # A fresh context keeps the execution from nesting under request spans
+        root = tracer.start_span(
+            "agent.execution",
+            context=otel_context.Context(),
+            attributes={"execution.id": execution_id, "tenant.id": tenant_id, **_clean(attributes)},
+        )
+    finally:
+        _next_trace_id.reset(token)
+    with trace.use_span(root, end_on_exit=True, record_exception=True, set_status_on_exception=True):
+        yield root
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[trace.Span]:
+    with tracer.start_as_current_span(name, attributes=_clean(attributes)) as current:
+        yield current
+
+
+@contextmanager
+def db_write(operation: str) -> Iterator[None]:
+    """Trace and time an execution record write"""
+    with span(f"db.{operation}", **{"db.operation": operation}):
+        with DB_WRITE_SECONDS.labels(operation).time():
+            yield
+
+
+def record_failure(error: BaseException):
+    """Mark the current span failed for an error that is handled, not raised"""
+    current = trace.get_current_span()
+    current.record_exception(error)
+    current.set_status(Status(StatusCode.ERROR, str(error)[:500]))
+
+
+def instrument_tool(name: str, forward: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a tool's forward() with a span, call-time histogram and budget check"""
+
+    @functools.wraps(forward)
+    def wrapper(*args, **kwargs):
+        budget = current_budget.get()
+        if budget:
+            budget.check()
+        start = time.perf_counter()
+        with span("tool.call", **{"tool.name": name}):
+            try:
+                return forward(*args, **kwargs)
+            finally:
+                TOOL_CALL_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+class StepSpans:
+    """
+    Groups the spans of one agent run into per-step spans
+
+    smolagents has no step-start hook, so a step span opens lazily at the
+    first LLM call of a step and closes in the step callback. Spans inside a
+    step (LLM and tool calls) become its children.
+    """
+
+    def __init__(self):
+        self._span: Optional[trace.Span] = None
+        self._token = None
+
+    def ensure_open(self):
+        if self._span is None:
+            self._span = tracer.start_span("agent.step")
+            self._token = otel_context.attach(trace.set_span_in_context(self._span))
+
+    def close(self, record: Dict[str, Any]):
+        self.ensure_open()
+        self._span.set_attributes(_clean({
+            "step.number": record.get("step"),
+            "step.tool_calls": len(record.get("tool_calls") or []),
+            "step.is_final_answer": record.get("is_final_answer"),
+            "llm.input_tokens": record.get("input_tokens"),
+            "llm.output_tokens": record.get("output_tokens"),
+            "llm.cached_input_tokens": record.get("cached_input_tokens"),
+        }))
+        if record.get("error"):
+            self._span.set_status(Status(StatusCode.ERROR, str(record["error"])[:500]))
+        self.finish()
+
+    def finish(self):
+        if self._span is None:
+            return
+        otel_context.detach(self._token)
+        self._span.end()
+        self._span = None
+        self._token = None
+
+
+current_step_spans: ContextVar[Optional[StepSpans]] = ContextVar("current_step_spans", default=None)
+
+
+@contextmanager
+def llm_span(model_id: str) -> Iterator[trace.Span]:
+    """Span for one LLM call, inside the current agent step"""
+    steps = current_step_spans.get()
+    if steps is not None:
+        steps.ensure_open()
+    with span("llm.call", **{"llm.model": model_id}) as current:
+        yield current
+
+
+def record_llm_usage(current: trace.Span, usage: Any, started: float, first_token_at: Optional[float] = None):
+    """Attach token counts and, for streamed calls, time to first token"""
+    current.set_attributes(_clean({
+        "llm.input_tokens": usage.input_tokens if usage else None,
+        "llm.output_tokens": usage.output_tokens if usage else None,
+        "llm.time_to_first_token": round(first_token_at - started, 4) if first_token_at else None,
+    }))
+
+
+def _clean(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop None values, which OpenTelemetry rejects as attributes"""
+    return {k: v for k, v in attributes.items() if v is not None}
@@ -0,0 +1,319 @@
+"""
+Cached Webpage Tool
+
+Drop-in replacement for smolagents' VisitWebpageTool that keeps converted
+markdown in a bounded in-memory LRU, with an optional shared disk or Redis
+tier. Stale entries are revalidated with conditional GETs (ETag /
+Last-Modified), and each page is capped in download size and conversion time.
+Responses marked `Cache-Control: no-store` or `private` are never cached.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import httpx
+from smolagents import Tool
+
+logger = logging.getLogger(__name__)
+
+CONVERTER_THREADS = 4
+# Conversions that timed out but still run; past this many, pages are
+# stripped without markdownify so the rest of the pool stays usable
+MAX_ABANDONED_CONVERSIONS = CONVERTER_THREADS // 2
+
+
+class WebpageCache:
+    """Two-tier cache of webpage markdown with conditional revalidation"""
+
+    def __init__(
+        self,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 300.0,
+        max_download_bytes: int = 2 * 1024 * 1024,
+        conversion_timeout: float = 5.0,
+        request_timeout: float = 20.0,
+        disk_dir: Optional[str] = None,
+        redis_url: Optional[str] = None,
+        shared_ttl_seconds: int = 24 * 3600,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_download_bytes = max_download_bytes
+        self.conversion_timeout = conversion_timeout
+        self.shared_ttl_seconds = shared_ttl_seconds
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._stats = {
+            "hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "errors": 0,
+            "truncated_downloads": 0,
+            "conversion_timeouts": 0,
+            "conversions_skipped": 0,
+            "uncacheable": 0,
+            "evictions": 0,
+        }
+
+        self._client = httpx.Client(
+            timeout=request_timeout,
+            follow_redirects=True,
+            headers={"User-Agent": "agent-platform/1.0"},
+        )
+        # Markdown conversion runs off the calling thread so it can be timed out
+        self._converter = ThreadPoolExecutor(max_workers=CONVERTER_THREADS, thread_name_prefix="markdownify")
+        self._abandoned = 0
+
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._redis = None
+        if redis_url:
+            import redis
+
+            self._redis = redis.Redis.from_url(redis_url)
+
+    @classmethod
+    def from_env(cls) -> "WebpageCache":
+        backend = os.getenv("WEBPAGE_CACHE_SHARED_BACKEND", "").lower()
+        return cls(
+            max_memory_bytes=int(os.getenv("WEBPAGE_CACHE_MAX_MEMORY_MB", "64")) * 1024 * 1024,
+            ttl_seconds=float(os.getenv("WEBPAGE_CACHE_TTL_SECONDS", "300")),
+            max_download_bytes=int(os.getenv("WEBPAGE_MAX_DOWNLOAD_KB", "2048")) * 1024,
+            conversion_timeout=float(os.getenv("WEBPAGE_CONVERSION_TIMEOUT_SECONDS", "5")),
+            disk_dir=os.getenv("WEBPAGE_CACHE_DIR") if backend == "disk" else None,
+            redis_url=os.getenv("REDIS_URL") if backend == "redis" else None,
+        )
+
+    def get(self, url: str) -> str:
+        """
+        Get the markdown for a URL, from cache when fresh
+
+        Pages larger than the download cap are truncated, not rejected.
+
+        Raises:
+            httpx.HTTPError: If the page cannot be fetched
+        """
+        entry = self._memory_get(url)
+        if entry is None:
+            entry = self._shared_get(url)
+            if entry is not None:
+                self._count("shared_hits")
+                self._memory_put(url, entry)
+
+        if entry is not None and time.time() - entry["fetched_at"] < self.ttl_seconds:
+            self._count("hits")
+            return entry["markdown"]
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            entry = self._fetch(url, headers, entry)
+        except Exception:
+            self._count("errors")
+            raise
+
+        if entry.pop("uncacheable", False):
+            self._count("uncacheable")
+            return entry["markdown"]
+        self._memory_put(url, entry)
+        self._shared_put(url, entry)
+        return entry["markdown"]
+
+    def _fetch(self, url: str, headers: Dict[str, str], cached: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        with self._client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and cached is not None:
+                self._count("revalidated")
+                return {**cached, "fetched_at": time.time()}
+
+            response.raise_for_status()
+            self._count("misses")
+
+            body = bytearray()
+            for chunk in response.iter_bytes():
+                body.extend(chunk)
+                if len(body) >= self.max_download_bytes:
+                    del body[self.max_download_bytes:]
+                    self._count("truncated_downloads")
+                    break
+
+            encoding = response.encoding or "utf-8"
+            html = body.decode(encoding, errors="replace")
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            directives = {
+                d.strip().split("=", 1)[0].lower()
+                for d in response.headers.get("Cache-Control", "").split(",")
+            }
+
+        return {
+            "markdown": self._convert(html),
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time(),
+            "uncacheable": bool(directives & {"no-store", "private"}),
+        }
+
+    def _convert(self, html: str) -> str:
+        with self._lock:
+            if self._abandoned >= MAX_ABANDONED_CONVERSIONS:
+                self._stats["conversions_skipped"] += 1
+                return _strip_tags(html)
+        future = self._converter.submit(_html_to_markdown, html)
+        try:
+            return future.result(timeout=self.conversion_timeout)
+        except FutureTimeoutError:
+            # The conversion keeps running in the background and holds its
+            # thread until it finishes; fall back to crude tag stripping so
+            # the agent still gets the page text
+            with self._lock:
+                self._stats["conversion_timeouts"] += 1
+                self._abandoned += 1
+            future.add_done_callback(self._release_abandoned)
+            return _strip_tags(html)
+
+    def _release_abandoned(self, future: Any):
+        with self._lock:
+            self._abandoned -= 1
+
+    def _memory_get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def _memory_put(self, url: str, entry: Dict[str, Any]):
+        # Sized by characters, a close enough proxy for memory use
+        size = len(entry["markdown"])
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(url, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous["markdown"])
+            self._entries[url] = entry
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory_bytes -= len(evicted["markdown"])
+                self._stats["evictions"] += 1
+
+    def _shared_key(self, url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _shared_get(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            if self._redis is not None:
+                raw = self._redis.get(f"agent:webpage:{self._shared_key(url)}")
+                return json.loads(raw) if raw else None
+            if self.disk_dir:
+                path = os.path.join(self.disk_dir, f"{self._shared_key(url)}.json")
+                if not os.path.exists(path):
+                    return None
+                with open(path) as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.warning(f"Webpage cache read failed for {url}: {e}")
+        return None
+
+    def _shared_put(self, url: str, entry: Dict[str, Any]):
+        try:
+            if self._redis is not None:
+                self._redis.set(
+                    f"agent:webpage:{self._shared_key(url)}", json.dumps(entry), ex=self.shared_ttl_seconds
+                )
+            elif self.disk_dir:
+                path = os.path.join(self.disk_dir, f"{self._shared_key(url)}.json")
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(entry, f)
+                os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Webpage cache write failed for {url}: {e}")
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "abandoned_conversions": self._abandoned,
+                "max_memory_bytes": self.max_memory_bytes,
+                "shared_backend": "redis" if self._redis is not None else ("disk" if self.disk_dir else None),
+            }
+
+
+def _strip_tags(html: str) -> str:
+    text = re.sub(r"<(script|style)[^>]*>.*?</\1>", "", html, flags=re.S | re.I)
+    text = re.sub(r"<[^>]+>", " ", text)
+    return re.sub(r"\s{3,}", "\n\n", text).strip()
+
+
+def _html_to_markdown(html: str) -> str:
+    from markdownify import markdownify
+
+    markdown_content = markdownify(html).strip()
+    # Remove multiple line breaks
+    return re.sub(r"\n{3,}", "\n\n", markdown_content)
+
+
+class CachedVisitWebpageTool(Tool):
+    """VisitWebpageTool backed by a shared WebpageCache"""
+
+    name = "visit_webpage"
+    description = (
+        "Visits a webpage at the given url and reads its content as a markdown string. Use this to browse webpages."
+    )
+    inputs = {
+        "url": {
+            "type": "string",
+            "description": "The url of the webpage to visit.",
+        }
+    }
+    output_type = "string"
+
+    def __init__(self, cache: WebpageCache, max_output_length: int = 40000):
+        super().__init__()
+        self.cache = cache
+        self.max_output_length = max_output_length
+
+    def forward(self, url: str) -> str:
+        try:
+            content = self.cache.get(url)
+        except httpx.TimeoutException:
+            return "The request timed out. Please try again later or check the URL."
+        except httpx.HTTPError as e:
+            return f"Error fetching the webpage: {str(e)}"
+        except Exception as e:
+            return f"An unexpected error occurred: {str(e)}"
+
+        if len(content) <= self.max_output_length:
+            return content
+        return (
+            content[:self.max_output_length]
+            + f"\n..._This content has been truncated to stay below {self.max_output_length} characters_...\n"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
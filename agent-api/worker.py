@@ -0,0 +1,372 @@
+"""
+Agent Job Worker
+
+Drains the agent job queue and runs queued executions. Runs as a separate
+process (`python worker.py`) next to the API when the Redis queue is used,
+or embedded inside the API process with the in-process queue.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+import signal
+import time
+
+from sqlalchemy import func, update
+
+from agent_executor import AgentExecutor
+from database import AsyncSessionLocal, engine
+from execution_control import TIMED_OUT, CancelSignals, ExecutionCancelled, default_limits
+from job_queue import JobQueue, create_job_queue
+from metrics import QUEUE_WAIT_SECONDS, register_runtime_collector
+from model_registry import ModelRegistry
+from models import AgentExecution
+from process_pool import AgentProcessPool, create_process_pool
+from step_events import StepEventBroker, create_step_event_broker
+from tool_registry import load_plugins, tool_registry
+from trace_store import TraceStore
+from tracing import db_write, execution_span, record_failure, setup_tracing, shutdown_tracing
+from worker_pool import AgentWorkerPool, PoolSaturatedError
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL_SECONDS = 5.0
+RECOVER_INTERVAL_SECONDS = 30.0
+
+
+class JobWorker:
+    """Pulls jobs off the queue and runs them on a worker pool"""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        pool: AgentWorkerPool,
+        models: ModelRegistry,
+        events: Optional[StepEventBroker] = None,
+        traces: Optional[TraceStore] = None,
+        signals: Optional[CancelSignals] = None,
+        processes: Optional[AgentProcessPool] = None
+    ):
+        self.queue = queue
+        self.pool = pool
+        self.models = models
+        self.events = events
+        self.traces = traces or TraceStore()
+        self.signals = signals
+        self.processes = processes
+        # Only take a job off the queue when a pool worker is free, so jobs
+        # stay in the shared queue for other replicas in the meantime
+        self._slots = asyncio.Semaphore(pool.max_workers)
+        self._tasks = set()
+        self._stopping = asyncio.Event()
+
+    async def run(self):
+        """Consume jobs until stop() is called"""
+        logger.info(f"Job worker started ({self.queue.backend} queue, {self.pool.max_workers} slots)")
+        upkeep = asyncio.create_task(self._upkeep())
+        while not self._stopping.is_set():
+            await self._slots.acquire()
+            try:
+                job = await self.queue.dequeue(timeout=2.0)
+            except Exception as e:
+                self._slots.release()
+                logger.error(f"Failed to read from job queue: {e}", exc_info=True)
+                await asyncio.sleep(1.0)
+                continue
+
+            if job is None:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._run_job(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        upkeep.cancel()
+        logger.info("Job worker stopped")
+
+    async def _upkeep(self):
+        """Keep this worker's heartbeat fresh and requeue jobs of workers that died"""
+        recovered_at = 0.0
+        while True:
+            try:
+                await self.queue.heartbeat()
+                if time.monotonic() - recovered_at >= RECOVER_INTERVAL_SECONDS:
+                    recovered_at = time.monotonic()
+                    await self.queue.recover()
+            except Exception as e:
+                logger.error(f"Job queue upkeep failed: {e}", exc_info=True)
+            await asyncio.sleep(HEARTBEAT_INTERVAL_SECONDS)
+
+    def stop(self):
+        self._stopping.set()
+
+    async def _run_job(self, job: Dict[str, Any]):
+        try:
+            with execution_span(job["execution_id"], job["tenant_id"], **{"execution.mode": "async"}):
+                await self._run_traced_job(job)
+        finally:
+            self._slots.release()
+
+    async def _run_traced_job(self, job: Dict[str, Any]):
+        execution_id = job["execution_id"]
+        tenant_id = job["tenant_id"]
+        executor = AgentExecutor(
+            tenant_id=tenant_id,
+            pool=self.pool,
+            models=self.models,
+            events=self.events,
+            traces=self.traces,
+            signals=self.signals,
+            processes=self.processes
+        )
+        logger.info(f"[Tenant: {tenant_id}] Running queued execution {execution_id}")
+        if "enqueued_at" in job:
+            QUEUE_WAIT_SECONDS.labels("jobs").observe(max(0.0, time.time() - job["enqueued_at"]))
+        try:
+            claimed = await update_execution(
+                execution_id,
+                tenant_id,
+                where_status=("queued",),
+                status="running",
+                started_at=datetime.utcnow()
+            )
+        except Exception as e:
+            # Left unacknowledged on purpose: the job is requeued once this
+            # worker stops, and the row is still queued for it
+            logger.error(f"Failed to claim execution {execution_id}: {e}", exc_info=True)
+            return
+        try:
+            await self.queue.ack(job)
+        except Exception as e:
+            # A requeued copy finds the row claimed and is skipped
+            logger.warning(f"Failed to acknowledge job {execution_id}: {e}")
+        if not claimed:
+            logger.info(f"Skipping execution {execution_id}: no longer queued")
+            return
+
+        try:
+            result = await executor.execute(
+                task=job["task"],
+                tools=job.get("tools"),
+                model=job.get("model"),
+                max_steps=job.get("max_steps") or 10,
+                execution_id=execution_id,
+                max_execution_time=job.get("max_execution_time"),
+                max_tokens=job.get("max_tokens")
+            )
+        except PoolSaturatedError as e:
+            # Back-pressure from the shared pool, not a failure of the job
+            logger.warning(f"Worker pool is full; requeueing execution {execution_id} in {e.retry_after}s")
+            await self._requeue(job, e.retry_after)
+        except ExecutionCancelled as e:
+            logger.warning(f"Queued execution {execution_id} stopped: {e}")
+            await finish_execution(executor, self.traces, execution_id, error=e)
+        except Exception as e:
+            logger.error(f"Queued execution {execution_id} failed: {e}", exc_info=True)
+            record_failure(e)
+            await finish_execution(executor, self.traces, execution_id, error=e)
+        else:
+            await finish_execution(
+                executor, self.traces, execution_id, output=result["output"], routing=result.get("routing")
+            )
+
+    async def _requeue(self, job: Dict[str, Any], delay: float):
+        """Hand a claimed job that never started back to the queue after `delay` seconds"""
+        execution_id = job["execution_id"]
+        try:
+            released = await update_execution(
+                execution_id,
+                job["tenant_id"],
+                where_status=("running",),
+                status="queued",
+                started_at=None
+            )
+        except Exception as e:
+            logger.error(f"Failed to release execution {execution_id}: {e}", exc_info=True)
+            return
+        if not released:
+            # Cancelled meanwhile
+            return
+        await asyncio.sleep(delay)
+        try:
+            await self.queue.enqueue({k: v for k, v in job.items() if k != "_receipt"})
+        except Exception as e:
+            logger.error(f"Failed to requeue execution {execution_id}: {e}", exc_info=True)
+            try:
+                await update_execution(
+                    execution_id,
+                    job["tenant_id"],
+                    where_status=("queued",),
+                    status="failed",
+                    error=f"Worker pool was full and the job could not be requeued: {e}",
+                    completed_at=datetime.utcnow()
+                )
+            except Exception as db_error:
+                logger.error(f"Failed to record failure of {execution_id}: {db_error}", exc_info=True)
+
+
+async def update_execution(
+    execution_id: str,
+    tenant_id: str,
+    where_status: Optional[Tuple[str, ...]] = None,
+    **values
+) -> int:
+    """
+    Update an execution record, optionally only while it has one of
+    `where_status`; returns the number of rows changed
+    """
+    query = update(AgentExecution).where(
+        AgentExecution.id == execution_id,
+        AgentExecution.tenant_id == tenant_id
+    )
+    if where_status:
+        query = query.where(AgentExecution.status.in_(where_status))
+    with db_write("update"):
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query.values(**values))
+            await session.commit()
+    return result.rowcount
+
+
+async def finish_execution(
+    executor: AgentExecutor,
+    traces: TraceStore,
+    execution_id: str,
+    output: Optional[str] = None,
+    error: Optional[BaseException] = None,
+    routing: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Record the outcome of a run and publish its terminal event
+
+    Only a row that is still running is updated, so an execution cancelled
+    through the API keeps its cancelled status. Returns the outcome status.
+    The run's routing decisions come from its result, or from the error.
+    """
+    if error is None:
+        values = {"status": "completed", "result": output}
+    elif isinstance(error, ExecutionCancelled):
+        values = {"status": error.status, "error": str(error)}
+    else:
+        values = {"status": "failed", "error": str(error)}
+    routing = routing or getattr(error, "routing", None)
+    if routing:
+        values["routing"] = routing
+        if routing.get("model"):
+            values["model"] = routing["model"]
+
+    try:
+        # Steps are stored one by one as they finish; wait for the last writes
+        await traces.flush(execution_id)
+        await update_execution(
+            execution_id,
+            executor.tenant_id,
+            where_status=("running",),
+            completed_at=datetime.utcnow(),
+            **values
+        )
+    except Exception as db_error:
+        logger.error(f"Failed to record outcome of {execution_id}: {db_error}", exc_info=True)
+        if error is None:
+            raise
+    executor.publish_outcome(execution_id, output=output, error=values.get("error"))
+    return values["status"]
+
+
+async def reap_stale_executions() -> int:
+    """
+    Mark executions left running by a crashed process as timed out
+
+    A run older than MAX_EXECUTION_TIME plus the grace period cannot still be
+    alive anywhere, since its own budget would have stopped it.
+    """
+    max_seconds, _ = default_limits()
+    if not max_seconds:
+        return 0
+    grace = float(os.getenv("EXECUTION_REAP_GRACE_SECONDS", "60"))
+    cutoff = datetime.utcnow() - timedelta(seconds=max_seconds + grace)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(AgentExecution)
+            .where(
+                AgentExecution.status == "running",
+                func.coalesce(AgentExecution.started_at, AgentExecution.created_at) < cutoff
+            )
+            .values(
+                status=TIMED_OUT,
+                error="Execution was abandoned by its worker and exceeded MAX_EXECUTION_TIME",
+                completed_at=datetime.utcnow()
+            )
+        )
+        await session.commit()
+    if result.rowcount:
+        logger.warning(f"Reaped {result.rowcount} stale running executions")
+    return result.rowcount
+
+
+async def reap_periodically(interval: float):
+    """Run reap_stale_executions now and then every `interval` seconds"""
+    while True:
+        try:
+            await reap_stale_executions()
+        except Exception as e:
+            logger.error(f"Failed to reap stale executions: {e}", exc_info=True)
+        await asyncio.sleep(interval)
+
+
+async def main(queue: Optional[JobQueue] = None):
+    setup_tracing()
+    queue = queue or create_job_queue()
+    pool = AgentWorkerPool.from_env()
+    pool.start()
+    processes = create_process_pool(pool.max_workers)
+    if processes:
+        await asyncio.to_thread(processes.start)
+    events = create_step_event_broker()
+    models = ModelRegistry.from_env()
+    await asyncio.to_thread(models.warm_up)
+    load_plugins()
+    await asyncio.to_thread(tool_registry.warm_up)
+    signals = CancelSignals.from_env()
+    traces = TraceStore()
+    worker = JobWorker(queue, pool, models, events, traces, signals, processes)
+    reaper = asyncio.create_task(
+        reap_periodically(float(os.getenv("EXECUTION_REAPER_INTERVAL_SECONDS", "60")))
+    )
+
+    metrics_port = os.getenv("WORKER_METRICS_PORT")
+    if metrics_port:
+        from prometheus_client import start_http_server
+
+        register_runtime_collector(pool, tool_registry)
+        start_http_server(int(metrics_port))
+        logger.info(f"Serving worker metrics on :{metrics_port}")
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        reaper.cancel()
+        pool.shutdown()
+        if processes:
+            await asyncio.to_thread(processes.shutdown)
+        await queue.close()
+        await events.close()
+        await traces.writer.close()
+        signals.close()
+        models.close()
+        shutdown_tracing()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,255 @@
+"""
+Shared Agent Worker Pool
+
+A single, process-wide pool of worker threads that runs agent executions
+off the event loop. Work waits in a bounded queue with per-tenant fair
+(round-robin) scheduling, and submissions are rejected immediately when
+the queue is full instead of piling up latency.
+"""
+
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from metrics import QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the worker pool cannot admit more work"""
+
+    def __init__(self, message: str, status_code: int, retry_after: int = 1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _WorkItem:
+    """A queued unit of work together with its bookkeeping"""
+
+    __slots__ = ("tenant_id", "fn", "args", "kwargs", "context", "future", "enqueued_at")
+
+    def __init__(self, tenant_id: str, fn: Callable[..., Any], args: tuple, kwargs: dict):
+        self.tenant_id = tenant_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.context = contextvars.copy_context()
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class AgentWorkerPool:
+    """Bounded thread pool with admission control and per-tenant fair queueing"""
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        max_queue_size: int = 32,
+        max_queue_per_tenant: Optional[int] = None,
+        wait_sample_size: int = 1000,
+    ):
+        """
+        Args:
+            max_workers: Number of agent executions that may run concurrently
+            max_queue_size: Maximum number of executions waiting for a worker
+            max_queue_per_tenant: Maximum waiting executions for a single tenant
+            wait_sample_size: Number of recent queue wait times kept for stats
+        """
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.max_queue_per_tenant = max_queue_per_tenant or max_queue_size
+
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[_WorkItem]] = {}
+        self._ready: Deque[str] = deque()
+        self._queued = 0
+        self._active = 0
+        self._active_by_tenant: Dict[str, int] = {}
+        self._stopping = False
+        self._threads = []
+
+        self._wait_times: Deque[float] = deque(maxlen=wait_sample_size)
+        self._counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    @classmethod
+    def from_env(cls) -> "AgentWorkerPool":
+        """Build a pool sized from environment variables"""
+        per_tenant = os.getenv("AGENT_POOL_MAX_QUEUE_PER_TENANT")
+        return cls(
+            max_workers=int(os.getenv("AGENT_POOL_MAX_WORKERS", "8")),
+            max_queue_size=int(os.getenv("AGENT_POOL_MAX_QUEUE", "32")),
+            max_queue_per_tenant=int(per_tenant) if per_tenant else None,
+        )
+
+    def start(self):
+        """Start the worker threads"""
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"agent-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(
+            f"Agent worker pool started: workers={self.max_workers}, "
+            f"queue={self.max_queue_size}, per_tenant_queue={self.max_queue_per_tenant}"
+        )
+
+    def submit(self, tenant_id: str, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Queue a call for execution on the pool.
+
+        Raises:
+            PoolSaturatedError: 429 when the tenant's share of the queue is
+                full, 503 when the whole queue is full or the pool is stopping
+        """
+        item = _WorkItem(tenant_id, fn, args, kwargs)
+
+        with self._cond:
+            if self._stopping:
+                raise PoolSaturatedError("Worker pool is shutting down", status_code=503)
+
+            # Only queue when no worker is idle; otherwise the item starts right away
+            must_wait = self._active + self._queued >= self.max_workers
+            tenant_queue = self._queues.get(tenant_id)
+            tenant_depth = len(tenant_queue) if tenant_queue else 0
+
+            if must_wait and tenant_depth >= self.max_queue_per_tenant:
+                self._counters["rejected"] += 1
+                raise PoolSaturatedError(
+                    f"Too many queued executions for tenant {tenant_id}", status_code=429
+                )
+            if must_wait and self._queued >= self.max_queue_size:
+                self._counters["rejected"] += 1
+                raise PoolSaturatedError("Agent worker pool is saturated", status_code=503)
+
+            if tenant_queue is None:
+                tenant_queue = self._queues[tenant_id] = deque()
+                self._ready.append(tenant_id)
+            tenant_queue.append(item)
+            self._queued += 1
+            self._counters["submitted"] += 1
+            self._cond.notify()
+
+        return item.future
+
+    async def run(self, tenant_id: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Submit a call and await its result"""
+        return await asyncio.wrap_future(self.submit(tenant_id, fn, *args, **kwargs))
+
+    def _next_item(self) -> Optional[_WorkItem]:
+        """Pop the next item, rotating between tenants with queued work"""
+        with self._cond:
+            while not self._stopping and self._queued == 0:
+                self._cond.wait()
+            if self._queued == 0:
+                return None
+
+            tenant_id = self._ready.popleft()
+            tenant_queue = self._queues[tenant_id]
+            item = tenant_queue.popleft()
+            if tenant_queue:
+                self._ready.append(tenant_id)
+            else:
+                del self._queues[tenant_id]
+
+            self._queued -= 1
+            self._active += 1
+            self._active_by_tenant[tenant_id] = self._active_by_tenant.get(tenant_id, 0) + 1
+            wait = time.monotonic() - item.enqueued_at
+            self._wait_times.append(wait)
+            QUEUE_WAIT_SECONDS.labels("pool").observe(wait)
+            return item
+
+    def _worker_loop(self):
+        while True:
+            item = self._next_item()
+            if item is None:
+                return
+
+            outcome = "cancelled"
+            try:
+                if item.future.set_running_or_notify_cancel():
+                    try:
+                        result = item.context.run(item.fn, *item.args, **item.kwargs)
+                    except BaseException as e:
+                        item.future.set_exception(e)
+                        outcome = "failed"
+                    else:
+                        item.future.set_result(result)
+                        outcome = "completed"
+            finally:
+                with self._cond:
+                    self._active -= 1
+                    remaining = self._active_by_tenant[item.tenant_id] - 1
+                    if remaining:
+                        self._active_by_tenant[item.tenant_id] = remaining
+                    else:
+                        del self._active_by_tenant[item.tenant_id]
+                    self._counters[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth, worker usage and queue wait times"""
+        with self._cond:
+            waits = sorted(self._wait_times)
+            queued_by_tenant = {tenant: len(q) for tenant, q in self._queues.items()}
+            active_by_tenant = dict(self._active_by_tenant)
+            snapshot = {
+                "max_workers": self.max_workers,
+                "active_workers": self._active,
+                "max_queue_size": self.max_queue_size,
+                "max_queue_per_tenant": self.max_queue_per_tenant,
+                "queue_depth": self._queued,
+                **self._counters,
+            }
+
+        def percentile(p: float) -> Optional[float]:
+            if not waits:
+                return None
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 4)
+
+        snapshot["utilization"] = round(snapshot["active_workers"] / self.max_workers, 3)
+        snapshot["wait_seconds"] = {
+            "samples": len(waits),
+            "avg": round(sum(waits) / len(waits), 4) if waits else None,
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "max": round(waits[-1], 4) if waits else None,
+        }
+        snapshot["tenants"] = {
+            tenant: {
+                "queued": queued_by_tenant.get(tenant, 0),
+                "active": active_by_tenant.get(tenant, 0),
+            }
+            for tenant in set(queued_by_tenant) | set(active_by_tenant)
+        }
+        return snapshot
+
+    def shutdown(self, wait: bool = False):
+        """
+        Stop accepting work and cancel anything still queued.
+
+        Running executions are not interrupted; pass wait=True to block until
+        they finish.
+        """
+        with self._cond:
+            self._stopping = True
+            pending = [item for queue in self._queues.values() for item in queue]
+            self._queues.clear()
+            self._ready.clear()
+            self._queued = 0
+            self._cond.notify_all()
+
+        for item in pending:
+            item.future.cancel()
+        if pending:
+            logger.info(f"Cancelled {len(pending)} queued agent executions")
+
+        if wait:
+            for thread in self._threads:
+                thread.join()